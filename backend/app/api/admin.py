@@ -0,0 +1,173 @@
+from fastapi import APIRouter, HTTPException, Header, Depends
+from app.services.ingestion_cache import ingestion_cache
+from app.services.embedding_cache import embedding_cache, query_embedding_cache
+from app.services.embedding_scheduler import embedding_scheduler
+from app.services.language_detector import language_detector
+from app.services.query_translator import query_translator
+from app.services.conversation_store import conversation_store
+from app.services.response_cache import response_cache
+from app.services.usage_control import usage_control
+from app.services.rate_limiter import rate_limits
+from app.services.lexical_index import lexical_index
+from app.services.reranker import reranker
+from app.services.vector_store import vector_store
+from app.services.tracing import tracer
+from app.utils.startup import startup_profile
+import os
+
+router = APIRouter()
+
+async def require_admin_key(x_admin_key: str | None = Header(default=None)):
+    """Require the X-Admin-Key header when ADMIN_API_KEY is configured."""
+    admin_key = os.getenv("ADMIN_API_KEY")
+    if admin_key and x_admin_key != admin_key:
+        raise HTTPException(
+            status_code=403,
+            detail="Invalid admin key"
+        )
+
+@router.get("/admin/ingestion-cache", dependencies=[Depends(require_admin_key)])
+async def get_ingestion_cache():
+    """Show ingestion cache usage and entries."""
+    return {
+        "stats": ingestion_cache.stats(),
+        "entries": ingestion_cache.list_entries()
+    }
+
+@router.delete("/admin/ingestion-cache/{content_hash}", dependencies=[Depends(require_admin_key)])
+async def delete_ingestion_cache_entry(content_hash: str):
+    """Purge a single ingestion cache entry."""
+    if not ingestion_cache.delete(content_hash):
+        raise HTTPException(
+            status_code=404,
+            detail=f"Cache entry {content_hash} not found"
+        )
+    return {
+        "status": "success",
+        "message": f"Cache entry {content_hash} deleted"
+    }
+
+@router.delete("/admin/ingestion-cache", dependencies=[Depends(require_admin_key)])
+async def purge_ingestion_cache():
+    """Purge all ingestion cache entries."""
+    removed = ingestion_cache.clear()
+    return {
+        "status": "success",
+        "message": f"Removed {removed} cache entries"
+    }
+
+@router.get("/admin/embedding-cache", dependencies=[Depends(require_admin_key)])
+async def get_embedding_cache():
+    """Show embedding cache size and hit rate."""
+    return embedding_cache.stats()
+
+@router.delete("/admin/embedding-cache", dependencies=[Depends(require_admin_key)])
+async def purge_embedding_cache():
+    """Purge all cached embeddings."""
+    removed = embedding_cache.clear()
+    return {
+        "status": "success",
+        "message": f"Removed {removed} cached embeddings"
+    }
+
+@router.get("/admin/embedding-scheduler", dependencies=[Depends(require_admin_key)])
+async def get_embedding_scheduler():
+    """Show embedding request, token and rate-limit counters."""
+    return embedding_scheduler.stats()
+
+@router.get("/admin/query-cache", dependencies=[Depends(require_admin_key)])
+async def get_query_cache():
+    """Show query embedding cache hit rate and embedding latency."""
+    return query_embedding_cache.stats()
+
+@router.delete("/admin/query-cache", dependencies=[Depends(require_admin_key)])
+async def purge_query_cache():
+    """Purge cached query embeddings."""
+    query_embedding_cache.clear()
+    return {
+        "status": "success",
+        "message": "Query embedding cache cleared"
+    }
+
+@router.get("/admin/language-detector", dependencies=[Depends(require_admin_key)])
+async def get_language_detector():
+    """Show language detection cache hit rate and latency."""
+    return language_detector.stats()
+
+@router.get("/admin/translation-cache", dependencies=[Depends(require_admin_key)])
+async def get_translation_cache():
+    """Show query translation cache hit rate and translation latency."""
+    return query_translator.stats()
+
+@router.delete("/admin/translation-cache", dependencies=[Depends(require_admin_key)])
+async def purge_translation_cache():
+    """Purge cached query translations."""
+    query_translator.clear()
+    return {
+        "status": "success",
+        "message": "Query translation cache cleared"
+    }
+
+@router.get("/admin/conversations", dependencies=[Depends(require_admin_key)])
+async def get_conversations():
+    """Show conversation store size, evictions and spill usage."""
+    return conversation_store.stats()
+
+@router.get("/admin/response-cache", dependencies=[Depends(require_admin_key)])
+async def get_response_cache():
+    """Show response cache size and hit rate."""
+    return response_cache.stats()
+
+@router.delete("/admin/response-cache", dependencies=[Depends(require_admin_key)])
+async def purge_response_cache():
+    """Purge cached chat responses."""
+    removed = response_cache.clear()
+    return {
+        "status": "success",
+        "message": f"Removed {removed} cached responses"
+    }
+
+@router.get("/admin/usage", dependencies=[Depends(require_admin_key)])
+async def get_usage(days: int = 31, documents: int = 50, requests: int = 50):
+    """Show token usage and cost per day, per document and for recent requests, and the budget."""
+    return usage_control.stats(days=days, documents=documents, requests=requests)
+
+@router.get("/admin/rate-limits", dependencies=[Depends(require_admin_key)])
+async def get_rate_limits():
+    """Show granted, delayed and rejected requests per rate limiter."""
+    return rate_limits.stats()
+
+@router.get("/admin/lexical-index", dependencies=[Depends(require_admin_key)])
+async def get_lexical_index():
+    """Show keyword index size, search latency and how often it answered without vector search."""
+    return {
+        **lexical_index.stats(),
+        "retrieval_mode": vector_store.retrieval_mode,
+        "lexical_shortcuts": vector_store.lexical_shortcuts
+    }
+
+@router.get("/admin/reranker", dependencies=[Depends(require_admin_key)])
+async def get_reranker():
+    """Show rerank latency, budget overruns and dropped duplicates."""
+    return reranker.stats()
+
+@router.get("/admin/startup", dependencies=[Depends(require_admin_key)])
+async def get_startup(top: int = 25):
+    """Show startup phases, import time per package and module, and service creation times."""
+    return startup_profile.report(top)
+
+@router.get("/admin/traces", dependencies=[Depends(require_admin_key)])
+async def get_traces():
+    """Show latency per stage (p50/p95/max) and the most recent traced requests."""
+    return tracer.stats()
+
+@router.get("/admin/traces/{request_id}", dependencies=[Depends(require_admin_key)])
+async def get_trace(request_id: str):
+    """Show every span of a recent request."""
+    trace = tracer.get_trace(request_id)
+    if trace is None:
+        raise HTTPException(
+            status_code=404,
+            detail="Trace not found"
+        )
+    return trace
@@ -1,34 +1,137 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Header, Request
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
+from pathlib import Path
+from typing import List, Tuple
 from app.services.chat_service import chat_service
+import hashlib
 import json
+import os
+import re
+import uuid
 
 router = APIRouter()
 
+UPLOAD_DIR = Path("app/uploads")
+MAX_CHAT_DOCUMENTS = int(os.getenv("MAX_CHAT_DOCUMENTS", "50"))
+REQUEST_ID_RE = re.compile(r"[\w.-]{1,64}")
+
 class ChatRequest(BaseModel):
     message: str
     filename: str | None
+    filenames: List[str] | None = None  # Chat across several documents
+    filename_pattern: str | None = None  # Glob over uploaded files, e.g. "contract_*.pdf"
+    page_start: int | None = None  # Only use context from these pages (inclusive)
+    page_end: int | None = None
     language: str | None = None
     shouldAllowGeneralChat: bool = False
     context: dict | None = None
+    session_id: str | None = None  # Keeps conversation history apart per client session
+    new_session: bool = False  # Without a session_id: start a new session, returned in X-Session-Id
+
+def resolve_documents(request: ChatRequest) -> List[str] | None:
+    """Expand filenames and filename_pattern into the list of documents to search."""
+    if not request.filenames and not request.filename_pattern:
+        return None
+
+    documents = list(request.filenames or [])
+    if request.filename_pattern:
+        # Only match files directly inside the upload directory
+        if any(part in request.filename_pattern for part in ("/", "\\", "..")):
+            raise HTTPException(
+                status_code=400,
+                detail="filename_pattern must not contain path separators"
+            )
+        documents.extend(sorted(path.name for path in UPLOAD_DIR.glob(request.filename_pattern) if path.suffix == ".pdf"))
+    # Remove duplicates while keeping order
+    documents = list(dict.fromkeys(documents))
+
+    if not documents:
+        raise HTTPException(
+            status_code=404,
+            detail="No documents match the request"
+        )
+    if len(documents) > MAX_CHAT_DOCUMENTS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many documents ({len(documents)}), the limit is {MAX_CHAT_DOCUMENTS}"
+        )
+    return documents
 
-async def generate_stream_response(message: str, filename: str | None, language: str | None = None, context: dict | None = None):
+def resolve_page_range(request: ChatRequest) -> Tuple[int, int] | None:
+    """Turn page_start/page_end into an inclusive page range, open ends allowed."""
+    if request.page_start is None and request.page_end is None:
+        return None
+    page_start = request.page_start if request.page_start is not None else 1
+    page_end = request.page_end if request.page_end is not None else 1_000_000
+    if page_start < 1 or page_end < page_start:
+        raise HTTPException(
+            status_code=400,
+            detail="Invalid page range"
+        )
+    return page_start, page_end
+
+async def generate_stream_response(
+    message: str,
+    filename: str | None,
+    language: str | None = None,
+    context: dict | None = None,
+    filenames: List[str] | None = None,
+    page_range: Tuple[int, int] | None = None,
+    session_id: str | None = None,
+    client_id: str | None = None,
+    request_id: str | None = None
+):
     try:
-        async for chunk in chat_service.stream_chat(message, filename, language, context):
+        async for chunk in chat_service.stream_chat(
+            message, filename, language, context, filenames, page_range, session_id, client_id, request_id
+        ):
             yield f"data: {json.dumps({'chunk': chunk})}\n\n"
     except Exception as e:
         yield f"data: {json.dumps({'error': str(e)})}\n\n"
     yield "data: [DONE]\n\n"
 
+def client_id(http_request: Request, x_api_key: str | None) -> str:
+    """Identify the client for rate limiting: its API key if it sends one, else its address."""
+    if x_api_key:
+        return "key:" + hashlib.sha256(x_api_key.encode("utf-8")).hexdigest()[:16]
+    return "ip:" + (http_request.client.host if http_request.client else "unknown")
+
+def request_id(x_request_id: str | None) -> str:
+    """The caller's X-Request-Id when it is a plain token, else a new id."""
+    if x_request_id and REQUEST_ID_RE.fullmatch(x_request_id):
+        return x_request_id
+    return uuid.uuid4().hex
+
 @router.post("/chat")
-async def chat(request: ChatRequest):
+async def chat(
+    request: ChatRequest,
+    http_request: Request,
+    x_api_key: str | None = Header(default=None),
+    x_request_id: str | None = Header(default=None)
+):
+    # Requests without a session have no history; clients asking for a new
+    # session get an id to send back on later requests
+    session_id = request.session_id
+    if session_id is None and request.new_session:
+        session_id = uuid.uuid4().hex
+    # Names the trace of this request, see /api/admin/traces
+    trace_id = request_id(x_request_id)
+    headers = {"X-Request-Id": trace_id}
+    if session_id is not None:
+        headers["X-Session-Id"] = session_id
     return StreamingResponse(
         generate_stream_response(
             request.message,
             request.filename,
             request.language,
-            request.context
+            request.context,
+            resolve_documents(request),
+            resolve_page_range(request),
+            session_id,
+            client_id(http_request, x_api_key),
+            trace_id
         ),
-        media_type="text/event-stream"
+        media_type="text/event-stream",
+        headers=headers
     ) 
\ No newline at end of file
@@ -0,0 +1,15 @@
+from fastapi import APIRouter, HTTPException
+from app.services.job_queue import job_queue
+
+router = APIRouter()
+
+@router.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Report the stage, progress and errors of an ingestion job."""
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Job {job_id} not found"
+        )
+    return job.to_dict()
@@ -1,8 +1,11 @@
 from fastapi import APIRouter, UploadFile, HTTPException
 from fastapi.responses import JSONResponse, FileResponse
 from pathlib import Path
-from app.services.pdf_processor import pdf_processor
 from app.services.vector_store import vector_store
+from app.services.job_queue import job_queue, QueueFullError
+from app.services.ingestion_cache import ingestion_cache
+from app.services.response_cache import response_cache
+from app.services.usage_control import usage_control
 import logging
 import os
 import traceback
@@ -19,7 +22,10 @@ UPLOAD_DIR.mkdir(exist_ok=True)
 
 @router.post("/upload")
 async def upload_pdf(file: UploadFile):
-    """Handle PDF file upload and processing."""
+    """Save an uploaded PDF and queue it for background processing.
+
+    Returns immediately with a job id; poll ``GET /api/jobs/{job_id}`` for progress.
+    """
     try:
         logger.info(f"Upload started for file: {file.filename}")
 
@@ -43,67 +49,46 @@ async def upload_pdf(file: UploadFile):
             )
 
         file_path = UPLOAD_DIR / file.filename
+        # Written next to the upload and moved into place only once the job is accepted,
+        # so a rejected re-upload leaves the previous version of the file untouched
+        temp_path = UPLOAD_DIR / f".{file.filename}.part"
         
         # Save the file
         try:
-            with open(file_path, "wb") as buffer:
+            with open(temp_path, "wb") as buffer:
                 buffer.write(content)
-            logger.info(f"File saved: {file_path}")
         except Exception as e:
             logger.error(f"Failed to save file {file.filename}: {str(e)}")
+            temp_path.unlink(missing_ok=True)
             raise HTTPException(
                 status_code=500,
                 detail=f"Failed to save file: {str(e)}"
             )
 
+        # Hand extraction, embedding and indexing to the background worker pool
         try:
-            # Process the PDF and get text chunks
-            result = await pdf_processor.process_pdf(file.filename)
-            chunks = result["chunks"]
-            metadata = result["metadata"]
-            summary = result.get("summary", "")
-            
-            logger.info(f"PDF processed: {file.filename} ({len(chunks)} chunks)")
-
-            # Store chunks in vector store with language metadata
-            try:
-                chunk_metadata = result.get("chunk_metadata", [])
-                if not chunk_metadata:
-                    chunk_metadata = [{
-                        "page": i,
-                        "language": result["metadata"].get("language", "en"),
-                        "filename": file.filename
-                    } for i in range(len(chunks))]
-
-                await vector_store.add_texts(
-                    collection_name=file.filename,
-                    texts=chunks,
-                    metadata=chunk_metadata
-                )
-                logger.info(f"Chunks stored for {file.filename} in language: {result['metadata'].get('language', 'en')}")
-            except Exception as e:
-                logger.error(f"Failed to store chunks for {file.filename}: {str(e)}")
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to store text chunks: {str(e)}"
-                )
+            job = job_queue.submit(file.filename, ingestion_cache.hash_content(content))
+        except QueueFullError as e:
+            logger.warning(f"Ingestion queue full, rejecting {file.filename}")
+            temp_path.unlink(missing_ok=True)
+            raise HTTPException(
+                status_code=503,
+                detail=str(e)
+            )
+        # The job only starts at the next await, after the file is in place
+        os.replace(temp_path, file_path)
+        logger.info(f"File saved: {file_path}")
 
-            return {
+        return JSONResponse(
+            status_code=202,
+            content={
                 "filename": file.filename,
-                "status": "success",
-                "message": "File uploaded and processed successfully",
-                "chunks": len(chunks),
-                "metadata": metadata,
-                "summary": summary
+                "job_id": job.job_id,
+                "status": job.status,
+                "message": "File uploaded and queued for processing"
             }
+        )
 
-        except Exception as e:
-            logger.error(f"Failed to process PDF {file.filename}: {str(e)}")
-            raise HTTPException(
-                status_code=500,
-                detail=f"Failed to process PDF: {str(e)}"
-            )
-            
     except HTTPException as e:
         # Re-raise HTTP exceptions
         raise
@@ -150,6 +135,9 @@ async def delete_file(filename: str):
                 detail=f"File {filename} not found"
             )
             
+        # Stop any ingestion still writing chunks of this file before removing them
+        await job_queue.cancel(filename)
+
         # Delete the file
         try:
             file_path.unlink()
@@ -168,6 +156,8 @@ async def delete_file(filename: str):
         except Exception as e:
             logger.warning(f"Failed to delete vector store collection for {filename}: {str(e)}")
             # Don't raise exception here as the file is already deleted
+        response_cache.invalidate_document(filename)
+        usage_control.forget_document(filename)
             
         return {
             "status": "success",
@@ -1,16 +1,29 @@
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Time imports from here on for the startup report
+from app.utils.startup import startup_profile
+startup_profile.install()
+
 # Set up environment before any other imports
 from app.services.env_setup import setup_environment
 setup_environment()
 
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
-from dotenv import load_dotenv
+import asyncio
+import logging
 import os
 
-# Load environment variables from .env file
-load_dotenv()
+from app.utils.lazy import warm_up
+
+logger = logging.getLogger(__name__)
 
 # OpenAI API configuration
 OPENAI_CONFIG = {
@@ -26,8 +39,60 @@ if not os.getenv("OPENAI_API_KEY"):
 
 from app.api.upload import router as upload_router
 from app.api.chat import router as chat_router
+from app.api.jobs import router as jobs_router
+from app.api.admin import router as admin_router
+
+startup_profile.mark("imports")
 
-app = FastAPI(title="PDF Chatbot API")
+# "background": serve right away and create the services (importing chromadb, openai, ...)
+# in a thread, reporting ready when done; "eager": create them before serving;
+# "lazy": create each one on first use
+STARTUP_MODE = os.getenv("STARTUP_MODE", "background")
+
+# Set up static file serving for uploads
+UPLOAD_DIR = Path("app/uploads")
+UPLOAD_DIR.mkdir(exist_ok=True)
+
+async def warm_up_services(app: FastAPI):
+    try:
+        await asyncio.to_thread(warm_up)
+    except Exception as e:
+        logger.error(f"Failed to create services: {str(e)}")
+        raise
+    startup_profile.mark("ready")
+    startup_profile.log_report()
+    app.state.ready = True
+    # Re-index uploads whose vectors are missing
+    if os.getenv("RECONCILE_ON_STARTUP", "true").lower() == "true":
+        from app.services.job_queue import job_queue
+        app.state.reconcile_task = asyncio.create_task(job_queue.reconcile(UPLOAD_DIR))
+    # Documents indexed before keyword search existed get keyword-indexed in the background
+    from app.services.vector_store import vector_store
+    app.state.lexical_backfill_task = asyncio.create_task(vector_store.backfill_lexical_index())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    if STARTUP_MODE == "lazy":
+        startup_profile.mark("ready")
+        startup_profile.log_report()
+        app.state.ready = True
+    elif STARTUP_MODE == "eager":
+        await warm_up_services(app)
+    else:
+        app.state.warm_up_task = asyncio.create_task(warm_up_services(app))
+    yield
+    # Stop OCR worker processes so they don't outlive the server
+    from app.services.ocr_engine import ocr_engine
+    ocr_engine.shutdown()
+    # Keep chat histories across restarts
+    from app.services.conversation_store import conversation_store
+    conversation_store.spill_all()
+    # Write out the traces still waiting for the exporter
+    from app.services.tracing import tracer
+    tracer.shutdown()
+
+app = FastAPI(title="PDF Chatbot API", lifespan=lifespan)
 
 # Configure CORS
 origins = [
@@ -43,15 +108,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Session-Id", "X-Request-Id"],
 )
 
 # Include routers
 app.include_router(upload_router, prefix="/api", tags=["upload"])
 app.include_router(chat_router, prefix="/api", tags=["chat"])
+app.include_router(jobs_router, prefix="/api", tags=["jobs"])
+app.include_router(admin_router, prefix="/api", tags=["admin"])
 
-# Set up static file serving for uploads
-UPLOAD_DIR = Path("app/uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
 app.mount("/uploads", StaticFiles(directory=str(UPLOAD_DIR)), name="uploads")
 
 @app.get("/")
@@ -66,6 +131,13 @@ async def root():
         }
     }
 
+@app.get("/ready")
+async def ready():
+    # Readiness probe: the services are created and the replica can take traffic
+    if not app.state.ready:
+        return JSONResponse(status_code=503, content={"status": "starting"})
+    return {"status": "ready"}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,143 @@
+from typing import Deque, Dict, List, Any, Optional
+from collections import deque
+from datetime import datetime
+import os
+import sys
+import time
+
+import tiktoken
+
+from app.services.language_detector import language_detector
+
+# Token budget for the history kept per conversation
+DEFAULT_MAX_TOKENS = int(os.getenv("CONVERSATION_MAX_TOKENS", "2000"))
+
+_tokenizer = None
+
+def count_tokens(text: str) -> int:
+    global _tokenizer
+    if _tokenizer is None:
+        _tokenizer = tiktoken.get_encoding("cl100k_base")
+    return len(_tokenizer.encode_ordinary(text))
+
+class Message:
+    """A chat message. The token count is computed once; the language only when asked for."""
+
+    __slots__ = ("role", "content", "timestamp", "token_count", "_language")
+
+    def __init__(
+        self,
+        role: str,
+        content: str,
+        timestamp: Optional[float] = None,
+        language: Optional[str] = None,
+        token_count: Optional[int] = None
+    ):
+        self.role = role
+        self.content = content
+        self.timestamp = timestamp if timestamp is not None else time.time()  # Unix time
+        self.token_count = token_count if token_count is not None else count_tokens(content)
+        self._language = language
+
+    @property
+    def language(self) -> str:
+        if self._language is None:
+            self._language = language_detector.detect(self.content)
+        return self._language
+
+    def size_bytes(self) -> int:
+        """Approximate memory held by the message."""
+        return sys.getsizeof(self) + sys.getsizeof(self.content)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "role": self.role,
+            "content": self.content,
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat(),
+            "language": self._language,
+            "token_count": self.token_count
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Message":
+        return cls(
+            data["role"],
+            data["content"],
+            datetime.fromisoformat(data["timestamp"]).timestamp(),
+            data.get("language"),
+            data.get("token_count")
+        )
+
+class Conversation:
+    """Recent messages of a conversation, trimmed oldest first to a token budget and message limit."""
+
+    __slots__ = ("messages", "max_messages", "max_tokens", "total_tokens", "current_language", "language_locked")
+
+    def __init__(self, max_messages: int = 10, max_tokens: int = DEFAULT_MAX_TOKENS):
+        self.messages: Deque[Message] = deque()
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.total_tokens = 0
+        self.current_language = 'en'
+        self.language_locked = False  # Track if language has been set
+
+    def add_message(self, role: str, content: str):
+        message = Message(role, content)
+        self._append(message)
+
+        # Only update language based on user messages
+        if role == 'user':
+            # Keep the current language if detection fails
+            detected_lang = language_detector.detect(content, default=self.current_language)
+            message._language = detected_lang
+            # Only update language if it's different and not locked
+            if not self.language_locked or detected_lang != self.current_language:
+                self.current_language = detected_lang
+                self.language_locked = True  # Lock language after first detection
+
+    def _append(self, message: Message) -> None:
+        self.messages.append(message)
+        self.total_tokens += message.token_count
+        # Maintain conversation history, always keeping the newest message
+        while len(self.messages) > 1 and (len(self.messages) > self.max_messages or self.total_tokens > self.max_tokens):
+            self.total_tokens -= self.messages.popleft().token_count
+
+    def recent(self, max_tokens: int) -> List[Message]:
+        """Newest messages, oldest first, whose token counts fit in ``max_tokens``."""
+        selected = []
+        total = 0
+        for message in reversed(self.messages):
+            if total + message.token_count > max_tokens:
+                break
+            selected.append(message)
+            total += message.token_count
+        selected.reverse()
+        return selected
+
+    def get_context(self, max_tokens: int = 500) -> str:
+        return "\n".join(f"{msg.role}: {msg.content}" for msg in self.recent(max_tokens))
+
+    def size_bytes(self) -> int:
+        """Approximate memory held by the conversation's messages."""
+        return sum(message.size_bytes() for message in self.messages)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "messages": [message.to_dict() for message in self.messages],
+            "max_messages": self.max_messages,
+            "max_tokens": self.max_tokens,
+            "current_language": self.current_language,
+            "language_locked": self.language_locked
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Conversation":
+        conversation = cls(
+            max_messages=data.get("max_messages", 10),
+            max_tokens=data.get("max_tokens", DEFAULT_MAX_TOKENS)
+        )
+        for message in data.get("messages", []):
+            conversation._append(Message.from_dict(message))
+        conversation.current_language = data.get("current_language", 'en')
+        conversation.language_locked = data.get("language_locked", False)
+        return conversation
@@ -1,161 +1,45 @@
-from typing import AsyncGenerator, List, Dict, Any
+from typing import AsyncGenerator, Awaitable, Callable, List, Dict, Any, Optional, Tuple
+import asyncio
+from contextlib import nullcontext
 from .vector_store import vector_store
+from .context_packer import ContextPacker
 import logging
-from datetime import datetime
-import openai
-from openai import AsyncOpenAI
 import os
 import json
-import tiktoken
 import re
-from langdetect import detect, LangDetectException
+from .language_detector import language_detector
+from app.models.conversation import Message, Conversation
+from .conversation_store import conversation_store
+from .query_translator import query_translator
+from .response_cache import response_cache, Scope
+from .usage_control import usage_control
+from .rate_limiter import rate_limits
+from .reranker import reranker
+from .tracing import tracer
 import traceback
+from app.utils.lazy import Lazy
 
 logger = logging.getLogger(__name__)
 
-class Message:
-    def __init__(self, role: str, content: str):
-        self.role = role
-        self.content = content
-        self.timestamp = datetime.now()
-        try:
-            self.language = detect(content) if content.strip() else 'en'
-        except LangDetectException:
-            self.language = 'en'
-
-class Conversation:
-    def __init__(self, max_messages: int = 10):
-        self.messages: List[Message] = []
-        self.max_messages = max_messages
-        self.current_language = 'en'
-        self.language_locked = False  # Track if language has been set
-
-    def add_message(self, role: str, content: str):
-        message = Message(role, content)
-        self.messages.append(message)
-        
-        # Only update language based on user messages
-        if role == 'user':
-            try:
-                detected_lang = detect(content) if content.strip() else self.current_language
-                # Only update language if it's different and not locked
-                if not self.language_locked or detected_lang != self.current_language:
-                    self.current_language = detected_lang
-                    self.language_locked = True  # Lock language after first detection
-            except LangDetectException:
-                # Keep current language if detection fails
-                pass
-
-        # Maintain conversation history
-        if len(self.messages) > self.max_messages:
-            self.messages.pop(0)
-
-    def get_context(self, max_chars: int = 2000) -> str:
-        context = []
-        total_chars = 0
-        for msg in reversed(self.messages):
-            msg_text = f"{msg.role}: {msg.content}"
-            if total_chars + len(msg_text) > max_chars:
-                break
-            context.insert(0, msg_text)
-            total_chars += len(msg_text)
-        return "\n".join(context)
-
-class UsageControl:
-    def __init__(self):
-        # Load configuration from environment
-        self.max_daily_cost = float(os.getenv("MAX_DAILY_COST", "1.0"))
-        self.max_tokens_per_request = int(os.getenv("MAX_TOKENS_PER_REQUEST", "2000"))
-        self.rate_limit_per_min = int(os.getenv("RATE_LIMIT_PER_MIN", "10"))
-        
-        # Initialize counters
-        self.current_daily_cost = 0.0
-        self.last_reset = datetime.now()
-        self.rate_limit_count = 0
-        self.rate_limit_time = datetime.now()
-        
-        # Token usage tracking
-        self.total_prompt_tokens = 0
-        self.total_completion_tokens = 0
-        self.total_embedding_tokens = 0
-        
-        # GPT-3.5 Turbo pricing (per 1K tokens)
-        self.input_price_per_1k = 0.0005
-        self.output_price_per_1k = 0.0015
-        self.embedding_price_per_1k = 0.0001
-        
-        # Initialize tokenizer
-        self.tokenizer = tiktoken.get_encoding("cl100k_base")
-        
-    def count_tokens(self, text: str) -> int:
-        """Count tokens in text using tiktoken."""
-        return len(self.tokenizer.encode(text))
-        
-    def calculate_cost(self, input_tokens: int, output_tokens: int, embedding_tokens: int = 0) -> float:
-        """Calculate cost in USD for token usage."""
-        input_cost = (input_tokens / 1000) * self.input_price_per_1k
-        output_cost = (output_tokens / 1000) * self.output_price_per_1k
-        embedding_cost = (embedding_tokens / 1000) * self.embedding_price_per_1k
-        return input_cost + output_cost + embedding_cost
-        
-    def log_usage(self, prompt_tokens: int = 0, completion_tokens: int = 0, embedding_tokens: int = 0):
-        """Log token usage."""
-        self.total_prompt_tokens += prompt_tokens
-        self.total_completion_tokens += completion_tokens
-        self.total_embedding_tokens += embedding_tokens
-        
-        # Calculate costs
-        cost = self.calculate_cost(prompt_tokens, completion_tokens, embedding_tokens)
-        self.current_daily_cost += cost
-        
-        # Log usage
-        logger.info("token_usage", {
-            "prompt_tokens": prompt_tokens,
-            "completion_tokens": completion_tokens,
-            "embedding_tokens": embedding_tokens,
-            "total_tokens": prompt_tokens + completion_tokens + embedding_tokens,
-            "cost_usd": cost,
-            "total_cost_usd": self.current_daily_cost,
-            "total_prompt_tokens": self.total_prompt_tokens,
-            "total_completion_tokens": self.total_completion_tokens,
-            "total_embedding_tokens": self.total_embedding_tokens
-        })
-
-    def check_rate_limit(self) -> bool:
-        """Check if we're within rate limits."""
-        now = datetime.now()
-        # Reset counter every minute
-        if (now - self.rate_limit_time).seconds >= 60:
-            self.rate_limit_count = 0
-            self.rate_limit_time = now
-        
-        if self.rate_limit_count >= self.rate_limit_per_min:
-            return False
-            
-        self.rate_limit_count += 1
-        return True
-        
-    def check_cost_limit(self, estimated_cost: float) -> bool:
-        """Check if we're within cost limits."""
-        now = datetime.now()
-        # Reset daily counter
-        if (now - self.last_reset).days >= 1:
-            self.current_daily_cost = 0
-            self.last_reset = now
-            
-        if self.current_daily_cost + estimated_cost > self.max_daily_cost:
-            return False
-            
-        self.current_daily_cost += estimated_cost
-        return True
-
 class ChatService:
     def __init__(self):
-        self.conversations: Dict[str, Conversation] = {}
+        from openai import AsyncOpenAI
         self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.usage_control = UsageControl()
-        self.max_context_tokens = 4000  # Maximum tokens for context (leaving room for response)
+        self.usage_control = usage_control  # Import the singleton instance
+        self.rate_limits = rate_limits
+        # Prompt token budget (system prompt, retrieved chunks and history), leaving room for the response
+        self.max_context_tokens = int(os.getenv("CHAT_CONTEXT_TOKENS", "4000"))
+        self.context_packer = ContextPacker(
+            self.usage_control.tokenizer,
+            max_tokens=self.max_context_tokens,
+            max_history_tokens=int(os.getenv("CHAT_HISTORY_TOKENS", "1000"))
+        )
         self.vector_store = vector_store  # Import the singleton instance
+        # How non-English queries are searched: "direct" (multilingual embedding only),
+        # "parallel" (original and translated query concurrently) or "translate" (translated only)
+        self.query_translation_mode = os.getenv("QUERY_TRANSLATION_MODE", "direct")
+        # Extra seconds the parallel mode waits for the translated search
+        self.query_translation_timeout = float(os.getenv("QUERY_TRANSLATION_TIMEOUT", "0.5"))
         self.system_prompt = """You are a helpful multilingual PDF assistant. You will:
         1. Answer questions based on the provided PDF context
         2. Always respond in the same language as the user's question
@@ -166,172 +50,396 @@ class ChatService:
         
         Remember: Stay in the user's chosen language throughout the entire conversation."""
 
-    async def get_relevant_context(self, query: str, filename: str | None = None, query_language: str | None = None) -> str:
-        """Get relevant context for the query from vector store."""
+    async def get_relevant_context(
+        self,
+        query: str,
+        filename: str | None = None,
+        query_language: str | None = None,
+        filenames: List[str] | None = None,
+        page_range: Tuple[int, int] | None = None
+    ) -> str:
+        """Get relevant context for the query from vector store.
+
+        ``filenames`` searches several documents at once; chunks are then
+        labelled with their source file. ``page_range`` limits the search to
+        chunks overlapping an inclusive range of pages.
+        """
+        status, results = await self.search_context(query, filename, query_language, filenames, page_range)
+        if status:
+            return status
+        documents = filenames or [filename]
+        context = "\n\n".join(self.format_chunk(r, len(documents) > 1) for r in results)
+        logger.info(f"Found {len(results)} relevant chunks, total length: {len(context)}")
+        return context
+
+    async def search_context(
+        self,
+        query: str,
+        filename: str | None = None,
+        query_language: str | None = None,
+        filenames: List[str] | None = None,
+        page_range: Tuple[int, int] | None = None
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """Search the documents for chunks relevant to the query.
+
+        Returns ("", results) on success, or a status marker such as
+        "[DOCUMENT_NOT_FOUND]" and no results.
+        """
         try:
-            if not filename:
-                return ""
-
-            logger.info(f"Getting context for query: {query[:50]}... from file: {filename}")
-
-            # Always translate non-English queries to English for search
-            original_language = query_language or detect(query)
-            if original_language != 'en':
-                # Translate query to English for search
-                translation_messages = [
-                    {"role": "system", "content": "Translate the following text to English, keeping the same meaning and intent:"},
-                    {"role": "user", "content": query}
-                ]
-                
-                translation_response = await self.client.chat.completions.create(
-                    model="gpt-3.5-turbo",
-                    messages=translation_messages,
-                    temperature=0.3,
-                )
-                
-                english_query = translation_response.choices[0].message.content.strip()
-                logger.info(f"Translated query from {original_language} to English: {english_query}")
-                query = english_query
+            documents = filenames or ([filename] if filename else [])
+            if not documents:
+                return "", []
 
-            # Get base collection name
-            base_name = vector_store._sanitize_collection_name(filename)
-            
-            # List all collections
-            collections = vector_store.client.list_collections()
-            
-            # Find matching collections
-            matching_collections = [c for c in collections if c.name.startswith(base_name)]
-            
-            if not matching_collections:
-                return f"[DOCUMENT_NOT_FOUND]"
+            logger.info(f"Getting context for query: {query[:50]}... from files: {documents}")
+
+            with tracer.span("language_detection"):
+                original_language = query_language or language_detector.detect(query)
+
+            if not await vector_store.has_any_document(documents):
+                return "[DOCUMENT_NOT_FOUND]", []
             
             try:
-                # Search with English query
-                results = await vector_store.similarity_search(
-                    collection_name=filename,
-                    query=query,
-                    k=5
-                )
+                k = self.context_chunks_per_request(len(documents))
+                # Over-fetch when a rerank stage picks the final k
+                fetch_k = reranker.candidate_count(k)
+
+                async def search(search_query: str) -> List[Dict[str, Any]]:
+                    return await vector_store.similarity_search_documents(
+                        filenames=documents,
+                        query=search_query,
+                        k=fetch_k,
+                        page_range=page_range
+                    )
+
+                if original_language == 'en' or self.query_translation_mode == "direct":
+                    # The embedding model is multilingual, search with the query as written
+                    results = await search(query)
+                elif self.query_translation_mode == "translate":
+                    with tracer.span("translation", language=original_language):
+                        english_query = await query_translator.translate(query, original_language)
+                    results = await search(english_query or query)
+                else:
+                    results = await self._search_with_translation(search, query, original_language, fetch_k)
+                with tracer.span("rerank", candidates=len(results)):
+                    results = await reranker.rerank(query, results, k)
                 
                 if results:
-                    # Join the content of relevant chunks
-                    context = "\n\n".join([r["text"] for r in results])
-                    logger.info(f"Found {len(results)} relevant chunks, total length: {len(context)}")
-                    return context
+                    return "", results
                 else:
                     logger.warning(f"No relevant content found in collections")
-                    return f"[NO_RELEVANT_CONTENT]"
+                    return "[NO_RELEVANT_CONTENT]", []
                     
             except Exception as e:
                 if "Embedding dimension" in str(e):
-                    return f"[REUPLOAD_REQUIRED]"
+                    return "[REUPLOAD_REQUIRED]", []
                 raise
                 
         except Exception as e:
             logger.error(f"Error getting context: {str(e)}")
             logger.error(f"Full traceback: {traceback.format_exc()}")
-            return f"[ERROR]"
+            return "[ERROR]", []
+
+    async def _search_with_translation(
+        self,
+        search: Callable[[str], Awaitable[List[Dict[str, Any]]]],
+        query: str,
+        language: str,
+        k: int
+    ) -> List[Dict[str, Any]]:
+        """Search with the original query and its English translation concurrently.
+
+        The translated search only gets until the original-language search
+        finishes plus query_translation_timeout; after that the original
+        results are used and the translation keeps running to fill the cache.
+        """
+        async def search_translated() -> List[Dict[str, Any]]:
+            with tracer.span("translation", language=language):
+                english_query = await query_translator.translate(query, language)
+            if not english_query or english_query == query:
+                return []
+            return await search(english_query)
+
+        translated_task = asyncio.ensure_future(search_translated())
+        try:
+            results = await search(query)
+            translated = await asyncio.wait_for(translated_task, timeout=self.query_translation_timeout)
+        except asyncio.TimeoutError:
+            logger.info("Translated search not ready, using original-language results")
+            return results
+        finally:
+            translated_task.cancel()
+
+        # Keep the best score per chunk and the global top k
+        merged: Dict[str, Dict[str, Any]] = {}
+        for result in results + translated:
+            key = result.get("id") or result["text"]
+            if key not in merged or result["score"] < merged[key]["score"]:
+                merged[key] = result
+        return sorted(merged.values(), key=lambda r: r["score"])[:k]
+
+    def format_chunk(self, result: Dict[str, Any], with_source: bool) -> str:
+        """Chunk text as sent to the model, labelled with its source when several documents are searched."""
+        if with_source:
+            return f"[Source: {self.format_source(result['metadata'])}]\n{result['text']}"
+        return result["text"]
+
+    @staticmethod
+    def format_source(metadata: Dict[str, Any]) -> str:
+        """Describe where a chunk comes from, e.g. "report.pdf, pages 3-4"."""
+        filename = metadata.get('filename', 'unknown')
+        page_start = metadata.get('page_start')
+        page_end = metadata.get('page_end', page_start)
+        if page_start is None:
+            return filename
+        if page_start == page_end:
+            return f"{filename}, page {page_start}"
+        return f"{filename}, pages {page_start}-{page_end}"
+
+    def context_chunks_per_request(self, document_count: int) -> int:
+        """Number of chunks to retrieve, growing with the number of documents searched."""
+        return min(5 + 2 * (document_count - 1), 20)
 
     async def stream_chat(
         self, 
         message: str, 
         filename: str | None,
         language: str | None = None,
-        context: dict | None = None
+        context: dict | None = None,
+        filenames: List[str] | None = None,
+        page_range: Tuple[int, int] | None = None,
+        session_id: str | None = None,
+        client_id: str | None = None,
+        request_id: str | None = None
     ) -> AsyncGenerator[str, None]:
-        """Stream chat responses with proper language and context handling."""
-        try:
-            # Check rate limits first
-            if not self.usage_control.check_rate_limit():
-                yield "Rate limit exceeded. Please wait before making more requests."
-                return
+        """Stream chat responses with proper language and context handling.
 
-            # Get or create conversation for this file
-            self.conversation = self._get_or_create_conversation(filename)
-            
+        Pass ``filenames`` to chat about several documents in one request and
+        ``page_range`` to only use context from those pages. History is kept
+        per ``session_id`` and set of documents (none without a session id);
+        rate limits apply per ``client_id``. Stage timings are traced under
+        ``request_id``.
+        """
+        documents = filenames or ([filename] if filename else [])
+        with tracer.trace("chat", request_id, documents=len(documents)) as trace:
+            try:
+                # Check rate limits first, waiting briefly for the client's next token
+                with tracer.span("rate_limit.client"):
+                    allowed = await self.rate_limits.chat_clients.acquire(client_id or "anonymous")
+                if not allowed:
+                    trace.set(outcome="rate_limited")
+                    yield "Rate limit exceeded. Please wait before making more requests."
+                    return
+                # Don't spend on retrieval when the budget is already used up
+                if not self.usage_control.within_budget():
+                    trace.set(outcome="over_budget")
+                    yield "Usage limit reached. Please try again later."
+                    return
+
+                # One conversation per session and file or set of files; requests without
+                # a session get no history, so nothing is shared between their clients
+                documents_key = "|".join(sorted(filenames)) if filenames else (filename or "")
+                session_key = f"{session_id}:{documents_key}" if session_id is not None else None
+                with self.usage_control.track("chat", documents):
+                    async for part in self._stream_turn(session_key, message, filename, language, filenames, page_range):
+                        yield part
+
+            except Exception as e:
+                error_msg = f"An error occurred: {str(e)}"
+                trace.set(outcome="error", error=str(e))
+                yield error_msg
+                logger.error(f"Error in stream_chat: {error_msg}")
+
+    async def _stream_turn(
+        self,
+        session_key: str | None,
+        message: str,
+        filename: str | None,
+        language: str | None,
+        filenames: List[str] | None,
+        page_range: Tuple[int, int] | None
+    ) -> AsyncGenerator[str, None]:
+        """Answer one message, in the stored conversation of ``session_key`` if given.
+
+        The session is only locked to read the history and to append the finished
+        exchange, so retrieval and streaming never hold up other requests.
+        """
+        scratch = Conversation() if session_key is None else None
+
+        def session():
+            return conversation_store.session(session_key) if scratch is None else nullcontext(scratch)
+
+        async with session() as conversation:
             # Set language if provided
             if language:
-                self.conversation.current_language = language
-                self.conversation.language_locked = True
+                conversation.current_language = language
+                conversation.language_locked = True
+            first_turn = not conversation.messages
+            current_language = conversation.current_language
+            history = [
+                {"role": msg.role, "content": msg.content, "token_count": msg.token_count}
+                for msg in conversation.messages
+            ]
 
-            # Get relevant context first - await the coroutine
-            context_text = await self.get_relevant_context(message, filename, language)
-            
-            # Add user message and update conversation language
-            self.conversation.add_message("user", message)
-            
-            # Prepare messages for OpenAI
-            messages = []
-            
-            # Add system prompt with stronger language instruction
-            system_prompt = """You are a helpful and friendly multilingual PDF assistant. For this conversation:
-            1. You MUST ALWAYS respond in the user's language
-            2. Keep responses natural, concise, and to the point
-            3. Answer exactly what was asked, don't add unnecessary details
-            4. Use a conversational tone, as if chatting with a friend
-            5. If translating content, focus on the key information rather than word-for-word translation
-            6. Avoid technical jargon unless specifically asked about technical details
-            """
-            
-            if language:
-                system_prompt += f"\nIMPORTANT: The current conversation language is {language}. Respond naturally in {language} as if it's your native language."
-                if language == 'sv':
-                    system_prompt += " Use a friendly, modern Swedish tone - not too formal."
-                    
-            messages.append({"role": "system", "content": system_prompt})
-            
-            # Handle context based on status
-            if context_text == "[DOCUMENT_NOT_FOUND]":
-                error_msg = "Document not found" if language != 'sv' else "Dokumentet kunde inte hittas"
-                messages.append({"role": "system", "content": f"Error: {error_msg}"})
-            elif context_text == "[NO_RELEVANT_CONTENT]":
-                # Instead of returning error, let the model handle the response
-                messages.append({"role": "system", "content": "Note: No specific content found for this query. Please provide a general response."})
-            elif context_text == "[REUPLOAD_REQUIRED]":
-                error_msg = "Please re-upload the document" if language != 'sv' else "Vänligen ladda upp dokumentet igen"
-                messages.append({"role": "system", "content": f"Error: {error_msg}"})
-            elif context_text == "[ERROR]":
-                error_msg = "Error accessing document" if language != 'sv' else "Kunde inte komma åt dokumentet"
-                messages.append({"role": "system", "content": f"Error: {error_msg}"})
-            elif context_text:
-                messages.append({
-                    "role": "system", 
-                    "content": f"Here is relevant information from the document (translate if needed):\n\n{context_text}"
-                })
-
-            # Add conversation history
-            messages.extend([
-                {"role": msg.role, "content": msg.content} 
-                for msg in self.conversation.messages[-5:]  # Last 5 messages
-            ])
-
-            # Stream response from OpenAI
-            stream = await self.client.chat.completions.create(
-                model="gpt-3.5-turbo",
-                messages=messages,
-                stream=True,
-                temperature=0.7,
+        # A repeated opening question about the same documents is answered from the cache
+        documents = filenames or [filename]
+        with tracer.span("response_cache.lookup") as lookup:
+            cache_scope, question_embedding = (None, None)
+            if first_turn:
+                cache_scope, question_embedding = await self._response_cache_scope(
+                    message, documents, language, current_language, page_range
+                )
+            cached = response_cache.get(cache_scope, message, question_embedding) if cache_scope is not None else None
+            lookup.set(cacheable=cache_scope is not None, hit=cached is not None)
+        if cache_scope is not None:
+            if cached is not None:
+                self.usage_control.current().cached = True
+                for part in self._replay(cached):
+                    yield part
+                async with session() as conversation:
+                    conversation.add_message("user", message)
+                    conversation.add_message("assistant", cached)
+                return
+
+        # Get relevant chunks first - they are packed into the prompt below
+        with tracer.span("retrieval") as retrieval:
+            context_status, context_chunks = await self.search_context(message, filename, language, filenames, page_range)
+            retrieval.set(status=context_status or "ok", chunks=len(context_chunks))
+        
+        # Prepare messages for OpenAI
+        messages = []
+        
+        # Add system prompt with stronger language instruction
+        system_prompt = """You are a helpful and friendly multilingual PDF assistant. For this conversation:
+        1. You MUST ALWAYS respond in the user's language
+        2. Keep responses natural, concise, and to the point
+        3. Answer exactly what was asked, don't add unnecessary details
+        4. Use a conversational tone, as if chatting with a friend
+        5. If translating content, focus on the key information rather than word-for-word translation
+        6. Avoid technical jargon unless specifically asked about technical details
+        """
+        
+        if language:
+            system_prompt += f"\nIMPORTANT: The current conversation language is {language}. Respond naturally in {language} as if it's your native language."
+            if language == 'sv':
+                system_prompt += " Use a friendly, modern Swedish tone - not too formal."
+                
+        messages.append({"role": "system", "content": system_prompt})
+        
+        # Handle context based on status
+        if context_status == "[DOCUMENT_NOT_FOUND]":
+            error_msg = "Document not found" if language != 'sv' else "Dokumentet kunde inte hittas"
+            messages.append({"role": "system", "content": f"Error: {error_msg}"})
+        elif context_status == "[NO_RELEVANT_CONTENT]":
+            # Instead of returning error, let the model handle the response
+            messages.append({"role": "system", "content": "Note: No specific content found for this query. Please provide a general response."})
+        elif context_status == "[REUPLOAD_REQUIRED]":
+            error_msg = "Please re-upload the document" if language != 'sv' else "Vänligen ladda upp dokumentet igen"
+            messages.append({"role": "system", "content": f"Error: {error_msg}"})
+        elif context_status == "[ERROR]":
+            error_msg = "Error accessing document" if language != 'sv' else "Kunde inte komma åt dokumentet"
+            messages.append({"role": "system", "content": f"Error: {error_msg}"})
+
+        # Fit chunks and conversation history into the prompt token budget
+        with tracer.span("prompt.assemble") as assemble:
+            packed = self.context_packer.pack(
+                system_messages=messages,
+                history=history + [{"role": "user", "content": message}],
+                chunks=context_chunks,
+                context_header="Here is relevant information from the document (translate if needed):\n\n",
+                format_chunk=lambda result: self.format_chunk(result, len(documents) > 1)
             )
-            
-            async for chunk in stream:
-                if chunk.choices[0].delta.content:
-                    yield chunk.choices[0].delta.content
+            assemble.set(prompt_tokens=packed["prompt_tokens"])
+        messages = packed["messages"]
 
-            # Update usage after successful completion
-            self.usage_control.log_usage()
-            
-        except Exception as e:
-            error_msg = f"An error occurred: {str(e)}"
-            yield error_msg
-            logger.error(f"Error in stream_chat: {error_msg}")
-
-    def _get_or_create_conversation(self, filename: str | None) -> Conversation:
-        """Get or create a conversation for a file."""
-        if not filename:
-            return Conversation()
-        if filename not in self.conversations:
-            self.conversations[filename] = Conversation()
-        return self.conversations[filename]
+        # Reserve the worst-case cost before sending; the actual cost replaces it below
+        reserved_cost = self.usage_control.estimate_chat_cost(packed["prompt_tokens"])
+        if not self.usage_control.check_cost_limit(reserved_cost):
+            yield "Usage limit reached. Please try again later."
+            return
+
+        stream = None
+        completion_parts = []
+        # From here on the reservation is released exactly once, also when the client
+        # disconnects (cancelling this generator) while waiting for quota or streaming
+        try:
+            # Wait for room in the OpenAI quota shared by all clients
+            with tracer.span("rate_limit.upstream"):
+                allowed = await self.rate_limits.acquire_chat(packed["prompt_tokens"] + self.usage_control.max_tokens_per_request)
+            if not allowed:
+                yield "The service is busy. Please try again in a moment."
+                return
+
+            # "first_token" marks the time to first token, the rest of the span is streaming
+            with tracer.span("llm.generate", model="gpt-3.5-turbo") as generate:
+                # Stream response from OpenAI
+                stream = await self.client.chat.completions.create(
+                    model="gpt-3.5-turbo",
+                    messages=messages,
+                    stream=True,
+                    temperature=0.7,
+                    max_tokens=self.usage_control.max_tokens_per_request,
+                )
+
+                async for chunk in stream:
+                    if chunk.choices[0].delta.content:
+                        if not completion_parts:
+                            generate.event("first_token")
+                        completion_parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+                generate.set(chunks=len(completion_parts))
+        finally:
+            # Streamed responses carry no usage, count the deltas received
+            # (also when the client disconnected part way through)
+            self.usage_control.log_usage(
+                prompt_tokens=packed["prompt_tokens"] if stream is not None else 0,
+                completion_tokens=self.usage_control.count_tokens("".join(completion_parts)),
+                reserved_cost=reserved_cost
+            )
+
+        # Keep the exchange so follow-up questions have it. Only questions that were
+        # answered get into the history, so a rejected one is not resent with the next turn.
+        answer = "".join(completion_parts)
+        async with session() as conversation:
+            conversation.add_message("user", message)
+            conversation.add_message("assistant", answer)
+
+        # Only answers grounded in the documents are reused
+        if cache_scope is not None and not context_status and answer:
+            response_cache.put(cache_scope, message, answer, documents, question_embedding)
+
+    async def _response_cache_scope(
+        self,
+        message: str,
+        documents: List[str | None],
+        language: str | None,
+        default_language: str,
+        page_range: Tuple[int, int] | None
+    ) -> Tuple[Optional[Scope], Optional[List[float]]]:
+        """Response cache scope and question embedding for a message, (None, None) if it is not cacheable.
+
+        Only call this for the first question of a conversation; later ones may
+        depend on the earlier exchange. Without a requested ``language`` the
+        message's is detected, falling back to ``default_language``.
+        """
+        if not response_cache.enabled or not all(documents):
+            return None, None
+        answer_language = language or language_detector.detect(message, default=default_language)
+        scope = await response_cache.scope(documents, answer_language, page_range)
+        if scope is None:
+            return None, None
+        embedding = None
+        if response_cache.similarity_threshold > 0:
+            try:
+                # Served from the query embedding cache when the search runs
+                embedding = await vector_store.embed_query(message)
+            except Exception as e:
+                logger.warning(f"Could not embed question for the response cache: {str(e)}")
+        return scope, embedding
+
+    @staticmethod
+    def _replay(answer: str, size: int = 64) -> List[str]:
+        """Split a cached answer into pieces, streamed like a model response."""
+        return [answer[i:i + size] for i in range(0, len(answer), size)]
 
     async def get_general_response(self, query: str) -> AsyncGenerator[str, None]:
         """Handle general questions about the chatbot."""
@@ -359,5 +467,5 @@ class ChatService:
             logger.error(f"Error in general response: {str(e)}")
             yield "I'm a multilingual PDF chatbot. You can chat with me in any language! Upload a PDF file and I'll help you understand its contents."
 
-# Create a singleton instance
-chat_service = ChatService() 
\ No newline at end of file
+# Create a singleton instance on first use, see app.utils.lazy
+chat_service: ChatService = Lazy(ChatService, "chat_service")
@@ -0,0 +1,41 @@
+from typing import Callable, Dict
+import logging
+
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+
+from app.services.embedding_cache import EmbeddingCache
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class CachedEmbeddingFunction(EmbeddingFunction):
+    """Chroma embedding function that consults the embedding cache before calling the model."""
+
+    def __init__(self, embedding_function: Callable[[Documents], Embeddings], model_name: str, cache: EmbeddingCache):
+        self.embedding_function = embedding_function
+        self.model_name = model_name
+        self.cache = cache
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        embeddings = self.cache.get_many(self.model_name, texts)
+
+        # Embed each distinct missing text once, even if it repeats within the batch
+        missing: Dict[str, str] = {}
+        for text, embedding in zip(texts, embeddings):
+            if embedding is None:
+                missing.setdefault(EmbeddingCache.text_hash(text), text)
+
+        if missing:
+            missing_texts = list(missing.values())
+            vectors = [list(v) for v in self.embedding_function(missing_texts)]
+            self.cache.put_many(self.model_name, missing_texts, vectors)
+            computed = dict(zip(missing.keys(), vectors))
+            embeddings = [
+                embedding if embedding is not None else computed[EmbeddingCache.text_hash(text)]
+                for text, embedding in zip(texts, embeddings)
+            ]
+            logger.info(f"Embedding cache: {len(texts) - len(missing_texts)} hits, {len(missing_texts)} embedded")
+
+        return embeddings
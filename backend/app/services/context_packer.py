@@ -0,0 +1,179 @@
+from typing import Dict, List, Any, Optional, Callable, Set, Tuple
+import logging
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Chat format overhead (cl100k_base chat models): per message, and for priming the reply
+TOKENS_PER_MESSAGE = 3
+TOKENS_FOR_REPLY = 3
+
+class ContextPacker:
+    """Assembles the prompt for a chat request within a token budget.
+
+    The system messages and the current question are always included.
+    History is added newest first up to its own cap, then retrieved chunks
+    fill the remaining budget in order of relevance. Chunks overlapping an
+    already packed chunk of the same document are trimmed to their new text
+    or skipped.
+    """
+
+    def __init__(self, tokenizer, max_tokens: int = 4000, max_history_tokens: int = 1000):
+        self.tokenizer = tokenizer
+        self.max_tokens = max_tokens
+        self.max_history_tokens = max_history_tokens
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.tokenizer.encode_ordinary(text))
+
+    def pack(
+        self,
+        system_messages: List[Dict[str, str]],
+        history: List[Dict[str, str]],
+        chunks: List[Dict[str, Any]],
+        context_header: str,
+        format_chunk: Optional[Callable[[Dict[str, Any]], str]] = None
+    ) -> Dict[str, Any]:
+        """Build the message list for the model.
+
+        ``history`` ends with the current user message; entries may carry a
+        precomputed "token_count", which is not sent. ``chunks`` are search
+        results with "text", "metadata" and "similarity". Returns the messages
+        plus the prompt token count and how many chunks and history messages
+        made it in.
+        """
+        used = TOKENS_FOR_REPLY
+        used += sum(TOKENS_PER_MESSAGE + self.count_tokens(m["content"]) for m in system_messages)
+        *earlier, question = history
+        used += TOKENS_PER_MESSAGE + self._message_tokens(question)
+
+        # Newest history first, whole messages only
+        history_budget = min(self.max_history_tokens, max(0, self.max_tokens - used))
+        kept_history: List[Dict[str, str]] = []
+        for message in reversed(earlier):
+            tokens = TOKENS_PER_MESSAGE + self._message_tokens(message)
+            if tokens > history_budget:
+                break
+            kept_history.append({"role": message["role"], "content": message["content"]})
+            history_budget -= tokens
+            used += tokens
+        kept_history.reverse()
+
+        # Most relevant chunks first (in rerank order when reranked) until the budget is spent
+        blocks: List[str] = []
+        packed_spans: Dict[str, List[Tuple[int, int]]] = {}
+        packed_texts: Set[str] = set()
+        dropped = 0
+        header_tokens = TOKENS_PER_MESSAGE + self.count_tokens(context_header)
+        for chunk in sorted(chunks, key=lambda c: c.get("rerank_score", c.get("similarity", 0.0)), reverse=True):
+            chunk = self._without_overlap(chunk, packed_spans, packed_texts)
+            if chunk is None:
+                dropped += 1
+                continue
+            block = format_chunk(chunk) if format_chunk else chunk["text"]
+            tokens = self._chunk_tokens(chunk, block) + 1  # Blank line between chunks
+            cost = tokens + (0 if blocks else header_tokens)
+            if used + cost > self.max_tokens:
+                dropped += 1
+                continue
+            blocks.append(block)
+            used += cost
+            self._record(chunk, packed_spans, packed_texts)
+
+        messages = list(system_messages)
+        if blocks:
+            messages.append({"role": "system", "content": context_header + "\n\n".join(blocks)})
+        messages.extend(kept_history)
+        messages.append({"role": question["role"], "content": question["content"]})
+
+        logger.info(
+            f"Packed prompt: {used} tokens (budget {self.max_tokens}), {len(blocks)} chunks, "
+            f"{dropped} chunks dropped, {len(kept_history)} history messages"
+        )
+        return {
+            "messages": messages,
+            "prompt_tokens": used,
+            "chunks": len(blocks),
+            "dropped_chunks": dropped,
+            "history_messages": len(kept_history)
+        }
+
+    def _message_tokens(self, message: Dict[str, Any]) -> int:
+        token_count = message.get("token_count")
+        return token_count if token_count is not None else self.count_tokens(message["content"])
+
+    def _chunk_tokens(self, chunk: Dict[str, Any], block: str) -> int:
+        """Reuse the chunker's token count when the chunk text is sent unchanged."""
+        token_count = chunk.get("metadata", {}).get("token_count")
+        if token_count and block == chunk["text"]:
+            return token_count
+        if token_count and block.endswith(chunk["text"]):
+            return token_count + self.count_tokens(block[:-len(chunk["text"])])
+        return self.count_tokens(block)
+
+    @staticmethod
+    def _span(chunk: Dict[str, Any]) -> Optional[Tuple[str, int, int]]:
+        metadata = chunk.get("metadata") or {}
+        if metadata.get("char_start") is None or metadata.get("char_end") is None:
+            return None
+        return metadata.get("doc_id") or metadata.get("filename"), metadata["char_start"], metadata["char_end"]
+
+    def _without_overlap(
+        self,
+        chunk: Dict[str, Any],
+        packed_spans: Dict[str, List[Tuple[int, int]]],
+        packed_texts: Set[str]
+    ) -> Optional[Dict[str, Any]]:
+        """Trim the part of a chunk already covered by packed chunks, None if nothing new is left."""
+        span = self._span(chunk)
+        if span is None:
+            # No offsets (indexed before they were recorded), only skip exact repeats
+            return None if chunk["text"].strip() in packed_texts else chunk
+
+        document, start, end = span
+        text = chunk["text"]
+        for packed_start, packed_end in packed_spans.get(document, []):
+            if packed_start <= start and end <= packed_end:
+                return None
+            if packed_end <= start or end <= packed_start:
+                continue
+            # A packed span strictly inside the chunk leaves new text on both sides; keep the larger one
+            if start < packed_start and (end <= packed_end or packed_start - start >= end - packed_end):
+                # Cut before the overlap, at a word boundary
+                cut = packed_start - start
+                while cut > 0 and not text[cut].isspace():
+                    cut -= 1
+                text = text[:cut]
+                end = start + cut
+            else:
+                # Cut after the overlap, at a word boundary
+                cut = packed_end - start
+                while cut < len(text) and not text[cut - 1].isspace():
+                    cut += 1
+                text = text[cut:]
+                start += cut
+        if not text.strip():
+            return None
+        if text == chunk["text"]:
+            return chunk
+        # Keep the recorded span in line with the stripped text
+        stripped = text.strip()
+        start += len(text) - len(text.lstrip())
+        end = start + len(stripped)
+        metadata = dict(chunk["metadata"], char_start=start, char_end=end)
+        metadata.pop("token_count", None)
+        return dict(chunk, text=stripped, metadata=metadata)
+
+    def _record(
+        self,
+        chunk: Dict[str, Any],
+        packed_spans: Dict[str, List[Tuple[int, int]]],
+        packed_texts: Set[str]
+    ) -> None:
+        span = self._span(chunk)
+        if span is None:
+            packed_texts.add(chunk["text"].strip())
+        else:
+            document, start, end = span
+            packed_spans.setdefault(document, []).append((start, end))
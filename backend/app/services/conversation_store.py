@@ -0,0 +1,205 @@
+from typing import Dict, Any, Optional, AsyncIterator
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from pathlib import Path
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+from app.models.conversation import Conversation
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class _Session:
+    __slots__ = ("conversation", "lock", "last_access", "size_bytes", "users")
+
+    def __init__(self, conversation: Conversation):
+        self.conversation = conversation
+        self.lock = asyncio.Lock()
+        self.last_access = time.monotonic()
+        self.size_bytes = 0
+        # Requests holding or waiting for the lock; the session is not evicted while any remain
+        self.users = 0
+
+class ConversationStore:
+    """Conversations keyed by session, bounded in count, idle time and memory.
+
+    Each session has its own lock, so concurrent requests in one session
+    see each other's messages and requests in different sessions never
+    share state. Sessions are evicted least-recently-used first once the
+    session or memory limit is reached, and after being idle for the TTL.
+    With spilling enabled, evicted sessions (and all sessions at shutdown)
+    are written to SQLite and loaded back on their next request.
+    """
+
+    def __init__(self, db_path: Path = Path("app/cache/conversations.db")):
+        self.max_sessions = int(os.getenv("CONVERSATION_MAX_SESSIONS", "1000"))
+        self.idle_ttl_seconds = float(os.getenv("CONVERSATION_IDLE_TTL", "3600"))
+        self.max_bytes = int(float(os.getenv("CONVERSATION_MAX_MB", "64")) * 1024 * 1024)
+        self.spill_enabled = os.getenv("CONVERSATION_SPILL", "true").lower() == "true"
+        # Spilled sessions are dropped after this long without use, and beyond this many
+        self.spill_ttl_seconds = float(os.getenv("CONVERSATION_SPILL_TTL", str(7 * 24 * 3600)))
+        self.max_spilled_sessions = int(os.getenv("CONVERSATION_SPILL_MAX_SESSIONS", "10000"))
+
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._total_bytes = 0
+        self._last_sweep = time.monotonic()
+
+        # Counters
+        self.evicted = 0
+        self.expired = 0
+        self.spilled = 0
+        self.restored = 0
+
+        self._db_lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        if self.spill_enabled:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    session_key TEXT PRIMARY KEY,
+                    updated_at REAL NOT NULL,
+                    payload BLOB NOT NULL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations (updated_at)")
+            self._conn.commit()
+
+    @asynccontextmanager
+    async def session(self, session_key: str) -> AsyncIterator[Conversation]:
+        """Hold a session's lock and yield its conversation, creating or restoring it if needed."""
+        entry = self._sessions.get(session_key)
+        if entry is None:
+            conversation = None
+            if self.spill_enabled:
+                conversation = await asyncio.to_thread(self._load, session_key)
+            # Another request may have created the session while loading
+            entry = self._sessions.get(session_key)
+            if entry is None:
+                entry = _Session(conversation or Conversation())
+                self._sessions[session_key] = entry
+        self._sessions.move_to_end(session_key)
+
+        entry.users += 1
+        try:
+            async with entry.lock:
+                try:
+                    yield entry.conversation
+                finally:
+                    entry.last_access = time.monotonic()
+                    size_bytes = self._estimate_size(entry.conversation)
+                    if self._sessions.get(session_key) is entry:
+                        self._total_bytes += size_bytes - entry.size_bytes
+                    entry.size_bytes = size_bytes
+        finally:
+            entry.users -= 1
+        await self._evict()
+
+    @staticmethod
+    def _estimate_size(conversation: Conversation) -> int:
+        """Approximate memory held by a conversation and its messages."""
+        return sys.getsizeof(conversation) + sys.getsizeof(conversation.messages) + conversation.size_bytes()
+
+    async def _evict(self) -> None:
+        """Drop idle sessions and trim to the session and memory limits, skipping sessions in use."""
+        now = time.monotonic()
+        evict = []
+        if now - self._last_sweep >= 30:
+            self._last_sweep = now
+            evict.extend(
+                key for key, entry in self._sessions.items()
+                if not entry.users and now - entry.last_access > self.idle_ttl_seconds
+            )
+            self.expired += len(evict)
+
+        count = len(self._sessions) - len(evict)
+        total_bytes = self._total_bytes - sum(self._sessions[key].size_bytes for key in evict)
+        if count > self.max_sessions or total_bytes > self.max_bytes:
+            for key, entry in self._sessions.items():
+                if count <= self.max_sessions and total_bytes <= self.max_bytes:
+                    break
+                if key in evict or entry.users:
+                    continue
+                evict.append(key)
+                count -= 1
+                total_bytes -= entry.size_bytes
+                self.evicted += 1
+
+        if not evict:
+            return
+        removed = {key: self._sessions.pop(key) for key in evict}
+        self._total_bytes -= sum(entry.size_bytes for entry in removed.values())
+        if self.spill_enabled:
+            await asyncio.to_thread(self._save_many, {key: entry.conversation for key, entry in removed.items()})
+        logger.info(f"Evicted {len(removed)} conversations, {len(self._sessions)} in memory")
+
+    def _load(self, session_key: str) -> Optional[Conversation]:
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT payload FROM conversations WHERE session_key = ? AND updated_at >= ?",
+                (session_key, time.time() - self.spill_ttl_seconds)
+            ).fetchone()
+        if row is None:
+            return None
+        self.restored += 1
+        return Conversation.from_dict(json.loads(zlib.decompress(row[0])))
+
+    def _save_many(self, conversations: Dict[str, Conversation]) -> None:
+        now = time.time()
+        rows = [
+            (key, now, zlib.compress(json.dumps(conversation.to_dict()).encode("utf-8")))
+            for key, conversation in conversations.items()
+            if conversation.messages
+        ]
+        with self._db_lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO conversations (session_key, updated_at, payload) VALUES (?, ?, ?)",
+                rows
+            )
+            # Keep the spill file bounded: drop stale sessions, then the oldest beyond the cap
+            self._conn.execute("DELETE FROM conversations WHERE updated_at < ?", (now - self.spill_ttl_seconds,))
+            self._conn.execute(
+                """DELETE FROM conversations WHERE session_key IN (
+                       SELECT session_key FROM conversations ORDER BY updated_at DESC LIMIT -1 OFFSET ?
+                   )""",
+                (self.max_spilled_sessions,)
+            )
+            self._conn.commit()
+        self.spilled += len(rows)
+
+    def spill_all(self) -> None:
+        """Write every in-memory session to SQLite, e.g. before shutdown."""
+        if self.spill_enabled and self._sessions:
+            self._save_many({key: entry.conversation for key, entry in self._sessions.items()})
+            logger.info(f"Saved {len(self._sessions)} conversations")
+
+    def stats(self) -> Dict[str, Any]:
+        spilled_sessions = None
+        if self.spill_enabled:
+            with self._db_lock:
+                spilled_sessions = self._conn.execute("SELECT COUNT(*) FROM conversations").fetchone()[0]
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "size_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+            "evicted": self.evicted,
+            "expired": self.expired,
+            "spill_enabled": self.spill_enabled,
+            "spilled": self.spilled,
+            "restored": self.restored,
+            "spilled_sessions": spilled_sessions
+        }
+
+# Create a singleton instance
+conversation_store = ConversationStore()
@@ -0,0 +1,222 @@
+from typing import Dict, List, Any, Optional, Tuple
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by (model name, normalized text hash).
+
+    Vectors are stored as float32 blobs in SQLite. Once the cache grows past
+    its size limit the least recently used vectors are evicted.
+    """
+
+    def __init__(self, db_path: Path = Path("app/cache/embedding_cache.db")):
+        self.db_path = db_path
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = int(float(os.getenv("EMBEDDING_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embedding_cache (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                last_access REAL NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embedding_cache_access ON embedding_cache (last_access)")
+        self._conn.commit()
+        self._total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size_bytes), 0) FROM embedding_cache"
+        ).fetchone()[0]
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        """Hash text after normalizing unicode and whitespace."""
+        normalized = " ".join(unicodedata.normalize("NFC", text).split())
+        return hashlib.sha256(normalized.encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return cached vectors aligned with texts, None where not cached."""
+        hashes = [self.text_hash(text) for text in texts]
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            unique = list(set(hashes))
+            # Stay under SQLite's bound parameter limit
+            for i in range(0, len(unique), 500):
+                batch = unique[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embedding_cache WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                    [model, *batch]
+                ).fetchall()
+                for text_hash, blob in rows:
+                    vector = array('f')
+                    vector.frombytes(blob)
+                    found[text_hash] = vector.tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embedding_cache SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in found]
+                )
+                self._conn.commit()
+
+            results = [found.get(text_hash) for text_hash in hashes]
+            hits = sum(1 for result in results if result is not None)
+            self.hits += hits
+            self.misses += len(results) - hits
+        return results
+
+    def put_many(self, model: str, texts: List[str], vectors: List[List[float]]) -> None:
+        """Store vectors for texts, evicting old entries if over the size limit."""
+        now = time.time()
+        rows = {}
+        for text, vector in zip(texts, vectors):
+            text_hash = self.text_hash(text)
+            blob = array('f', vector).tobytes()
+            rows[text_hash] = (model, text_hash, now, len(blob), blob)
+        if not rows:
+            return
+
+        with self._lock:
+            existing = self._existing_sizes(model, list(rows))
+            self._conn.executemany(
+                """INSERT OR REPLACE INTO embedding_cache (model, text_hash, last_access, size_bytes, vector)
+                   VALUES (?, ?, ?, ?, ?)""",
+                list(rows.values())
+            )
+            self._conn.commit()
+            self._total_bytes += sum(row[3] for row in rows.values()) - sum(existing.values())
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def _existing_sizes(self, model: str, hashes: List[str]) -> Dict[str, int]:
+        sizes = {}
+        for i in range(0, len(hashes), 500):
+            batch = hashes[i:i + 500]
+            sizes.update(self._conn.execute(
+                f"SELECT text_hash, size_bytes FROM embedding_cache WHERE model = ? AND text_hash IN ({','.join('?' * len(batch))})",
+                [model, *batch]
+            ).fetchall())
+        return sizes
+
+    def _evict(self) -> None:
+        """Drop least recently used vectors down to 90% of the limit. Caller holds the lock."""
+        target = int(self.max_bytes * 0.9)
+        rows = self._conn.execute(
+            "SELECT rowid, size_bytes FROM embedding_cache ORDER BY last_access ASC"
+        ).fetchall()
+        evicted = []
+        for rowid, size_bytes in rows:
+            if self._total_bytes <= target:
+                break
+            evicted.append((rowid,))
+            self._total_bytes -= size_bytes
+        self._conn.executemany("DELETE FROM embedding_cache WHERE rowid = ?", evicted)
+        self._conn.commit()
+        logger.info(f"Evicted {len(evicted)} cached embeddings")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embedding_cache").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "entries": entries,
+            "size_bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+    def clear(self) -> int:
+        """Remove all cached vectors and return how many were removed."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM embedding_cache")
+            self._conn.commit()
+            self._total_bytes = 0
+        return cursor.rowcount
+
+class QueryEmbeddingCache:
+    """In-process LRU cache with TTL for query embeddings.
+
+    Keys are (model, normalized query) so repeated and retried questions
+    skip the embedding round-trip. Also tracks embedding latency for misses.
+    """
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("QUERY_CACHE_SIZE", "1000"))
+        self.ttl_seconds = float(os.getenv("QUERY_CACHE_TTL", "3600"))
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, List[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.total_embed_ms = 0.0
+        self.last_embed_ms = 0.0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(unicodedata.normalize("NFC", query).casefold().split())
+
+    def get(self, model: str, query: str) -> Optional[List[float]]:
+        key = (model, self.normalize(query))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, model: str, query: str, embedding: List[float], embed_ms: float) -> None:
+        key = (model, self.normalize(query))
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, embedding)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self.total_embed_ms += embed_ms
+            self.last_embed_ms = embed_ms
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_embed_ms": self.total_embed_ms / self.misses if self.misses else 0.0,
+            "last_embed_ms": self.last_embed_ms
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+# Create singleton instances
+embedding_cache = EmbeddingCache()
+query_embedding_cache = QueryEmbeddingCache()
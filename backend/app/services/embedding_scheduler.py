@@ -0,0 +1,190 @@
+from typing import TYPE_CHECKING, Dict, List, Any, Optional, Callable
+import asyncio
+import logging
+import os
+import random
+import time
+
+import tiktoken
+
+from app.services.rate_limiter import rate_limits
+from app.services.usage_control import usage_control
+from app.utils.lazy import Lazy
+
+if TYPE_CHECKING:
+    import openai
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class EmbeddingScheduler:
+    """Embeds texts as fast as the API quota allows.
+
+    Texts are packed into batches by token count, several batches are sent
+    concurrently within a requests/tokens-per-minute budget, and 429
+    responses trigger a shared cooldown (honouring Retry-After) plus a
+    temporary reduction in concurrency that recovers as requests succeed.
+    """
+
+    def __init__(self, model: str = "text-embedding-3-large"):
+        self.model = model
+        self.max_batch_tokens = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "100000"))
+        self.max_batch_size = int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "512"))
+        self.max_concurrency = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+        self.max_retries = int(os.getenv("EMBEDDING_MAX_RETRIES", "6"))
+        # Retries are handled here, so the client must not retry on its own
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+        self.tokenizer = tiktoken.get_encoding("cl100k_base")
+
+        self._concurrency = self.max_concurrency
+        self._active = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._cooldown_until = 0.0
+        self._successes_since_throttle = 0
+
+        # Counters
+        self.requests = 0
+        self.rate_limited = 0
+        self.total_tokens = 0
+
+    def _get_condition(self) -> asyncio.Condition:
+        # Created lazily so it binds to the running event loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    def pack_batches(self, token_counts: List[int]) -> List[List[int]]:
+        """Group text indices into batches under the token and size limits."""
+        batches: List[List[int]] = []
+        current: List[int] = []
+        current_tokens = 0
+        for i, tokens in enumerate(token_counts):
+            if current and (current_tokens + tokens > self.max_batch_tokens or len(current) >= self.max_batch_size):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(i)
+            current_tokens += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    async def embed(
+        self,
+        texts: List[str],
+        token_counts: Optional[List[int]] = None,
+        progress_callback: Optional[Callable[[float], None]] = None
+    ) -> List[List[float]]:
+        """Embed texts and return vectors in the same order."""
+        if not texts:
+            return []
+        if token_counts is None:
+            token_counts = [len(self.tokenizer.encode(text)) for text in texts]
+
+        batches = self.pack_batches(token_counts)
+        results: List[Optional[List[float]]] = [None] * len(texts)
+        done = 0
+        start = time.perf_counter()
+
+        async def run(batch: List[int]) -> None:
+            nonlocal done
+            vectors = await self._embed_batch([texts[i] for i in batch], sum(token_counts[i] for i in batch))
+            for i, vector in zip(batch, vectors):
+                results[i] = vector
+            done += len(batch)
+            if progress_callback:
+                progress_callback(done / len(texts))
+
+        await asyncio.gather(*(run(batch) for batch in batches))
+        logger.info(
+            f"Embedded {len(texts)} texts ({sum(token_counts)} tokens) in {len(batches)} batches "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+        return results
+
+    async def _embed_batch(self, texts: List[str], tokens: int) -> List[List[float]]:
+        import openai
+        for attempt in range(self.max_retries + 1):
+            await self._enter()
+            try:
+                await self._wait_for_cooldown()
+                # Requests and tokens per minute, shared across workers with the SQLite limiter store
+                await rate_limits.acquire_embedding(tokens)
+                self.requests += 1
+                response = await self.client.embeddings.create(model=self.model, input=texts)
+                used_tokens = response.usage.total_tokens if response.usage else tokens
+                self.total_tokens += used_tokens
+                usage_control.log_embedding(used_tokens)
+                self._on_success()
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except openai.RateLimitError as e:
+                self.rate_limited += 1
+                delay = self._retry_after(e) or min(60.0, 2 ** attempt + random.random())
+                self._on_throttle(delay)
+                logger.warning(f"Embedding request rate limited, retrying in {delay:.1f}s (attempt {attempt + 1})")
+                if attempt == self.max_retries:
+                    raise
+            except (openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError) as e:
+                delay = min(60.0, 2 ** attempt + random.random())
+                logger.warning(f"Embedding request failed ({str(e)}), retrying in {delay:.1f}s (attempt {attempt + 1})")
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(delay)
+            finally:
+                await self._leave()
+        raise RuntimeError("Embedding retries exhausted")
+
+    @staticmethod
+    def _retry_after(error: "openai.RateLimitError") -> Optional[float]:
+        """Read the server's suggested delay from Retry-After headers."""
+        headers = error.response.headers if error.response is not None else {}
+        try:
+            if headers.get("retry-after-ms"):
+                return float(headers["retry-after-ms"]) / 1000
+            if headers.get("retry-after"):
+                return float(headers["retry-after"])
+        except ValueError:
+            pass
+        return None
+
+    async def _enter(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            await condition.wait_for(lambda: self._active < self._concurrency)
+            self._active += 1
+
+    async def _leave(self) -> None:
+        condition = self._get_condition()
+        async with condition:
+            self._active -= 1
+            condition.notify_all()
+
+    async def _wait_for_cooldown(self) -> None:
+        delay = self._cooldown_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _on_throttle(self, delay: float) -> None:
+        # Pause every worker and halve concurrency until requests succeed again
+        self._cooldown_until = max(self._cooldown_until, time.monotonic() + delay)
+        self._concurrency = max(1, self._concurrency // 2)
+        self._successes_since_throttle = 0
+
+    def _on_success(self) -> None:
+        self._successes_since_throttle += 1
+        if self._concurrency < self.max_concurrency and self._successes_since_throttle >= self._concurrency:
+            self._concurrency += 1
+            self._successes_since_throttle = 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "rate_limited": self.rate_limited,
+            "total_tokens": self.total_tokens,
+            "concurrency": self._concurrency,
+            "max_concurrency": self.max_concurrency
+        }
+
+# Create a singleton instance on first use, see app.utils.lazy
+embedding_scheduler: EmbeddingScheduler = Lazy(EmbeddingScheduler, "embedding_scheduler")
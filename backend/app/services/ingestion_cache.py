@@ -0,0 +1,311 @@
+from typing import Dict, List, Any, Optional, Set
+from array import array
+from pathlib import Path
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class IngestionCache:
+    """Content-addressed cache of ingestion results keyed by SHA-256 of the PDF bytes.
+
+    Each entry holds the extracted page text, chunks, chunk metadata and chunk
+    embeddings, so a duplicate upload only needs to be re-indexed. Entries are
+    evicted least-recently-used first once the entry or size limit is reached.
+    Ingestion writes an entry part by part as it goes (see ``writer``); such
+    entries keep their chunks in ``ingestion_cache_parts``.
+    """
+
+    def __init__(self, db_path: Path = Path("app/cache/ingestion_cache.db")):
+        self.db_path = db_path
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = int(os.getenv("INGESTION_CACHE_MAX_ENTRIES", "500"))
+        self.max_bytes = int(float(os.getenv("INGESTION_CACHE_MAX_MB", "1024")) * 1024 * 1024)
+        # Larger documents are not cached, so one document cannot take over the cache
+        self.max_chunks_per_entry = int(os.getenv("INGESTION_CACHE_MAX_CHUNKS", "5000"))
+
+        self._lock = threading.Lock()
+        # Content hashes with a writer in progress
+        self._writing: Set[str] = set()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingestion_cache (
+                content_hash TEXT PRIMARY KEY,
+                filename TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0,
+                chunk_count INTEGER NOT NULL,
+                dimensions INTEGER NOT NULL,
+                size_bytes INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                embeddings BLOB NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS ingestion_cache_parts (
+                content_hash TEXT NOT NULL,
+                part INTEGER NOT NULL,
+                payload BLOB NOT NULL,
+                embeddings BLOB NOT NULL,
+                PRIMARY KEY (content_hash, part)
+            )
+        """)
+        self._conn.commit()
+
+    @staticmethod
+    def hash_content(content: bytes) -> str:
+        """Return the SHA-256 hex digest used as cache key."""
+        return hashlib.sha256(content).hexdigest()
+
+    def get(self, content_hash: str) -> Optional[Dict[str, Any]]:
+        """Return the cached ingestion result for a content hash, or None."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT payload, embeddings, dimensions FROM ingestion_cache WHERE content_hash = ?",
+                (content_hash,)
+            ).fetchone()
+            if row is None:
+                return None
+            payload, embedding_blob, dimensions = row
+            entry = json.loads(zlib.decompress(payload))
+            parts = []
+            if "parts" in entry:
+                parts = self._conn.execute(
+                    "SELECT payload, embeddings FROM ingestion_cache_parts WHERE content_hash = ? ORDER BY part",
+                    (content_hash,)
+                ).fetchall()
+            self._conn.execute(
+                "UPDATE ingestion_cache SET last_access = ?, hits = hits + 1 WHERE content_hash = ?",
+                (time.time(), content_hash)
+            )
+            self._conn.commit()
+
+        vectors = array('f')
+        if "parts" in entry:
+            for key in ("pages", "chunks", "chunk_metadata"):
+                entry[key] = []
+            for part_payload, part_embeddings in parts:
+                part = json.loads(zlib.decompress(part_payload))
+                for key in ("pages", "chunks", "chunk_metadata"):
+                    entry[key].extend(part[key])
+                vectors.frombytes(part_embeddings)
+            del entry["parts"]
+        else:
+            vectors.frombytes(embedding_blob)
+        entry["embeddings"] = [
+            vectors[i:i + dimensions].tolist() for i in range(0, len(vectors), dimensions)
+        ] if dimensions else []
+        return entry
+
+    def writer(self, content_hash: str, filename: str) -> Optional["IngestionCacheWriter"]:
+        """Start writing the entry for a content hash, None if another job is already writing it.
+
+        Any previous entry for the hash is removed; the new one becomes visible
+        once the writer commits.
+        """
+        with self._lock:
+            if content_hash in self._writing:
+                return None
+            self._writing.add(content_hash)
+            self._conn.execute("DELETE FROM ingestion_cache WHERE content_hash = ?", (content_hash,))
+            self._conn.execute("DELETE FROM ingestion_cache_parts WHERE content_hash = ?", (content_hash,))
+            self._conn.commit()
+        return IngestionCacheWriter(self, content_hash, filename)
+
+    def put(
+        self,
+        content_hash: str,
+        filename: str,
+        pages: List[str],
+        chunks: List[str],
+        chunk_metadata: List[Dict[str, Any]],
+        embeddings: List[List[float]],
+        metadata: Dict[str, Any],
+        summary: str = ""
+    ) -> None:
+        """Store a whole ingestion result at once. Only chunks that have an embedding are kept."""
+        writer = self.writer(content_hash, filename)
+        if writer is None:
+            return
+        if writer.add(pages, chunks, chunk_metadata, embeddings):
+            writer.commit(metadata, summary)
+
+    def _write_part(self, content_hash: str, part: int, payload: bytes, embedding_blob: bytes) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO ingestion_cache_parts (content_hash, part, payload, embeddings) VALUES (?, ?, ?, ?)",
+                (content_hash, part, payload, embedding_blob)
+            )
+            self._conn.commit()
+
+    def _commit(self, writer: "IngestionCacheWriter", metadata: Dict[str, Any], summary: str) -> None:
+        payload = zlib.compress(json.dumps({
+            "parts": writer.parts,
+            "metadata": metadata,
+            "summary": summary
+        }, default=str).encode("utf-8"))
+        size_bytes = writer.size_bytes + len(payload)
+
+        now = time.time()
+        with self._lock:
+            self._writing.discard(writer.content_hash)
+            self._conn.execute(
+                """INSERT OR REPLACE INTO ingestion_cache
+                   (content_hash, filename, created_at, last_access, hits, chunk_count, dimensions, size_bytes, payload, embeddings)
+                   VALUES (?, ?, ?, ?, 0, ?, ?, ?, ?, ?)""",
+                (writer.content_hash, writer.filename, now, now, writer.chunk_count, writer.dimensions,
+                 size_bytes, payload, b"")
+            )
+            self._conn.commit()
+            self._evict()
+        logger.info(f"Cached ingestion result for {writer.filename} ({writer.content_hash[:12]}, {size_bytes} bytes)")
+
+    def _discard(self, content_hash: str) -> None:
+        with self._lock:
+            self._writing.discard(content_hash)
+            self._conn.execute("DELETE FROM ingestion_cache_parts WHERE content_hash = ?", (content_hash,))
+            self._conn.commit()
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until within limits. Caller holds the lock."""
+        count, total_bytes = self._conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM ingestion_cache"
+        ).fetchone()
+        if count <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        rows = self._conn.execute(
+            "SELECT content_hash, size_bytes FROM ingestion_cache ORDER BY last_access ASC"
+        ).fetchall()
+        evicted = []
+        for content_hash, size_bytes in rows:
+            if count <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            evicted.append(content_hash)
+            count -= 1
+            total_bytes -= size_bytes
+        self._conn.executemany("DELETE FROM ingestion_cache WHERE content_hash = ?", [(h,) for h in evicted])
+        self._conn.executemany("DELETE FROM ingestion_cache_parts WHERE content_hash = ?", [(h,) for h in evicted])
+        self._conn.commit()
+        logger.info(f"Evicted {len(evicted)} ingestion cache entries")
+
+    def list_entries(self) -> List[Dict[str, Any]]:
+        """List cache entries without their payloads, most recently used first."""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT content_hash, filename, created_at, last_access, hits, chunk_count, size_bytes
+                   FROM ingestion_cache ORDER BY last_access DESC"""
+            ).fetchall()
+        return [{
+            "content_hash": content_hash,
+            "filename": filename,
+            "created_at": created_at,
+            "last_access": last_access,
+            "hits": hits,
+            "chunks": chunk_count,
+            "size_bytes": size_bytes
+        } for content_hash, filename, created_at, last_access, hits, chunk_count, size_bytes in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count, total_bytes, hits = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0), COALESCE(SUM(hits), 0) FROM ingestion_cache"
+            ).fetchone()
+        return {
+            "entries": count,
+            "size_bytes": total_bytes,
+            "hits": hits,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes
+        }
+
+    def delete(self, content_hash: str) -> bool:
+        """Remove one entry. Returns False if it did not exist."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM ingestion_cache WHERE content_hash = ?", (content_hash,))
+            self._conn.execute("DELETE FROM ingestion_cache_parts WHERE content_hash = ?", (content_hash,))
+            self._conn.commit()
+        return cursor.rowcount > 0
+
+    def clear(self) -> int:
+        """Remove all entries and return how many were removed."""
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM ingestion_cache")
+            # Including parts of writes that never committed
+            self._conn.execute("DELETE FROM ingestion_cache_parts")
+            self._conn.commit()
+        return cursor.rowcount
+
+class IngestionCacheWriter:
+    """Writes one ingestion cache entry part by part, e.g. one part per ingestion window.
+
+    Embeddings are stored as float32 as soon as a part is added, so the
+    entry is never held in memory as a whole. Call ``commit`` to make the
+    entry visible, or ``discard`` to drop what was written.
+    """
+
+    def __init__(self, cache: IngestionCache, content_hash: str, filename: str):
+        self.cache = cache
+        self.content_hash = content_hash
+        self.filename = filename
+        self.parts = 0
+        self.chunk_count = 0
+        self.dimensions = 0
+        self.size_bytes = 0
+
+    def add(
+        self,
+        pages: List[str],
+        chunks: List[str],
+        chunk_metadata: List[Dict[str, Any]],
+        embeddings: List[List[float]]
+    ) -> bool:
+        """Write one part; only chunks that have an embedding are kept.
+
+        Returns False, discarding the entry, once it exceeds the cache's chunk limit.
+        """
+        indexed = [i for i, embedding in enumerate(embeddings) if embedding]
+        if self.chunk_count + len(indexed) > self.cache.max_chunks_per_entry:
+            logger.info(f"{self.filename} is too large for the ingestion cache, not caching it")
+            self.discard()
+            return False
+
+        payload = zlib.compress(json.dumps({
+            "pages": pages,
+            "chunks": [chunks[i] for i in indexed],
+            "chunk_metadata": [chunk_metadata[i] for i in indexed]
+        }, default=str).encode("utf-8"))
+        vectors = array('f')
+        for i in indexed:
+            vectors.extend(embeddings[i])
+        embedding_blob = vectors.tobytes()
+        if indexed:
+            self.dimensions = len(embeddings[indexed[0]])
+
+        self.cache._write_part(self.content_hash, self.parts, payload, embedding_blob)
+        self.parts += 1
+        self.chunk_count += len(indexed)
+        self.size_bytes += len(payload) + len(embedding_blob)
+        return True
+
+    def commit(self, metadata: Dict[str, Any], summary: str = "") -> None:
+        """Make the entry visible; an entry without any embedded chunk is dropped instead."""
+        if not self.chunk_count:
+            self.discard()
+            return
+        self.cache._commit(self, metadata, summary)
+
+    def discard(self) -> None:
+        self.cache._discard(self.content_hash)
+
+# Create a singleton instance
+ingestion_cache = IngestionCache()
@@ -0,0 +1,371 @@
+from typing import Dict, Any, Callable, Optional, Set
+from collections import OrderedDict
+from datetime import datetime
+import asyncio
+import logging
+import os
+import time
+import traceback
+import uuid
+from pathlib import Path
+
+from app.services.pdf_processor import pdf_processor
+from app.services.vector_store import vector_store
+from app.services.ingestion_cache import ingestion_cache
+from app.services.response_cache import response_cache
+from app.services.usage_control import usage_control
+from app.services.tracing import tracer
+from app.utils.memory import peak_rss_mb
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Overall progress range (start, end) in percent covered by each stage
+STAGE_RANGES = {
+    "queued": (0.0, 0.0),
+    "extract": (0.0, 25.0),
+    "ocr": (25.0, 45.0),
+    "chunk": (45.0, 50.0),
+    "embed": (50.0, 90.0),
+    "index": (90.0, 100.0),
+    "done": (100.0, 100.0),
+}
+
+ProgressCallback = Callable[[str, float], None]
+
+class QueueFullError(Exception):
+    """Raised when the ingestion queue cannot accept more jobs."""
+    pass
+
+class JobCancelledError(Exception):
+    """Raised inside a job whose file was deleted or replaced by a new upload."""
+    pass
+
+class IngestionJob:
+    def __init__(self, filename: str, content_hash: Optional[str] = None):
+        self.job_id = uuid.uuid4().hex
+        self.filename = filename
+        self.content_hash = content_hash
+        self.status = "queued"  # queued | running | completed | failed | cancelled
+        self.stage = "queued"
+        self.progress = 0.0
+        self.error: Optional[str] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        # Set when the file is deleted or re-uploaded; the job stops before its next write
+        self.cancel_requested = False
+
+    def check_cancelled(self) -> None:
+        if self.cancel_requested:
+            raise JobCancelledError(f"Ingestion of {self.filename} was cancelled")
+
+    def update(self, stage: str, fraction: float = 0.0) -> None:
+        """Move the job to a stage and record progress within that stage (0-1)."""
+        start, end = STAGE_RANGES.get(stage, (self.progress, self.progress))
+        fraction = min(max(fraction, 0.0), 1.0)
+        self.stage = stage
+        # Never report progress going backwards (e.g. when OCR is skipped)
+        self.progress = max(self.progress, start + (end - start) * fraction)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "failed", "cancelled")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "filename": self.filename,
+            "content_hash": self.content_hash,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 1),
+            "error": self.error,
+            "result": self.result,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+class JobQueue:
+    def __init__(self):
+        # Number of ingestion jobs allowed to run at the same time
+        self.max_concurrent_jobs = int(os.getenv("MAX_CONCURRENT_JOBS", "2"))
+        # Number of jobs allowed to wait for a free worker
+        self.max_queued_jobs = int(os.getenv("MAX_QUEUED_JOBS", "50"))
+        # Number of finished jobs kept around for status polling
+        self.max_finished_jobs = int(os.getenv("MAX_FINISHED_JOBS", "200"))
+
+        self.jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._tasks: set = set()
+        # Unfinished jobs per filename by task: the latest one plus any superseded ones still stopping
+        self._active: Dict[str, Dict[asyncio.Task, IngestionJob]] = {}
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrent_jobs)
+        return self._semaphore
+
+    def pending_count(self) -> int:
+        return sum(1 for job in self.jobs.values() if job.status == "queued")
+
+    def submit(self, filename: str, content_hash: Optional[str] = None, enforce_limit: bool = True) -> IngestionJob:
+        """Create an ingestion job for an uploaded file and schedule it.
+
+        ``content_hash`` is the SHA-256 of the file bytes; when given, a
+        previous ingestion of the same bytes is reused from the cache.
+        """
+        if enforce_limit and self.pending_count() >= self.max_queued_jobs:
+            raise QueueFullError(f"Ingestion queue is full ({self.max_queued_jobs} jobs waiting)")
+
+        job = IngestionJob(filename, content_hash)
+        self.jobs[job.job_id] = job
+        self._prune_finished()
+
+        # A new upload of the same file supersedes the jobs still working on the old one;
+        # this job starts once they have stopped, so they never write the same chunks
+        active = self._active.setdefault(filename, {})
+        previous = set(active)
+        for old_task, old_job in active.items():
+            self._stop(old_job, old_task)
+            logger.info(f"Ingestion job {old_job.job_id} for {filename} superseded by {job.job_id}")
+
+        task = asyncio.create_task(self._run(job, previous))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        active[task] = job
+        task.add_done_callback(lambda _: self._forget(filename, task, job))
+
+        logger.info(f"Ingestion job {job.job_id} queued for {filename}")
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        return self.jobs.get(job_id)
+
+    def _forget(self, filename: str, task: asyncio.Task, job: IngestionJob) -> None:
+        if job.status == "queued":
+            # Cancelled before its coroutine ever ran
+            self._mark_cancelled(job)
+        active = self._active.get(filename, {})
+        active.pop(task, None)
+        if not active:
+            self._active.pop(filename, None)
+
+    @staticmethod
+    def _stop(job: IngestionJob, task: asyncio.Task) -> None:
+        """Ask a job to stop; one still waiting for a worker is cancelled right away."""
+        job.cancel_requested = True
+        if job.status == "queued":
+            task.cancel()
+
+    @staticmethod
+    def _mark_cancelled(job: IngestionJob) -> None:
+        job.status = "cancelled"
+        job.error = f"Ingestion of {job.filename} was cancelled"
+        job.finished_at = datetime.now()
+        logger.info(f"Ingestion job {job.job_id} cancelled for {job.filename}")
+
+    async def cancel(self, filename: str) -> None:
+        """Stop the jobs working on a file (if any) and wait until they have stopped writing."""
+        active = self._active.get(filename)
+        if not active:
+            return
+        for task, job in active.items():
+            self._stop(job, task)
+        # Unlike gather, asyncio.wait leaves the jobs alone if this request is cancelled itself
+        await asyncio.wait(set(active))
+
+    async def reconcile(self, upload_dir: Path) -> Dict[str, Any]:
+        """Bring the index in line with the upload directory after a restart.
+
+        Files without indexed chunks are queued for ingestion (reusing the
+        ingestion cache where possible) and chunks of deleted files are removed.
+        """
+        try:
+            uploaded = {path.name for path in upload_dir.glob("*.pdf")}
+            indexed = await vector_store.list_documents()
+            missing = sorted(uploaded - indexed)
+            orphaned = sorted(indexed - uploaded)
+            logger.info(f"Index reconciliation: {len(uploaded)} uploads, {len(indexed)} indexed, "
+                        f"{len(missing)} missing, {len(orphaned)} orphaned")
+
+            for filename in orphaned:
+                await vector_store.delete_collection(filename)
+                logger.info(f"Removed orphaned chunks for {filename}")
+
+            for filename in missing:
+                content = await asyncio.to_thread((upload_dir / filename).read_bytes)
+                # Startup backlog may exceed the queue limit meant for user uploads
+                self.submit(filename, ingestion_cache.hash_content(content), enforce_limit=False)
+
+            return {"missing": missing, "orphaned": orphaned}
+        except Exception as e:
+            logger.error(f"Index reconciliation failed: {str(e)}")
+            logger.error(f"Full traceback: {traceback.format_exc()}")
+            return {"missing": [], "orphaned": [], "error": str(e)}
+
+    def _prune_finished(self) -> None:
+        """Drop the oldest finished jobs once the retention limit is reached."""
+        finished = [job_id for job_id, job in self.jobs.items() if job.is_finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self.jobs[job_id]
+
+    async def _run(self, job: IngestionJob, previous: Set[asyncio.Task]) -> None:
+        try:
+            if previous:
+                # Wait for the superseded jobs to stop, without holding a worker slot
+                await asyncio.wait(previous)
+            job.check_cancelled()
+            await self._run_with_worker(job)
+        except (JobCancelledError, asyncio.CancelledError):
+            # Cancelled while queued (see _stop): never took a worker slot or wrote anything.
+            # Jobs superseding this one wait for the same earlier jobs themselves.
+            self._mark_cancelled(job)
+
+    async def _run_with_worker(self, job: IngestionJob) -> None:
+        async with self._get_semaphore():
+            job.status = "running"
+            job.started_at = datetime.now()
+            logger.info(f"Ingestion job {job.job_id} started for {job.filename}")
+            try:
+                job.check_cancelled()
+                # Traced and accounted under the job id
+                with tracer.trace("ingest", job.job_id, filename=job.filename), usage_control.track("ingest", [job.filename]):
+                    job.result = await self._ingest(job.filename, job.content_hash, job.update, job.check_cancelled)
+                job.update("done", 1.0)
+                job.status = "completed"
+                logger.info(f"Ingestion job {job.job_id} completed for {job.filename}")
+            except JobCancelledError as e:
+                job.status = "cancelled"
+                job.error = str(e)
+                logger.info(f"Ingestion job {job.job_id} cancelled for {job.filename}")
+            except Exception as e:
+                job.status = "failed"
+                job.error = str(e)
+                logger.error(f"Ingestion job {job.job_id} failed for {job.filename}: {str(e)}")
+                logger.error(f"Full traceback: {traceback.format_exc()}")
+            finally:
+                job.finished_at = datetime.now()
+                # Answers from the previous index of this file are stale
+                response_cache.invalidate_document(job.filename)
+
+    async def _ingest(
+        self,
+        filename: str,
+        content_hash: Optional[str],
+        progress: ProgressCallback,
+        check_cancelled: Callable[[], None]
+    ) -> Dict[str, Any]:
+        """Extract, chunk, embed and index a PDF that is already in the upload directory.
+
+        ``check_cancelled`` raises JobCancelledError once the job is cancelled;
+        it is called before every write to the index.
+        """
+        if content_hash:
+            cached = await asyncio.to_thread(ingestion_cache.get, content_hash)
+            if cached is not None:
+                check_cancelled()
+                return await self._ingest_cached(filename, cached, progress)
+
+        start = time.perf_counter()
+        time_to_first_chunk: Optional[float] = None
+        indexed_chunks = 0
+        # Each window is written to the ingestion cache as it is indexed, so memory stays flat;
+        # None when not caching (no hash, another job caching the same bytes, or too large)
+        cache_writer = await asyncio.to_thread(ingestion_cache.writer, content_hash, filename) if content_hash else None
+
+        async def index_window(window: Dict[str, Any]) -> None:
+            nonlocal time_to_first_chunk, indexed_chunks, cache_writer
+            chunks = window["chunks"]
+            check_cancelled()
+            if chunks:
+                embeddings = await vector_store.add_texts(
+                    collection_name=filename,
+                    texts=chunks,
+                    metadata=window["chunk_metadata"],
+                    replace=indexed_chunks == 0,
+                    start_index=indexed_chunks
+                )
+                if time_to_first_chunk is None:
+                    time_to_first_chunk = time.perf_counter() - start
+                    logger.info(f"First chunks of {filename} searchable after {time_to_first_chunk:.2f}s")
+                indexed_chunks += len(chunks)
+            else:
+                embeddings = []
+
+            if cache_writer is not None:
+                try:
+                    cached = await asyncio.to_thread(
+                        cache_writer.add, [text for _, text in window["pages"]], chunks, window["chunk_metadata"], embeddings
+                    )
+                except Exception as e:
+                    # Caching is an optimization, ingestion carries on without it
+                    logger.warning(f"Failed to cache ingestion result for {filename}: {str(e)}")
+                    cache_writer.discard()
+                    cached = False
+                if not cached:
+                    cache_writer = None
+
+            progress("embed", window["pages_done"] / window["total_pages"])
+
+        try:
+            result = await pdf_processor.process_pdf_streaming(filename, index_window, progress_callback=progress)
+        except BaseException:
+            if cache_writer is not None:
+                await asyncio.to_thread(cache_writer.discard)
+            raise
+        metadata = result["metadata"]
+        logger.info(f"Chunks stored for {filename} ({indexed_chunks} chunks) in language: {metadata.get('language', 'en')}")
+
+        if cache_writer is not None:
+            try:
+                await asyncio.to_thread(cache_writer.commit, metadata, result.get("summary", ""))
+            except Exception as e:
+                # Caching is an optimization, the upload itself succeeded
+                logger.warning(f"Failed to cache ingestion result for {filename}: {str(e)}")
+                cache_writer.discard()
+
+        metrics = {
+            "time_to_first_chunk_s": round(time_to_first_chunk, 3) if time_to_first_chunk is not None else None,
+            "total_s": round(time.perf_counter() - start, 3),
+            "peak_rss_mb": peak_rss_mb()
+        }
+        logger.info(f"Ingestion metrics for {filename}: {metrics}")
+
+        return {
+            "chunks": indexed_chunks,
+            "metadata": metadata,
+            "summary": result.get("summary", ""),
+            "cached": False,
+            "metrics": metrics
+        }
+
+    async def _ingest_cached(self, filename: str, cached: Dict[str, Any], progress: ProgressCallback) -> Dict[str, Any]:
+        """Index a cached ingestion result under a (possibly new) filename without re-embedding."""
+        logger.info(f"Ingestion cache hit for {filename}, skipping extraction and embedding")
+        chunks = cached["chunks"]
+        metadata = dict(cached["metadata"])
+        chunk_metadata = [dict(m, filename=filename) for m in cached["chunk_metadata"]]
+
+        progress("embed", 1.0)
+        await vector_store.add_texts(
+            collection_name=filename,
+            texts=chunks,
+            metadata=chunk_metadata,
+            progress_callback=progress,
+            embeddings=cached["embeddings"]
+        )
+
+        return {
+            "chunks": len(chunks),
+            "metadata": metadata,
+            "summary": cached.get("summary", ""),
+            "cached": True
+        }
+
+# Create a singleton instance
+job_queue = JobQueue()
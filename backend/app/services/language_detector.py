@@ -0,0 +1,194 @@
+from typing import Dict, List, Any, Optional, Tuple
+from collections import OrderedDict
+import hashlib
+import logging
+import os
+import threading
+import time
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# (first code point, last code point, script) for scripts that identify a language
+# on their own or narrow it down to a few candidates
+SCRIPT_RANGES: List[Tuple[int, int, str]] = [
+    (0x0370, 0x03FF, "greek"),
+    (0x0400, 0x052F, "cyrillic"),
+    (0x0530, 0x058F, "armenian"),
+    (0x0590, 0x05FF, "hebrew"),
+    (0x0600, 0x06FF, "arabic"),
+    (0x0750, 0x077F, "arabic"),
+    (0x0900, 0x097F, "devanagari"),
+    (0x0980, 0x09FF, "bengali"),
+    (0x0A00, 0x0A7F, "gurmukhi"),
+    (0x0A80, 0x0AFF, "gujarati"),
+    (0x0B80, 0x0BFF, "tamil"),
+    (0x0C00, 0x0C7F, "telugu"),
+    (0x0C80, 0x0CFF, "kannada"),
+    (0x0D00, 0x0D7F, "malayalam"),
+    (0x0E00, 0x0E7F, "thai"),
+    (0x10A0, 0x10FF, "georgian"),
+    (0x1100, 0x11FF, "hangul"),
+    (0x3040, 0x30FF, "kana"),
+    (0x3130, 0x318F, "hangul"),
+    (0x3400, 0x4DBF, "han"),
+    (0x4E00, 0x9FFF, "han"),
+    (0xAC00, 0xD7AF, "hangul"),
+    (0xFB50, 0xFDFF, "arabic"),
+    (0xFE70, 0xFEFF, "arabic"),
+]
+
+SCRIPT_LANGUAGES = {
+    "greek": "el",
+    "armenian": "hy",
+    "hebrew": "he",
+    "devanagari": "hi",
+    "bengali": "bn",
+    "gurmukhi": "pa",
+    "gujarati": "gu",
+    "tamil": "ta",
+    "telugu": "te",
+    "kannada": "kn",
+    "malayalam": "ml",
+    "thai": "th",
+    "georgian": "ka",
+    "hangul": "ko",
+}
+
+# Letters that only occur in one language using the script, checked in order
+CYRILLIC_MARKERS = [("іїєґ", "uk"), ("ў", "be"), ("ѓќѕ", "mk"), ("ђћ", "sr"), ("ыэ", "ru")]
+ARABIC_MARKERS = [("ٹڈڑںےۓ", "ur"), ("پچژگکی", "fa")]
+
+class LanguageDetector:
+    """Identifies the language of a text, once per distinct text.
+
+    Texts in a script used by a single language (Greek, Hangul, Thai, ...)
+    or with letters unique to one language (Ukrainian і, Persian پ, ...)
+    are identified from their characters alone. Everything else goes to
+    langdetect with a fixed seed, so results are deterministic. Results are
+    cached by text hash and detection latency is tracked.
+    """
+
+    def __init__(self):
+        self.max_entries = int(os.getenv("LANGUAGE_CACHE_SIZE", "4096"))
+        # Characters looked at; more rarely changes the answer
+        self.max_chars = int(os.getenv("LANGUAGE_DETECT_MAX_CHARS", "2000"))
+        # Language per text hash, "" when the text could not be identified
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Counters
+        self.calls = 0
+        self.cache_hits = 0
+        self.script_hits = 0
+        self.model_calls = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+
+    def detect(self, text: str, default: str = 'en', max_chars: Optional[int] = None) -> str:
+        """Return the language code of ``text``, or ``default`` if it cannot be identified."""
+        sample = (text or "")[:max_chars or self.max_chars].strip()
+        if not sample:
+            return default
+
+        key = hashlib.sha1(sample.encode("utf-8", "surrogatepass")).hexdigest()
+        with self._lock:
+            self.calls += 1
+            language = self._cache.get(key)
+            if language is not None:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return language or default
+
+        start = time.perf_counter()
+        language = self._detect_script(sample)
+        if language is not None:
+            self.script_hits += 1
+        else:
+            self.model_calls += 1
+            language = self._detect_model(sample)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        with self._lock:
+            self.total_ms += elapsed_ms
+            self.last_ms = elapsed_ms
+            self._cache[key] = language or ""
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return language or default
+
+    def _detect_script(self, sample: str) -> Optional[str]:
+        """Identify the language from its script when that is unambiguous."""
+        counts: Dict[str, int] = {}
+        letters = 0
+        for char in sample:
+            if not char.isalpha():
+                continue
+            letters += 1
+            code_point = ord(char)
+            if code_point < 0x0370:
+                continue  # Latin
+            for first, last, script in SCRIPT_RANGES:
+                if first <= code_point <= last:
+                    counts[script] = counts.get(script, 0) + 1
+                    break
+        if not letters or not counts:
+            return None
+
+        # Japanese mixes kana with Han characters
+        if counts.get("kana", 0) >= letters * 0.05:
+            return "ja"
+        script, count = max(counts.items(), key=lambda item: item[1])
+        if count < letters * 0.6:
+            return None
+        if script == "han":
+            return "zh"
+        if script == "cyrillic":
+            return self._match_markers(sample, CYRILLIC_MARKERS)
+        if script == "arabic":
+            return self._match_markers(sample, ARABIC_MARKERS) or "ar"
+        return SCRIPT_LANGUAGES.get(script)
+
+    @staticmethod
+    def _match_markers(sample: str, markers: List[Tuple[str, str]]) -> Optional[str]:
+        lowered = sample.lower()
+        for letters, language in markers:
+            if any(letter in lowered for letter in letters):
+                return language
+        return None
+
+    @staticmethod
+    def _detect_model(sample: str) -> Optional[str]:
+        # Imported on first use, like the other heavy dependencies
+        from langdetect import DetectorFactory, detect_langs
+        from langdetect.lang_detect_exception import LangDetectException
+        # langdetect samples randomly; a fixed seed makes results repeatable
+        DetectorFactory.seed = 0
+        try:
+            language = detect_langs(sample)[0].lang
+        except LangDetectException:
+            return None
+        # langdetect splits Chinese into zh-cn and zh-tw
+        return "zh" if language.startswith("zh") else language
+
+    def stats(self) -> Dict[str, Any]:
+        detections = self.script_hits + self.model_calls
+        return {
+            "entries": len(self._cache),
+            "max_entries": self.max_entries,
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "script_hits": self.script_hits,
+            "model_calls": self.model_calls,
+            "hit_rate": self.cache_hits / self.calls if self.calls else 0.0,
+            "avg_detect_ms": self.total_ms / detections if detections else 0.0,
+            "last_detect_ms": self.last_ms
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+
+# Create a singleton instance
+language_detector = LanguageDetector()
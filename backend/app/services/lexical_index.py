@@ -0,0 +1,196 @@
+from typing import Dict, List, Any, Optional, Set, Tuple
+from pathlib import Path
+import json
+import logging
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+WORD_RE = re.compile(r"\w+")
+# Scripts written without spaces between words, indexed as overlapping character pairs
+UNSPACED = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff"
+UNSPACED_RE = re.compile(f"[{UNSPACED}]+|[^{UNSPACED}]+")
+UNSPACED_CHAR_RE = re.compile(f"[{UNSPACED}]")
+
+# Query terms looked up at most; longer queries are better served by the embedding
+MAX_QUERY_TERMS = 32
+
+def tokenize(text: str) -> List[str]:
+    """Split text into search terms: case-folded words, and character bigrams for Chinese and Japanese."""
+    terms = []
+    for word in WORD_RE.findall(unicodedata.normalize("NFKC", text).casefold()):
+        if word.isascii():
+            terms.append(word)
+            continue
+        for part in UNSPACED_RE.findall(word):
+            if len(part) == 1 or not UNSPACED_CHAR_RE.match(part):
+                terms.append(part)
+            else:
+                terms.extend(part[i:i + 2] for i in range(len(part) - 1))
+    return terms
+
+class LexicalIndex:
+    """BM25 keyword index over the same chunks as the vector store.
+
+    Chunks are tokenized here (so Chinese and Japanese text is searchable
+    too) and indexed in an SQLite FTS5 table, which ranks matches with
+    BM25. Chunk text and metadata are kept alongside, so results have the
+    same shape as vector search results and can be fused with them.
+    """
+
+    def __init__(self, db_path: Path = Path("app/cache/lexical_index.db")):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS lexical_chunks (
+                rowid INTEGER PRIMARY KEY,
+                chunk_id TEXT NOT NULL UNIQUE,
+                doc_id TEXT NOT NULL,
+                language TEXT,
+                page_start INTEGER,
+                page_end INTEGER,
+                text TEXT NOT NULL,
+                metadata TEXT NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_lexical_chunks_doc ON lexical_chunks (doc_id)")
+        self._conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS lexical_terms USING fts5(
+                terms,
+                tokenize = 'unicode61 remove_diacritics 2'
+            )
+        """)
+        self._conn.commit()
+
+        # Counters
+        self.searches = 0
+        self.total_search_ms = 0.0
+
+    def add(self, chunk_ids: List[str], texts: List[str], metadata: List[Dict[str, Any]]) -> None:
+        """Index chunks, replacing chunks with the same ids."""
+        rows = [
+            (
+                chunk_id,
+                meta.get("doc_id"),
+                meta.get("language"),
+                meta.get("page_start"),
+                meta.get("page_end"),
+                text,
+                json.dumps(meta),
+                " ".join(tokenize(text))
+            )
+            for chunk_id, text, meta in zip(chunk_ids, texts, metadata)
+        ]
+        with self._lock:
+            self._delete_chunks([row[0] for row in rows])
+            for *chunk, terms in rows:
+                cursor = self._conn.execute(
+                    """INSERT INTO lexical_chunks (chunk_id, doc_id, language, page_start, page_end, text, metadata)
+                       VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                    chunk
+                )
+                self._conn.execute("INSERT INTO lexical_terms (rowid, terms) VALUES (?, ?)", (cursor.lastrowid, terms))
+            self._conn.commit()
+
+    def _delete_chunks(self, chunk_ids: List[str]) -> None:
+        for i in range(0, len(chunk_ids), 500):
+            batch = chunk_ids[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            self._conn.execute(
+                f"DELETE FROM lexical_terms WHERE rowid IN (SELECT rowid FROM lexical_chunks WHERE chunk_id IN ({placeholders}))",
+                batch
+            )
+            self._conn.execute(f"DELETE FROM lexical_chunks WHERE chunk_id IN ({placeholders})", batch)
+
+    def delete_document(self, doc_id: str) -> int:
+        """Remove every chunk of a document, returning how many were removed."""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM lexical_terms WHERE rowid IN (SELECT rowid FROM lexical_chunks WHERE doc_id = ?)",
+                (doc_id,)
+            )
+            removed = self._conn.execute("DELETE FROM lexical_chunks WHERE doc_id = ?", (doc_id,)).rowcount
+            self._conn.commit()
+        return removed
+
+    def document_ids(self) -> Set[str]:
+        with self._lock:
+            return {row[0] for row in self._conn.execute("SELECT DISTINCT doc_id FROM lexical_chunks")}
+
+    def search(
+        self,
+        query: str,
+        doc_ids: List[str],
+        k: int = 5,
+        language: Optional[str] = None,
+        page_range: Optional[Tuple[int, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Best BM25 matches for any of the query terms, best first.
+
+        Results have "id", "text", "metadata", the "bm25" score (higher is
+        better) and "coverage", the share of query terms the chunk contains.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))[:MAX_QUERY_TERMS]
+        if not terms or not doc_ids:
+            return []
+
+        start = time.perf_counter()
+        # Terms are word characters only, so quoting them is enough to escape them
+        match = " OR ".join(f'"{term}"' for term in terms)
+        sql = f"""
+            SELECT c.chunk_id, c.text, c.metadata, bm25(lexical_terms) AS rank
+            FROM lexical_terms JOIN lexical_chunks c ON c.rowid = lexical_terms.rowid
+            WHERE lexical_terms MATCH ? AND c.doc_id IN ({",".join("?" * len(doc_ids))})
+        """
+        params: List[Any] = [match, *doc_ids]
+        if language:
+            sql += " AND c.language = ?"
+            params.append(language)
+        if page_range:
+            # Chunks may span pages, so match any chunk overlapping the range
+            sql += " AND c.page_end >= ? AND c.page_start <= ?"
+            params.extend(page_range)
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(k)
+
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+
+        query_terms = set(terms)
+        results = []
+        for chunk_id, text, metadata, rank in rows:
+            results.append({
+                "id": chunk_id,
+                "text": text,
+                "metadata": json.loads(metadata),
+                "bm25": -rank,  # FTS5 ranks better matches lower
+                "coverage": len(query_terms.intersection(tokenize(text))) / len(query_terms)
+            })
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.searches += 1
+        self.total_search_ms += elapsed_ms
+        logger.info(f"Lexical search found {len(results)} chunks in {elapsed_ms:.1f} ms")
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            chunks, documents = self._conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT doc_id) FROM lexical_chunks"
+            ).fetchone()
+        return {
+            "chunks": chunks,
+            "documents": documents,
+            "searches": self.searches,
+            "avg_search_ms": self.total_search_ms / self.searches if self.searches else 0.0
+        }
+
+# Create a singleton instance
+lexical_index = LexicalIndex()
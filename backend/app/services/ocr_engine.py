@@ -0,0 +1,147 @@
+from typing import Dict, List, Any, Iterator, Optional
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import os
+import threading
+import time
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+def _ocr_page(pdf_path: str, page_number: int, tesseract_lang: str, tesseract_cmd: Optional[str], dpi: int) -> Dict[str, Any]:
+    """Rasterize and OCR a single page. Runs inside a worker process."""
+    # Imported here so worker processes only load what they need
+    from pdf2image import convert_from_path
+    import pytesseract
+
+    # Spawned workers (Windows) do not inherit the parent's tesseract path
+    if tesseract_cmd:
+        pytesseract.pytesseract.tesseract_cmd = tesseract_cmd
+
+    start = time.perf_counter()
+    try:
+        images = convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            first_page=page_number,
+            last_page=page_number,
+            fmt='png',
+            grayscale=True,
+            use_pdftocairo=True
+        )
+    except Exception:
+        images = convert_from_path(
+            pdf_path,
+            dpi=dpi,
+            first_page=page_number,
+            last_page=page_number,
+            fmt='png',
+            grayscale=True,
+            use_pdftocairo=False
+        )
+    rasterize_ms = (time.perf_counter() - start) * 1000
+
+    text = ""
+    error = None
+    start = time.perf_counter()
+    if images:
+        image = images[0]
+        try:
+            text = pytesseract.image_to_string(image, lang=tesseract_lang, config='--psm 1')
+        except Exception as e:
+            # Fallback to English if the language pack is missing
+            error = str(e)
+            text = pytesseract.image_to_string(image, lang='eng', config='--psm 1')
+        finally:
+            image.close()
+    ocr_ms = (time.perf_counter() - start) * 1000
+
+    return {
+        "page": page_number,
+        "text": text,
+        "rasterize_ms": rasterize_ms,
+        "ocr_ms": ocr_ms,
+        "fallback_error": error
+    }
+
+class OCREngine:
+    """Process-pool OCR that rasterizes and recognizes pages concurrently.
+
+    Pages are submitted through a bounded window so only a few rasterized
+    pages exist at any time, and results are yielded in page order.
+    """
+
+    def __init__(self):
+        self.max_workers = int(os.getenv("OCR_WORKERS", str(os.cpu_count() or 1)))
+        # Pages in flight (rasterized or waiting for a worker) at any time
+        self.max_pending_pages = int(os.getenv("OCR_MAX_PENDING_PAGES", str(self.max_workers * 2)))
+        self.dpi = int(os.getenv("OCR_DPI", "200"))
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                logger.info(f"Starting OCR process pool with {self.max_workers} workers")
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            return self._executor
+
+    def _reset_executor(self) -> None:
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def iter_pages(
+        self,
+        pdf_path: str,
+        page_numbers: List[int],
+        tesseract_lang: str,
+        tesseract_cmd: Optional[str] = None
+    ) -> Iterator[Dict[str, Any]]:
+        """OCR the given 1-based pages, yielding one result dict per page in order."""
+        executor = self._get_executor()
+        pending: "deque[Future]" = deque()
+        remaining = iter(page_numbers)
+
+        def submit_next() -> bool:
+            page_number = next(remaining, None)
+            if page_number is None:
+                return False
+            pending.append(executor.submit(_ocr_page, pdf_path, page_number, tesseract_lang, tesseract_cmd, self.dpi))
+            return True
+
+        try:
+            while len(pending) < self.max_pending_pages and submit_next():
+                pass
+
+            while pending:
+                result = pending.popleft().result()
+                submit_next()
+                if result["fallback_error"]:
+                    logger.error(f"OCR failed with {tesseract_lang} on page {result['page']}, used English: {result['fallback_error']}")
+                logger.info(
+                    f"OCR page {result['page']}: {len(result['text'].split())} words, "
+                    f"rasterize {result['rasterize_ms']:.0f} ms, ocr {result['ocr_ms']:.0f} ms"
+                )
+                yield result
+        except BrokenProcessPool:
+            logger.error("OCR process pool broke, it will be restarted on next use")
+            self._reset_executor()
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True, cancel_futures=True)
+                self._executor = None
+
+# Create a singleton instance
+ocr_engine = OCREngine()
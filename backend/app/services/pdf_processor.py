@@ -1,20 +1,24 @@
 from pathlib import Path
-from typing import Dict, List, Tuple, Any
+from typing import TYPE_CHECKING, Dict, List, Tuple, Any, Callable, Optional, Iterator, Awaitable
+import asyncio
+import threading
+from collections import deque
 import os
 import re
 from datetime import datetime
-from pypdf import PdfReader
 from app.services.vector_store import vector_store
 import logging
-from langchain.text_splitter import RecursiveCharacterTextSplitter
+from app.services.text_chunker import TokenChunker
 import traceback
-from langdetect import detect, detect_langs
-from langdetect.lang_detect_exception import LangDetectException
+from app.services.language_detector import language_detector
 import unicodedata
-from pdf2image import convert_from_path
-import pytesseract
-import tempfile
-import sys
+from app.services.ocr_engine import ocr_engine
+from app.services.tracing import tracer
+import time
+from app.utils.lazy import Lazy
+
+if TYPE_CHECKING:
+    from pypdf import PdfReader
 
 # Set up basic logging
 logging.basicConfig(level=logging.INFO)
@@ -24,18 +28,25 @@ class PDFProcessor:
     def __init__(self, upload_dir: Path = Path("app/uploads")):
         self.upload_dir = upload_dir
         self.upload_dir.mkdir(exist_ok=True)
-        # Adjust chunk size and overlap for better context
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=500,  # Smaller chunks for better retrieval
-            chunk_overlap=100,  # Increased overlap percentage
-            length_function=len,
-            separators=["\n\n", "\n", ". ", "! ", "? ", "; ", ": ", ", ", " ", ""]
+        # Chunks are sized in tokens so every language gets the same context budget
+        self.chunk_tokens = int(os.getenv("CHUNK_TOKENS", "128"))
+        self.chunker = TokenChunker(
+            vector_store.tokenizer,  # Same encoder the embedding batches are counted with
+            chunk_tokens=self.chunk_tokens,
+            overlap_tokens=int(os.getenv("CHUNK_OVERLAP_TOKENS", "25"))
         )
+        # Pages with less text than this are treated as scanned and OCR'd
+        self.min_page_chars = 20
+        self.min_page_words = 3
+        # Pages read (and OCR'd in parallel) per step, and chunks per window handed to indexing
+        self.page_window = int(os.getenv("PDF_PAGE_WINDOW", "16"))
+        self.chunk_window = int(os.getenv("PDF_CHUNK_WINDOW", "64"))
         
         # Configure paths for Windows
         if os.name == 'nt':  # Windows
             # Set Tesseract path
             if os.path.exists(r'C:\Program Files\Tesseract-OCR\tesseract.exe'):
+                import pytesseract
                 pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
                 logger.info("Tesseract found at default location")
             else:
@@ -63,132 +74,124 @@ class PDFProcessor:
                 logger.warning("Poppler not found in any standard location. PDF to image conversion may fail.")
                 logger.info("Please install poppler from: https://github.com/oschwartz10612/poppler-windows/releases/")
 
-    def extract_text_with_ocr(self, pdf_path: str, language: str = 'eng') -> str:
+    def get_tesseract_language(self, language: str) -> str:
+        """Map detected language code(s) to a Tesseract language pack string."""
+        # Map language codes to Tesseract language packs
+        lang_map = {
+            'sv': 'swe',  # Swedish
+            'en': 'eng',  # English
+            'de': 'deu',  # German
+            'fr': 'fra',  # French
+            'es': 'spa',  # Spanish
+            'it': 'ita',  # Italian
+            'pt': 'por',  # Portuguese
+            'nl': 'nld',  # Dutch
+            'pl': 'pol',  # Polish
+            'ru': 'rus',  # Russian
+            'uk': 'ukr',  # Ukrainian
+            'ar': 'ara',  # Arabic
+            'hi': 'hin',  # Hindi
+            'ja': 'jpn',  # Japanese
+            'ko': 'kor',  # Korean
+            'zh': 'chi_sim',  # Simplified Chinese
+            'da': 'dan',  # Danish
+            'fi': 'fin',  # Finnish
+            'no': 'nor',  # Norwegian
+            'tr': 'tur',  # Turkish
+            'cs': 'ces',  # Czech
+            'hu': 'hun',  # Hungarian
+            'el': 'ell',  # Greek
+            'he': 'heb',  # Hebrew
+            'th': 'tha',  # Thai
+            'vi': 'vie',  # Vietnamese
+        }
+
+        # If multiple languages are detected, try to use them all
+        if ',' in language:
+            # Split multiple languages and map each one
+            langs = [lang_map.get(lang.strip(), 'eng') for lang in language.split(',')]
+            # Remove duplicates and join with plus sign (Tesseract format)
+            return '+'.join(sorted(set(langs)))
+
+        return lang_map.get(language, 'eng')
+
+    def ocr_pages(
+        self,
+        pdf_path: str,
+        page_numbers: List[int],
+        language: str = 'eng',
+        progress_callback: Optional[Callable[[str, float], None]] = None
+    ) -> Dict[int, str]:
+        """OCR the given 1-based pages in parallel and return their text by page number."""
+        tesseract_lang = self.get_tesseract_language(language)
+        logger.info(f"OCR of {len(page_numbers)} pages from {pdf_path} using Tesseract language: {tesseract_lang}")
+
+        start = time.perf_counter()
+        texts: Dict[int, str] = {}
+        import pytesseract
+        tesseract_cmd = pytesseract.pytesseract.tesseract_cmd
+        for done, result in enumerate(ocr_engine.iter_pages(pdf_path, page_numbers, tesseract_lang, tesseract_cmd), start=1):
+            texts[result["page"]] = result["text"]
+            if not result["text"].strip():
+                logger.warning(f"No text extracted from page {result['page']}")
+            if progress_callback:
+                progress_callback("ocr", done / len(page_numbers))
+
+        elapsed = time.perf_counter() - start
+        logger.info(f"OCR finished {len(page_numbers)} pages in {elapsed:.2f}s with {ocr_engine.max_workers} workers")
+        return texts
+
+    def extract_text_with_ocr(
+        self,
+        pdf_path: str,
+        language: str = 'eng',
+        progress_callback: Optional[Callable[[str, float], None]] = None
+    ) -> str:
         """Extract text using OCR if regular extraction fails."""
+        from pypdf import PdfReader
         try:
             logger.info(f"Attempting OCR extraction for {pdf_path} with language: {language}")
-            
-            # Map language codes to Tesseract language packs
-            lang_map = {
-                'sv': 'swe',  # Swedish
-                'en': 'eng',  # English
-                'de': 'deu',  # German
-                'fr': 'fra',  # French
-                'es': 'spa',  # Spanish
-                'it': 'ita',  # Italian
-                'pt': 'por',  # Portuguese
-                'nl': 'nld',  # Dutch
-                'pl': 'pol',  # Polish
-                'ru': 'rus',  # Russian
-                'uk': 'ukr',  # Ukrainian
-                'ar': 'ara',  # Arabic
-                'hi': 'hin',  # Hindi
-                'ja': 'jpn',  # Japanese
-                'ko': 'kor',  # Korean
-                'zh': 'chi_sim',  # Simplified Chinese
-                'da': 'dan',  # Danish
-                'fi': 'fin',  # Finnish
-                'no': 'nor',  # Norwegian
-                'tr': 'tur',  # Turkish
-                'cs': 'ces',  # Czech
-                'hu': 'hun',  # Hungarian
-                'el': 'ell',  # Greek
-                'he': 'heb',  # Hebrew
-                'th': 'tha',  # Thai
-                'vi': 'vie',  # Vietnamese
-            }
-            
-            # Get Tesseract language code
-            tesseract_lang = lang_map.get(language, 'eng')
-            logger.info(f"Using Tesseract language: {tesseract_lang}")
-            
-            # If multiple languages are detected, try to use them all
-            if ',' in language:
-                # Split multiple languages and map each one
-                langs = [lang_map.get(lang.strip(), 'eng') for lang in language.split(',')]
-                # Remove duplicates and join with plus sign (Tesseract format)
-                tesseract_lang = '+'.join(sorted(set(langs)))
-            
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # Convert PDF to images
-                try:
-                    logger.info("Converting PDF to images using pdftocairo")
-                    images = convert_from_path(
-                        pdf_path,
-                        output_folder=temp_dir,
-                        fmt='png',
-                        grayscale=True,
-                        use_pdftocairo=True,
-                        paths_only=True
-                    )
-                except Exception as e:
-                    logger.error(f"PDF to image conversion with pdftocairo failed: {str(e)}")
-                    logger.info("Trying without pdftocairo")
-                    images = convert_from_path(
-                        pdf_path,
-                        output_folder=temp_dir,
-                        fmt='png',
-                        grayscale=True,
-                        use_pdftocairo=False,
-                        paths_only=True
-                    )
-                
-                if not images:
-                    logger.error("No images extracted from PDF")
-                    return ""
-                
-                logger.info(f"Successfully converted PDF to {len(images)} images")
-                
-                # Process each image with OCR
-                text = ""
-                for i, image_path in enumerate(images):
-                    logger.info(f"Processing page {i+1} with OCR using language: {tesseract_lang}")
-                    try:
-                        # Try with specified language
-                        page_text = pytesseract.image_to_string(
-                            image_path,
-                            lang=tesseract_lang,
-                            config='--psm 1'  # Automatic page segmentation
-                        )
-                        logger.info(f"OCR successful for page {i+1} with {tesseract_lang}")
-                    except Exception as e:
-                        logger.error(f"OCR failed with {tesseract_lang}: {str(e)}")
-                        # Fallback to English
-                        logger.info("Falling back to English OCR")
-                        page_text = pytesseract.image_to_string(
-                            image_path,
-                            lang='eng',
-                            config='--psm 1'
-                        )
-                    
-                    if page_text.strip():
-                        logger.info(f"Extracted {len(page_text.split())} words from page {i+1}")
-                    else:
-                        logger.warning(f"No text extracted from page {i+1}")
-                    
-                    text += page_text + "\n\n"
-                
-                final_text = text.strip()
-                logger.info(f"Total extracted text length: {len(final_text)} characters")
-                return final_text
-                
+
+            page_count = len(PdfReader(pdf_path).pages)
+            if page_count == 0:
+                logger.error("No pages found in PDF")
+                return ""
+
+            texts = self.ocr_pages(pdf_path, list(range(1, page_count + 1)), language, progress_callback)
+            final_text = "\n\n".join(texts[page] for page in sorted(texts)).strip()
+            logger.info(f"Total extracted text length: {len(final_text)} characters")
+            return final_text
+
         except Exception as e:
             logger.error(f"OCR extraction failed: {str(e)}")
             logger.error(f"Full traceback: {traceback.format_exc()}")
             return ""
 
+    def page_needs_ocr(self, page_text: str) -> bool:
+        """Decide whether a page's text layer is missing or too garbled to use."""
+        text = page_text.strip()
+        if len(text) < self.min_page_chars or len(text.split()) < self.min_page_words:
+            return True
+
+        visible = [c for c in text if not c.isspace()]
+        # Replacement, private-use and control characters come from broken font encodings
+        broken = sum(1 for c in visible if c == '\ufffd' or unicodedata.category(c) in ('Co', 'Cs', 'Cc'))
+        if broken / len(visible) > 0.1:
+            return True
+
+        # Mostly symbols, or "(cid:123)" glyph references instead of text
+        alphanumeric = sum(1 for c in visible if c.isalnum())
+        if alphanumeric / len(visible) < 0.5 or text.count("(cid:") > 10:
+            return True
+
+        return False
+
     def detect_language(self, text: str) -> str:
         """Detect the primary language of the text."""
-        try:
-            # Get language probabilities
-            langs = detect_langs(text[:10000])  # Use first 10k chars for speed
-            # Return most probable language
-            return langs[0].lang
-        except LangDetectException:
-            # Default to English if detection fails
-            return 'en'
-
-    def extract_metadata(self, pdf: PdfReader, detected_language: str) -> Dict[str, Any]:
+        # Use first 10k chars for speed, default to English if detection fails
+        return language_detector.detect(text, default='en', max_chars=10000)
+
+    def extract_metadata(self, pdf: "PdfReader", detected_language: str) -> Dict[str, Any]:
         """Extract metadata from PDF."""
         try:
             metadata = {
@@ -219,8 +222,126 @@ class PDFProcessor:
                 "language": detected_language
             }
 
-    async def process_pdf(self, filename: str) -> Dict[str, Any]:
-        """Process a PDF file and return its chunks and metadata."""
+    async def process_pdf(self, filename: str, progress_callback: Optional[Callable[[str, float], None]] = None) -> Dict[str, Any]:
+        """Process a PDF file and return its chunks and metadata.
+
+        Collects the whole output of process_pdf_streaming; ingestion uses
+        the streaming variant directly to keep memory flat.
+        """
+        chunks: List[str] = []
+        chunk_metadata: List[Dict[str, Any]] = []
+        pages: List[str] = []
+
+        async def collect(window: Dict[str, Any]) -> None:
+            chunks.extend(window["chunks"])
+            chunk_metadata.extend(window["chunk_metadata"])
+            pages.extend(text for _, text in window["pages"])
+
+        result = await self.process_pdf_streaming(filename, collect, progress_callback)
+        return dict(result, chunks=chunks, chunk_metadata=chunk_metadata, pages=pages)
+
+    async def process_pdf_streaming(
+        self,
+        filename: str,
+        on_window: Callable[[Dict[str, Any]], Awaitable[None]],
+        progress_callback: Optional[Callable[[str, float], None]] = None
+    ) -> Dict[str, Any]:
+        """Extract, clean and chunk a PDF page by page, handing out fixed-size chunk windows.
+
+        Extraction runs in a worker thread and ``await on_window(window)`` is
+        called on the event loop for every window of up to ``chunk_window``
+        chunks, so the caller can embed and index the first chunks while later
+        pages are still being parsed. A window holds "chunks",
+        "chunk_metadata", the cleaned "pages" (page number, text) completed
+        since the previous window, and "pages_done"/"total_pages". Only a
+        couple of windows are buffered at a time. Returns metadata and summary.
+        """
+        loop = asyncio.get_running_loop()
+        windows: asyncio.Queue = asyncio.Queue(maxsize=2)
+        stop = threading.Event()
+
+        def emit(window: Optional[Dict[str, Any]]) -> None:
+            if stop.is_set() and window is not None:
+                raise RuntimeError("Processing cancelled")
+            # Blocks the worker thread while the queue is full (backpressure)
+            asyncio.run_coroutine_threadsafe(windows.put(window), loop).result()
+
+        def produce() -> Dict[str, Any]:
+            try:
+                return self._stream_pdf_sync(filename, emit, progress_callback)
+            finally:
+                emit(None)
+
+        with tracer.span("pdf.process", filename=filename) as span:
+            producer = asyncio.ensure_future(asyncio.to_thread(produce))
+            try:
+                while (window := await windows.get()) is not None:
+                    await on_window(window)
+            except BaseException:
+                # Unblock and stop the worker thread before propagating
+                stop.set()
+                while await windows.get() is not None:
+                    pass
+                await asyncio.gather(producer, return_exceptions=True)
+                raise
+            result = await producer
+            span.set(chunks=result["chunk_count"], ocr_pages=result["metadata"]["ocr_pages"])
+        return result
+
+    def _iter_pages(self, file_path: Path, pdf: "PdfReader", report: Callable[[str, float], None]) -> Iterator[Tuple[int, str, bool]]:
+        """Yield (page number, raw text, OCR used) in order, OCRing bad pages window by window."""
+        total_pages = len(pdf.pages)
+        ocr_language: Optional[str] = None
+        for window_start in range(0, total_pages, self.page_window):
+            page_numbers = range(window_start + 1, min(window_start + self.page_window, total_pages) + 1)
+            page_texts: Dict[int, str] = {}
+            with tracer.span("pdf.extract", pages=len(page_numbers)):
+                for page_number in page_numbers:
+                    report("extract", (page_number - 1) / total_pages)
+                    try:
+                        page_text = pdf.pages[page_number - 1].extract_text() or ""
+                    except Exception as e:
+                        logger.error(f"Text extraction failed for page {page_number} of {file_path.name}: {str(e)}")
+                        page_text = ""
+                    page_texts[page_number] = page_text
+
+            # OCR only the pages whose text layer is missing or garbled
+            ocr_page_numbers = [n for n in page_numbers if self.page_needs_ocr(page_texts[n])]
+            ocr_pages_used = set()
+            if ocr_page_numbers:
+                logger.info(f"Pages {ocr_page_numbers} of {total_pages} need OCR")
+                report("ocr", 0.0)
+                if ocr_language is None:
+                    # Use the language of the good pages for OCR when there are any
+                    text_layer = "\n\n".join(page_texts[n] for n in page_numbers if n not in ocr_page_numbers)
+                    ocr_language = self.detect_language(text_layer) if text_layer.strip() else 'eng'
+                try:
+                    with tracer.span("pdf.ocr", pages=len(ocr_page_numbers), language=ocr_language):
+                        ocr_texts = self.ocr_pages(str(file_path), ocr_page_numbers, ocr_language, report)
+                except Exception as e:
+                    logger.error(f"OCR failed for {file_path.name}: {str(e)}")
+                    logger.error(f"Full traceback: {traceback.format_exc()}")
+                    ocr_texts = {}
+                for page_number, ocr_text in ocr_texts.items():
+                    # Keep the text layer if OCR did not recover more words
+                    if len(ocr_text.split()) > len(page_texts[page_number].split()):
+                        page_texts[page_number] = ocr_text
+                        ocr_pages_used.add(page_number)
+
+            for page_number in page_numbers:
+                yield page_number, page_texts.pop(page_number), page_number in ocr_pages_used
+
+    def _stream_pdf_sync(
+        self,
+        filename: str,
+        emit: Callable[[Dict[str, Any]], None],
+        progress_callback: Optional[Callable[[str, float], None]] = None
+    ) -> Dict[str, Any]:
+        """Synchronous implementation of process_pdf_streaming."""
+        def report(stage: str, fraction: float) -> None:
+            if progress_callback:
+                progress_callback(stage, fraction)
+
         try:
             file_path = self.upload_dir / filename
             if not file_path.exists():
@@ -228,82 +349,139 @@ class PDFProcessor:
                 raise FileNotFoundError(f"PDF file not found: {filename}")
 
             # Read PDF
+            from pypdf import PdfReader
             try:
-                pdf = PdfReader(str(file_path))
+                with tracer.span("pdf.open"):
+                    pdf = PdfReader(str(file_path))
                 logger.info(f"PDF opened: {filename}")
             except Exception as e:
                 logger.error(f"Failed to read PDF {filename}: {str(e)}")
                 raise ValueError(f"Failed to read PDF: {str(e)}")
-            
-            # Extract text from all pages
-            text = ""
-            ocr_used = False
-            try:
-                # First try normal text extraction
-                for i, page in enumerate(pdf.pages):
-                    page_text = page.extract_text()
-                    logger.info(f"Page {i+1} raw text length: {len(page_text)} chars")
-                    logger.info(f"Page {i+1} raw word count: {len([w for w in page_text.split() if w.strip()])}")
-                    text += page_text + "\n\n"
-                    logger.info(f"Processed page {i+1} of {filename}")
-                
-                # Log initial text extraction results
-                initial_words = len([w for w in text.split() if w.strip()])
-                logger.info(f"Initial text extraction: {initial_words} words, {len(text)} chars")
-                logger.info(f"Sample of extracted text: {text[:200]}")
-                
-                # Try OCR if text seems insufficient or problematic
-                if initial_words < 100 or len(text.strip()) < 200:
-                    logger.info(f"Text seems insufficient ({initial_words} words), attempting OCR")
-                    ocr_text = self.extract_text_with_ocr(str(file_path))
-                    if ocr_text.strip():
-                        ocr_words = len([w for w in ocr_text.split() if w.strip()])
-                        logger.info(f"OCR extracted {ocr_words} words")
-                        if ocr_words > initial_words:
-                            text = ocr_text
-                            ocr_used = True
-                            logger.info("Using OCR text instead of direct extraction")
-                        else:
-                            logger.info("Keeping original text as it contains more words than OCR")
-            except Exception as e:
-                logger.error(f"Text extraction failed, attempting OCR: {str(e)}")
-                text = self.extract_text_with_ocr(str(file_path))
-                ocr_used = True
-            
-            if not text.strip():
+
+            total_pages = len(pdf.pages)
+            words = 0
+            chars = 0
+            ocr_pages_used = 0
+            chunk_count = 0
+            detected_language: Optional[str] = None
+
+            # Pages held back until enough text is seen to detect the language
+            pending_pages: List[Tuple[int, str]] = []
+            # Text that has not been emitted as chunks yet, starting at the last partial chunk.
+            # Offsets are into the document text, the non-empty pages joined by blank lines.
+            buffer = ""
+            buffer_offset = 0
+            document_length = 0
+            # (page number, start offset, end offset) of pages that may still overlap the buffer
+            page_spans: "deque[Tuple[int, int, int]]" = deque()
+            window: Dict[str, Any] = {"chunks": [], "chunk_metadata": [], "pages": []}
+
+            def emit_window(pages_done: int) -> None:
+                nonlocal window
+                if window["chunks"] or window["pages"]:
+                    emit(dict(window, pages_done=pages_done, total_pages=total_pages))
+                    window = {"chunks": [], "chunk_metadata": [], "pages": []}
+
+            def chunk_provenance(char_start: int, char_end: int) -> Dict[str, int]:
+                """Map document offsets of a chunk to the pages it spans."""
+                covered = [span for span in page_spans if span[1] < char_end and span[2] > char_start]
+                if not covered:
+                    # Only whitespace between pages, attribute it to the nearest earlier page
+                    earlier = [span for span in page_spans if span[1] <= char_start]
+                    covered = [earlier[-1] if earlier else page_spans[0]]
+                first, last = covered[0], covered[-1]
+                return {
+                    "page": first[0],
+                    "page_start": first[0],
+                    "page_end": last[0],
+                    "page_char_start": max(0, char_start - first[1]),
+                    "page_char_end": min(last[2], char_end) - last[1],
+                    "char_start": char_start,
+                    "char_end": char_end
+                }
+
+            def split_buffer(pages_done: int, final: bool) -> None:
+                """Chunk the buffered text, keeping the last partial chunk unless this is the end."""
+                nonlocal buffer, buffer_offset, chunk_count
+                if not buffer:
+                    return
+                spans = self.chunker.split(buffer)
+                ready = spans if final else spans[:-1]
+
+                for start, end, token_count in ready:
+                    char_start = buffer_offset + start
+                    window["chunks"].append(buffer[start:end])
+                    window["chunk_metadata"].append({
+                        **chunk_provenance(char_start, buffer_offset + end),
+                        "chunk_index": chunk_count,
+                        "token_count": token_count,
+                        "language": detected_language,
+                        "filename": filename
+                    })
+                    chunk_count += 1
+                    if len(window["chunks"]) >= self.chunk_window:
+                        emit_window(pages_done)
+
+                if final or not spans:
+                    buffer_offset += len(buffer)
+                    buffer = ""
+                else:
+                    buffer_offset += spans[-1][0]
+                    buffer = buffer[spans[-1][0]:]
+                # Forget pages that end before the remaining buffer
+                while len(page_spans) > 1 and page_spans[0][2] <= buffer_offset:
+                    page_spans.popleft()
+
+            def add_page(page_number: int, text: str) -> None:
+                nonlocal buffer, document_length
+                window["pages"].append((page_number, text))
+                if text:
+                    separator = "\n\n" if document_length else ""
+                    page_start = document_length + len(separator)
+                    document_length = page_start + len(text)
+                    page_spans.append((page_number, page_start, document_length))
+                    buffer += separator + text
+                # Split only once a few chunks' worth of text is buffered (~4 characters per token)
+                if len(buffer) >= self.chunk_tokens * 32:
+                    split_buffer(page_number, final=False)
+
+            for page_number, raw_text, ocr_used in self._iter_pages(file_path, pdf, report):
+                text = self._normalize_text(raw_text)
+                words += len(text.split())
+                chars += len(text)
+                ocr_pages_used += int(ocr_used)
+
+                if detected_language is None:
+                    pending_pages.append((page_number, text))
+                    if sum(len(t) for _, t in pending_pages) < 10000 and page_number < total_pages:
+                        continue
+                    with tracer.span("language_detection"):
+                        detected_language = self.detect_language("\n\n".join(t for _, t in pending_pages))
+                    logger.info(f"Detected language: {detected_language}")
+                    for pending_number, pending_text in pending_pages:
+                        add_page(pending_number, pending_text)
+                    pending_pages = []
+                else:
+                    add_page(page_number, text)
+
+            if not chars:
                 raise ValueError("No text could be extracted from the PDF")
-            
-            # Clean text (preserving unicode characters)
-            text = self.clean_text(text)
-            
-            # Count words and characters more carefully
-            words = len([w for w in text.split() if len(w.strip()) > 0])
-            chars = len(text)
-            logger.info(f"Final count: {words} words, {chars} characters")
+
+            report("chunk", 1.0)
+            split_buffer(total_pages, final=True)
+            emit_window(total_pages)
+
+            ocr_used = ocr_pages_used > 0
+            logger.info(f"Final count: {words} words, {chars} characters, {chunk_count} chunks")
             logger.info(f"Average word length: {chars/words if words > 0 else 0:.2f} characters")
-            
-            # Detect language
-            detected_language = self.detect_language(text)
-            logger.info(f"Detected language: {detected_language}")
-            
+
             # Extract metadata with language
             metadata = self.extract_metadata(pdf, detected_language)
             metadata['ocr_used'] = ocr_used
+            metadata['ocr_pages'] = ocr_pages_used
             metadata['word_count'] = words
             metadata['char_count'] = chars
             
-            # Split into chunks
-            chunks = self.text_splitter.split_text(text)
-            logger.info(f"Split {filename} into {len(chunks)} chunks")
-            
-            # Add language metadata to each chunk
-            chunk_metadata = [{
-                "page": i // 2 + 1,  # Rough page estimation
-                "language": detected_language,
-                "filename": filename,
-                "ocr_used": ocr_used
-            } for i in range(len(chunks))]
-            
             # Create summary
             summary = (
                 f"Document Title: {metadata['title']}\n"
@@ -316,10 +494,9 @@ class PDFProcessor:
             )
             
             return {
-                "chunks": chunks,
                 "metadata": metadata,
-                "chunk_metadata": chunk_metadata,
-                "summary": summary
+                "summary": summary,
+                "chunk_count": chunk_count
             }
 
         except Exception as e:
@@ -334,14 +511,7 @@ class PDFProcessor:
             logger.info(f"Original word count: {len([w for w in text.split() if w.strip()])}")
             logger.info(f"First 200 chars of original text: {text[:200]}")
             
-            # Remove multiple newlines
-            text = re.sub(r'\n{3,}', '\n\n', text)
-            # Remove multiple spaces
-            text = re.sub(r' +', ' ', text)
-            # Remove control characters while preserving unicode
-            text = ''.join(char for char in text if not unicodedata.category(char).startswith('C') or char == '\n')
-            
-            cleaned = text.strip()
+            cleaned = self._normalize_text(text)
             # Log cleaned text stats
             logger.info(f"Cleaned text length: {len(cleaned)} chars")
             logger.info(f"Cleaned word count: {len([w for w in cleaned.split() if w.strip()])}")
@@ -352,6 +522,16 @@ class PDFProcessor:
             logger.error(f"Error cleaning text: {str(e)}")
             return text.strip()
 
+    def _normalize_text(self, text: str) -> str:
+        """Collapse blank lines and spaces and drop control characters."""
+        # Remove multiple newlines
+        text = re.sub(r'\n{3,}', '\n\n', text)
+        # Remove multiple spaces
+        text = re.sub(r' +', ' ', text)
+        # Remove control characters while preserving unicode
+        text = ''.join(char for char in text if not unicodedata.category(char).startswith('C') or char == '\n')
+        return text.strip()
+
     async def get_text_chunks(self, filename: str) -> List[str]:
         """Get text chunks for a processed PDF."""
         result = await self.process_pdf(filename)
@@ -363,5 +543,5 @@ class PDFProcessor:
         if file_path.exists():
             file_path.unlink()
 
-# Create a singleton instance
-pdf_processor = PDFProcessor() 
\ No newline at end of file
+# Create a singleton instance on first use, see app.utils.lazy
+pdf_processor: PDFProcessor = Lazy(PDFProcessor, "pdf_processor")
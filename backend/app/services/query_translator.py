@@ -0,0 +1,135 @@
+from typing import Dict, Any, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import logging
+import os
+import threading
+import time
+import unicodedata
+
+from app.services.rate_limiter import rate_limits
+from app.services.usage_control import usage_control
+from app.utils.lazy import Lazy
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class QueryTranslator:
+    """Translates search queries to English, caching by (query, source language).
+
+    Concurrent requests for the same query share one translation call.
+    """
+
+    def __init__(self, model: str = "gpt-3.5-turbo"):
+        self.model = model
+        self.max_entries = int(os.getenv("TRANSLATION_CACHE_SIZE", "2000"))
+        self.ttl_seconds = float(os.getenv("TRANSLATION_CACHE_TTL", "86400"))
+        from openai import AsyncOpenAI
+        self.client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, str]]" = OrderedDict()
+        self._in_flight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.translations = 0
+        self.failures = 0
+        self.total_translate_ms = 0.0
+        self.last_translate_ms = 0.0
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return " ".join(unicodedata.normalize("NFC", query).casefold().split())
+
+    def get(self, query: str, source_language: str) -> Optional[str]:
+        """Return a cached translation, or None."""
+        key = (self.normalize(query), source_language)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, query: str, source_language: str, translation: str) -> None:
+        key = (self.normalize(query), source_language)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, translation)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def translate(self, query: str, source_language: str) -> Optional[str]:
+        """Translate a query to English. Returns None if the translation failed."""
+        cached = self.get(query, source_language)
+        if cached is not None:
+            self.hits += 1
+            return cached
+        self.misses += 1
+
+        key = (self.normalize(query), source_language)
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._translate(query, source_language))
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        # Shielded so a caller giving up does not cancel the shared call
+        return await asyncio.shield(future)
+
+    async def _translate(self, query: str, source_language: str) -> Optional[str]:
+        start = time.perf_counter()
+        # The reply is about as long as the query; don't hold up the search for quota
+        if not await rate_limits.acquire_chat(2 * usage_control.count_tokens(query) + 50, max_wait=0):
+            self.failures += 1
+            logger.warning(f"Query translation from {source_language} skipped, chat quota exhausted")
+            return None
+        try:
+            response = await self.client.chat.completions.create(
+                model=self.model,
+                messages=[
+                    {"role": "system", "content": "Translate the following text to English, keeping the same meaning and intent:"},
+                    {"role": "user", "content": query}
+                ],
+                temperature=0,
+            )
+        except Exception as e:
+            self.failures += 1
+            logger.warning(f"Query translation from {source_language} failed: {str(e)}")
+            return None
+
+        translation = response.choices[0].message.content.strip()
+        if response.usage:
+            usage_control.log_translation(response.usage.prompt_tokens, response.usage.completion_tokens)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.translations += 1
+        self.total_translate_ms += elapsed_ms
+        self.last_translate_ms = elapsed_ms
+        logger.info(f"Translated query from {source_language} to English in {elapsed_ms:.0f} ms: {translation}")
+        self.put(query, source_language, translation)
+        return translation
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "translations": self.translations,
+            "failures": self.failures,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "avg_translate_ms": self.total_translate_ms / self.translations if self.translations else 0.0,
+            "last_translate_ms": self.last_translate_ms
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+# Create a singleton instance on first use, see app.utils.lazy
+query_translator: QueryTranslator = Lazy(QueryTranslator, "query_translator")
@@ -0,0 +1,227 @@
+from typing import Dict, Any, Optional, Tuple
+from pathlib import Path
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class MemoryBucketStore:
+    """Token buckets in process memory, for a single worker."""
+
+    # take() never blocks, so limiters call it directly on the event loop
+    blocking = False
+
+    def __init__(self, max_buckets: int = 100_000):
+        self.max_buckets = max_buckets
+        # key -> (tokens, updated_at, full_at)
+        self._buckets: Dict[str, Tuple[float, float, float]] = {}
+        self._lock = threading.Lock()
+
+    def take(self, key: str, cost: float, capacity: float, rate: float, max_wait: float) -> Optional[float]:
+        """Take ``cost`` tokens from a bucket.
+
+        Returns the seconds the caller must wait before going ahead (0 when
+        the tokens were available), or None when that wait would exceed
+        ``max_wait``; then nothing is taken. Waiting callers borrow from
+        future refills, so they are served in the order they arrived.
+        """
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at, _ = self._buckets.get(key, (capacity, now, now))
+            tokens, wait = _take(tokens, now - updated_at, cost, capacity, rate, max_wait)
+            if wait is None:
+                return None
+            self._buckets[key] = (tokens, now, now + (capacity - tokens) / rate)
+            if len(self._buckets) > self.max_buckets:
+                self._prune(now)
+        return wait
+
+    def _prune(self, now: float) -> None:
+        # A full bucket is the same as no bucket
+        for key in [key for key, (_, _, full_at) in self._buckets.items() if full_at <= now]:
+            del self._buckets[key]
+
+class SQLiteBucketStore:
+    """Token buckets in a SQLite file, shared by all workers on the host."""
+
+    blocking = True
+
+    def __init__(self, db_path: Path):
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, timeout=5, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                full_at REAL NOT NULL
+            )
+        """)
+        self._takes = 0
+
+    def take(self, key: str, cost: float, capacity: float, rate: float, max_wait: float) -> Optional[float]:
+        """Same as MemoryBucketStore.take, atomic across processes."""
+        with self._lock:
+            # Wall-clock time, the only clock the workers share
+            now = time.time()
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated_at FROM rate_buckets WHERE key = ?", (key,)
+                ).fetchone()
+                tokens, updated_at = row if row else (capacity, now)
+                tokens, wait = _take(tokens, max(0.0, now - updated_at), cost, capacity, rate, max_wait)
+                if wait is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO rate_buckets (key, tokens, updated_at, full_at) VALUES (?, ?, ?, ?)",
+                        (key, tokens, now, now + (capacity - tokens) / rate)
+                    )
+                self._takes += 1
+                if self._takes % 1000 == 0:
+                    self._conn.execute("DELETE FROM rate_buckets WHERE full_at <= ?", (now,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+def _take(
+    tokens: float,
+    elapsed: float,
+    cost: float,
+    capacity: float,
+    rate: float,
+    max_wait: float
+) -> Tuple[float, Optional[float]]:
+    """Refill a bucket for ``elapsed`` seconds and take ``cost`` tokens, going into debt if allowed."""
+    tokens = min(capacity, tokens + elapsed * rate)
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    wait = (cost - tokens) / rate
+    if wait > max_wait:
+        return tokens, None
+    return tokens - cost, wait
+
+class TokenBucketLimiter:
+    """Allows ``per_minute`` units per key on average, bursts up to ``burst``.
+
+    Callers over the limit wait for the next tokens when that takes at most
+    ``max_wait`` seconds, and are refused otherwise.
+    """
+
+    def __init__(self, name: str, store, per_minute: float, burst: Optional[float] = None, max_wait: float = 0.0):
+        self.name = name
+        self.store = store
+        self.per_minute = per_minute
+        self.capacity = burst or per_minute
+        self.max_wait = max_wait
+
+        # Counters
+        self.granted = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.total_wait_s = 0.0
+
+    async def acquire(self, key: str = "global", cost: float = 1, max_wait: Optional[float] = None) -> bool:
+        """Wait for ``cost`` units for ``key``; False if that would take longer than ``max_wait``."""
+        # A request larger than the whole bucket would otherwise never fit
+        cost = min(cost, self.capacity)
+        max_wait = self.max_wait if max_wait is None else max_wait
+        args = (f"{self.name}:{key}", cost, self.capacity, self.per_minute / 60, max_wait)
+        if self.store.blocking:
+            wait = await asyncio.to_thread(self.store.take, *args)
+        else:
+            wait = self.store.take(*args)
+
+        if wait is None:
+            self.rejected += 1
+            return False
+        self.granted += 1
+        if wait > 0:
+            self.delayed += 1
+            self.total_wait_s += wait
+            await asyncio.sleep(wait)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "per_minute": self.per_minute,
+            "burst": self.capacity,
+            "max_wait_s": self.max_wait,
+            "granted": self.granted,
+            "delayed": self.delayed,
+            "rejected": self.rejected,
+            "avg_wait_s": self.total_wait_s / self.delayed if self.delayed else 0.0
+        }
+
+class RateLimits:
+    """Rate limits per client and per upstream API.
+
+    ``chat_clients`` limits chat requests per client (API key or address).
+    The other limiters keep all clients together within the OpenAI quotas
+    for chat completions and embeddings, in requests and tokens per minute.
+    """
+
+    def __init__(self):
+        backend = os.getenv("RATE_LIMIT_BACKEND", "memory")
+        if backend == "sqlite":
+            self.store = SQLiteBucketStore(Path(os.getenv("RATE_LIMIT_DB", "app/cache/rate_limits.db")))
+        else:
+            self.store = MemoryBucketStore()
+        self.backend = backend
+
+        client_wait = float(os.getenv("RATE_LIMIT_MAX_WAIT", "2"))
+        upstream_wait = float(os.getenv("UPSTREAM_MAX_WAIT", "10"))
+        self.chat_clients = TokenBucketLimiter(
+            "chat_clients",
+            self.store,
+            per_minute=float(os.getenv("RATE_LIMIT_PER_MIN", "10")),
+            burst=float(os.getenv("RATE_LIMIT_BURST", "0")) or None,
+            max_wait=client_wait
+        )
+        self.chat_requests = TokenBucketLimiter(
+            "chat_requests", self.store, per_minute=float(os.getenv("CHAT_RPM", "3500")), max_wait=upstream_wait
+        )
+        self.chat_tokens = TokenBucketLimiter(
+            "chat_tokens", self.store, per_minute=float(os.getenv("CHAT_TPM", "160000")), max_wait=upstream_wait
+        )
+        # Ingestion waits as long as it takes
+        self.embedding_requests = TokenBucketLimiter(
+            "embedding_requests", self.store, per_minute=float(os.getenv("EMBEDDING_RPM", "3000")), max_wait=math.inf
+        )
+        self.embedding_tokens = TokenBucketLimiter(
+            "embedding_tokens", self.store, per_minute=float(os.getenv("EMBEDDING_TPM", "1000000")), max_wait=math.inf
+        )
+
+    async def acquire_chat(self, tokens: int, max_wait: Optional[float] = None) -> bool:
+        """Wait for quota for one chat completion request of ``tokens`` tokens."""
+        if not await self.chat_requests.acquire(max_wait=max_wait):
+            return False
+        return await self.chat_tokens.acquire(cost=tokens, max_wait=max_wait)
+
+    async def acquire_embedding(self, tokens: int) -> None:
+        """Wait for quota for one embedding request of ``tokens`` tokens."""
+        await self.embedding_requests.acquire()
+        await self.embedding_tokens.acquire(cost=tokens)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": self.backend,
+            "chat_clients": self.chat_clients.stats(),
+            "chat_requests": self.chat_requests.stats(),
+            "chat_tokens": self.chat_tokens.stats(),
+            "embedding_requests": self.embedding_requests.stats(),
+            "embedding_tokens": self.embedding_tokens.stats()
+        }
+
+# Create a singleton instance
+rate_limits = RateLimits()
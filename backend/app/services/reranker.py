@@ -0,0 +1,201 @@
+from typing import Dict, List, Any, Optional, Set
+import asyncio
+import logging
+import math
+import os
+import threading
+import time
+
+from app.services.lexical_index import tokenize
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class Reranker:
+    """Reorders retrieved chunks locally before they are packed into the prompt.
+
+    Retrieval over-fetches candidates; the reranker scores their relevance
+    (retrieval similarity blended with query term coverage, or a
+    cross-encoder when one is configured and loaded) and picks the top k
+    with maximal marginal relevance, so near-duplicates of chunks already
+    picked lose out to chunks adding something new. Scoring stops at the
+    latency budget; unscored candidates keep their retrieval order.
+    """
+
+    def __init__(self):
+        # "off", "mmr" (lexical relevance and diversity) or "cross_encoder" (adds a local model)
+        self.mode = os.getenv("RERANK_MODE", "mmr")
+        self.candidates = int(os.getenv("RERANK_CANDIDATES", "30"))
+        self.budget_ms = float(os.getenv("RERANK_BUDGET_MS", "150"))
+        # Relevance versus novelty when picking the next chunk (1.0 ignores redundancy)
+        self.mmr_lambda = float(os.getenv("RERANK_MMR_LAMBDA", "0.7"))
+        # Term overlap above which a chunk is a duplicate of one already picked
+        self.duplicate_threshold = float(os.getenv("RERANK_DUPLICATE_THRESHOLD", "0.8"))
+        # Share of relevance that comes from query term coverage rather than retrieval similarity
+        self.lexical_weight = float(os.getenv("RERANK_LEXICAL_WEIGHT", "0.3"))
+        self.model_name = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+        self.batch_size = int(os.getenv("RERANK_BATCH_SIZE", "16"))
+
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._model_failed = False
+
+        # Counters
+        self.calls = 0
+        self.over_budget = 0
+        self.duplicates_dropped = 0
+        self.model_calls = 0
+        self.total_ms = 0.0
+        self.last_ms = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    def candidate_count(self, k: int) -> int:
+        """How many results to retrieve for a final top ``k``."""
+        return max(k, self.candidates) if self.enabled else k
+
+    async def rerank(self, query: str, results: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+        """Pick the best ``k`` of ``results`` (best first) within the latency budget."""
+        if not self.enabled or len(results) <= 1:
+            return results[:k]
+
+        start = time.perf_counter()
+        deadline = start + self.budget_ms / 1000
+        query_terms = set(tokenize(query))
+        terms = [set(tokenize(result["text"])) for result in results]
+
+        relevance = self._lexical_relevance(query_terms, results, terms)
+        if self.mode == "cross_encoder":
+            model_scores = await self._model_relevance(query, results, deadline)
+            if model_scores is not None:
+                # Candidates the model had no time for keep their lexical relevance
+                relevance = [score if score is not None else lexical for score, lexical in zip(model_scores, relevance)]
+
+        picked = self._pick(results, relevance, terms, k, deadline)
+        reranked = [dict(results[index], rerank_score=relevance[index]) for index in picked]
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.calls += 1
+        self.total_ms += elapsed_ms
+        self.last_ms = elapsed_ms
+        if elapsed_ms > self.budget_ms:
+            self.over_budget += 1
+        logger.info(f"Reranked {len(results)} candidates to {len(reranked)} in {elapsed_ms:.1f} ms")
+        return reranked
+
+    def _lexical_relevance(
+        self,
+        query_terms: Set[str],
+        results: List[Dict[str, Any]],
+        terms: List[Set[str]]
+    ) -> List[float]:
+        """Retrieval similarity relative to the best candidate, blended with query term coverage."""
+        best = max(result.get("similarity", 0.0) for result in results) or 1.0
+        relevance = []
+        for result, chunk_terms in zip(results, terms):
+            coverage = len(query_terms & chunk_terms) / len(query_terms) if query_terms else 0.0
+            similarity = result.get("similarity", 0.0) / best
+            relevance.append((1 - self.lexical_weight) * similarity + self.lexical_weight * coverage)
+        return relevance
+
+    def _pick(
+        self,
+        results: List[Dict[str, Any]],
+        relevance: List[float],
+        terms: List[Set[str]],
+        k: int,
+        deadline: float
+    ) -> List[int]:
+        """Maximal marginal relevance selection of up to k indices, skipping near-duplicates."""
+        remaining = list(range(len(results)))
+        picked: List[int] = []
+        while remaining and len(picked) < k:
+            if time.perf_counter() > deadline:
+                # Out of time: fill up in retrieval order
+                picked.extend(remaining[:k - len(picked)])
+                break
+            best_index, best_score = None, -math.inf
+            for index in list(remaining):
+                redundancy = max((self._overlap(terms[index], terms[other]) for other in picked), default=0.0)
+                if redundancy >= self.duplicate_threshold:
+                    remaining.remove(index)
+                    self.duplicates_dropped += 1
+                    continue
+                score = self.mmr_lambda * relevance[index] - (1 - self.mmr_lambda) * redundancy
+                if score > best_score:
+                    best_index, best_score = index, score
+            if best_index is None:
+                break
+            picked.append(best_index)
+            remaining.remove(best_index)
+        return picked
+
+    @staticmethod
+    def _overlap(a: Set[str], b: Set[str]) -> float:
+        """Jaccard similarity of two term sets."""
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
+
+    async def _model_relevance(
+        self,
+        query: str,
+        results: List[Dict[str, Any]],
+        deadline: float
+    ) -> Optional[List[Optional[float]]]:
+        """Cross-encoder scores in (0, 1), None for candidates not scored before the deadline.
+
+        Returns None while the model is not loaded yet; loading starts in the
+        background on first use.
+        """
+        if self._model is None:
+            if not self._model_failed and not self._model_lock.locked():
+                asyncio.get_running_loop().run_in_executor(None, self._load_model)
+            return None
+        self.model_calls += 1
+        return await asyncio.to_thread(self._score, query, [result["text"] for result in results], deadline)
+
+    def _load_model(self) -> None:
+        with self._model_lock:
+            if self._model is not None or self._model_failed:
+                return
+            try:
+                # Optional dependency, only needed for the cross-encoder mode
+                from sentence_transformers import CrossEncoder
+                start = time.perf_counter()
+                self._model = CrossEncoder(self.model_name, device="cpu")
+                logger.info(f"Loaded rerank model {self.model_name} in {time.perf_counter() - start:.1f}s")
+            except Exception as e:
+                self._model_failed = True
+                logger.warning(f"Rerank model {self.model_name} unavailable, using lexical reranking: {str(e)}")
+
+    def _score(self, query: str, texts: List[str], deadline: float) -> List[Optional[float]]:
+        scores: List[Optional[float]] = [None] * len(texts)
+        for i in range(0, len(texts), self.batch_size):
+            if time.perf_counter() > deadline:
+                break
+            batch = self._model.predict([(query, text) for text in texts[i:i + self.batch_size]])
+            for j, logit in enumerate(batch):
+                scores[i + j] = 1.0 / (1.0 + math.exp(-float(logit)))
+        return scores
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "candidates": self.candidates,
+            "budget_ms": self.budget_ms,
+            "model": self.model_name if self.mode == "cross_encoder" else None,
+            "model_loaded": self._model is not None,
+            "calls": self.calls,
+            "model_calls": self.model_calls,
+            "over_budget": self.over_budget,
+            "duplicates_dropped": self.duplicates_dropped,
+            "avg_rerank_ms": self.total_ms / self.calls if self.calls else 0.0,
+            "last_rerank_ms": self.last_ms
+        }
+
+# Create a singleton instance
+reranker = Reranker()
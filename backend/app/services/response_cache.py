@@ -0,0 +1,245 @@
+from typing import Dict, List, Any, Optional, Tuple
+from collections import OrderedDict
+from pathlib import Path
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+import time
+import unicodedata
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# (document content hashes, language, page range): answers in one scope are
+# interchangeable for the same question
+Scope = Tuple[Tuple[str, ...], str, Optional[Tuple[int, int]]]
+
+class _Entry:
+    __slots__ = ("answer", "expires_at", "filenames")
+
+    def __init__(self, answer: str, expires_at: float, filenames: Tuple[str, ...]):
+        self.answer = answer
+        self.expires_at = expires_at
+        self.filenames = filenames
+
+def _unit_vector(embedding: List[float]):
+    """The embedding as a float32 numpy vector of length 1, None if it is all zeros."""
+    import numpy as np
+
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = float(np.linalg.norm(vector))
+    return vector / norm if norm else None
+
+class _ScopeIndex:
+    """Question embeddings of one scope's most recent entries, stacked for one matrix product per lookup."""
+
+    def __init__(self, max_candidates: int):
+        self.max_candidates = max_candidates
+        self.vectors: "OrderedDict[Tuple[Scope, str], Any]" = OrderedDict()
+        # Stacked vectors and their keys, rebuilt on the first lookup after a change
+        self._matrix = None
+        self._keys: List[Tuple[Scope, str]] = []
+
+    def add(self, key: Tuple[Scope, str], vector) -> None:
+        self.vectors[key] = vector
+        self.vectors.move_to_end(key)
+        # Older questions stay in the cache for exact matches only
+        while len(self.vectors) > self.max_candidates:
+            self.vectors.popitem(last=False)
+        self._matrix = None
+
+    def remove(self, key: Tuple[Scope, str]) -> None:
+        if self.vectors.pop(key, None) is not None:
+            self._matrix = None
+
+    def ranked(self, vector, threshold: float) -> List[Tuple[Scope, str]]:
+        """Keys of the questions at least ``threshold`` similar to ``vector``, most similar first."""
+        import numpy as np
+
+        if not self.vectors:
+            return []
+        if self._matrix is None:
+            self._keys = list(self.vectors)
+            self._matrix = np.stack(list(self.vectors.values()))
+        similarities = self._matrix @ vector
+        order = np.argsort(-similarities)
+        return [self._keys[i] for i in order if similarities[i] >= threshold]
+
+class ResponseCache:
+    """Answers to repeated questions, keyed by (document content, question, language).
+
+    Documents are identified by the hash of their uploaded file, so an answer
+    is never served for different content under the same name. With semantic
+    matching enabled, a question whose embedding is close enough to a cached
+    question in the same scope also hits. Entries expire after the TTL and are
+    dropped when one of their documents is deleted or re-indexed.
+    """
+
+    def __init__(self, upload_dir: Path = Path("app/uploads")):
+        self.upload_dir = upload_dir
+        self.enabled = os.getenv("RESPONSE_CACHE", "true").lower() == "true"
+        self.max_entries = int(os.getenv("RESPONSE_CACHE_SIZE", "1000"))
+        self.ttl_seconds = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+        # Cosine similarity a question needs to reuse another question's answer, 0 disables it
+        self.similarity_threshold = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0"))
+        # Most recent questions per scope compared by embedding; older ones only match exactly
+        self.max_semantic_candidates = int(os.getenv("RESPONSE_CACHE_SEMANTIC_CANDIDATES", "200"))
+        self._entries: "OrderedDict[Tuple[Scope, str], _Entry]" = OrderedDict()
+        self._semantic: Dict[Scope, _ScopeIndex] = {}
+        # Content hash per filename, valid while the file's (mtime, size) is unchanged
+        self._document_hashes: Dict[str, Tuple[Tuple[int, int], str]] = {}
+        self._lock = threading.Lock()
+
+        # Counters
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def normalize(question: str) -> str:
+        return " ".join(unicodedata.normalize("NFC", question).casefold().split())
+
+    async def scope(
+        self,
+        filenames: List[str],
+        language: str,
+        page_range: Optional[Tuple[int, int]] = None
+    ) -> Optional[Scope]:
+        """Scope for a question about these documents, None if a document is not on disk."""
+        hashes = []
+        for filename in sorted(set(filenames)):
+            content_hash = await self.document_hash(filename)
+            if content_hash is None:
+                return None
+            hashes.append(content_hash)
+        return tuple(hashes), language, page_range
+
+    async def document_hash(self, filename: str) -> Optional[str]:
+        """Content hash of an uploaded file, computed once per version of the file."""
+        try:
+            stat = await asyncio.to_thread((self.upload_dir / filename).stat)
+        except OSError:
+            return None
+        version = (stat.st_mtime_ns, stat.st_size)
+        known = self._document_hashes.get(filename)
+        if known is not None and known[0] == version:
+            return known[1]
+        content_hash = await asyncio.to_thread(self._hash_file, self.upload_dir / filename)
+        self._document_hashes[filename] = (version, content_hash)
+        return content_hash
+
+    @staticmethod
+    def _hash_file(path: Path) -> str:
+        """SHA-256 of the file, the same digest the ingestion cache uses."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1024 * 1024), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def get(self, scope: Scope, question: str, embedding: Optional[List[float]] = None) -> Optional[str]:
+        """Return the cached answer for a question, or None.
+
+        ``embedding`` is the question's embedding, only used for semantic matching.
+        """
+        key = (scope, self.normalize(question))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at < now:
+                self._remove(key)
+                entry = None
+            if entry is None and embedding and self.similarity_threshold > 0:
+                key, entry = self._closest(scope, embedding, now)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            if key[1] == self.normalize(question):
+                self.hits += 1
+            else:
+                self.semantic_hits += 1
+                logger.info(f"Semantic response cache hit for: {question[:50]}")
+            return entry.answer
+
+    def _closest(self, scope: Scope, embedding: List[float], now: float) -> Tuple[Any, Optional[_Entry]]:
+        """Most similar unexpired question in the scope above the threshold. Caller holds the lock."""
+        index = self._semantic.get(scope)
+        vector = _unit_vector(embedding) if index is not None else None
+        if vector is None:
+            return None, None
+        for key in index.ranked(vector, self.similarity_threshold):
+            entry = self._entries[key]
+            if entry.expires_at >= now:
+                return key, entry
+        return None, None
+
+    def _remove(self, key: Tuple[Scope, str]) -> None:
+        """Drop an entry and its embedding. Caller holds the lock."""
+        del self._entries[key]
+        index = self._semantic.get(key[0])
+        if index is not None:
+            index.remove(key)
+            if not index.vectors:
+                del self._semantic[key[0]]
+
+    def put(
+        self,
+        scope: Scope,
+        question: str,
+        answer: str,
+        filenames: List[str],
+        embedding: Optional[List[float]] = None
+    ) -> None:
+        key = (scope, self.normalize(question))
+        entry = _Entry(answer, time.monotonic() + self.ttl_seconds, tuple(filenames))
+        vector = _unit_vector(embedding) if embedding and self.similarity_threshold > 0 else None
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            if vector is not None:
+                self._semantic.setdefault(scope, _ScopeIndex(self.max_semantic_candidates)).add(key, vector)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate_document(self, filename: str) -> int:
+        """Drop answers that used a document, e.g. after it was deleted or re-indexed."""
+        with self._lock:
+            self._document_hashes.pop(filename, None)
+            stale = [key for key, entry in self._entries.items() if filename in entry.filenames]
+            for key in stale:
+                self._remove(key)
+        self.invalidated += len(stale)
+        if stale:
+            logger.info(f"Dropped {len(stale)} cached responses for {filename}")
+        return len(stale)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "similarity_threshold": self.similarity_threshold,
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "invalidated": self.invalidated,
+            "hit_rate": (self.hits + self.semantic_hits) / lookups if lookups else 0.0
+        }
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._semantic.clear()
+        return removed
+
+# Create a singleton instance
+response_cache = ResponseCache()
@@ -0,0 +1,79 @@
+from typing import List, Tuple
+from bisect import bisect_left
+import logging
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Preferred places to end a chunk, best first
+SEPARATORS = ["\n\n", "\n", ". ", "! ", "? ", "; ", ": ", ", ", " "]
+
+class TokenChunker:
+    """Splits text into chunks of at most ``chunk_tokens`` tokens.
+
+    The text is encoded once and chunks are cut by slicing the token array,
+    so candidate chunks are never re-encoded. Each cut is moved back to the
+    nearest separator in the second half of the chunk so chunks end on
+    paragraph, sentence or word boundaries where possible.
+    """
+
+    def __init__(self, tokenizer, chunk_tokens: int = 128, overlap_tokens: int = 25):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens must be smaller than chunk_tokens")
+        self.tokenizer = tokenizer
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+
+    def split(self, text: str) -> List[Tuple[int, int, int]]:
+        """Return (char start, char end, token count) for each chunk of ``text``."""
+        tokens = self.tokenizer.encode_ordinary(text)
+        if not tokens:
+            return []
+        # Character offset where each token starts, plus the end of the text
+        _, offsets = self.tokenizer.decode_with_offsets(tokens)
+        offsets = list(offsets) + [len(text)]
+        total = len(tokens)
+
+        spans: List[Tuple[int, int, int]] = []
+        start_token = 0
+        while start_token < total:
+            end_token = min(start_token + self.chunk_tokens, total)
+            if end_token < total:
+                end_token = self._snap(text, offsets, start_token, end_token)
+                end_token = self._align(offsets, end_token, start_token + 1)
+
+            char_start, char_end = offsets[start_token], offsets[end_token]
+            chunk = text[char_start:char_end]
+            stripped = chunk.strip()
+            if stripped:
+                char_start += len(chunk) - len(chunk.lstrip())
+                spans.append((char_start, char_start + len(stripped), end_token - start_token))
+
+            if end_token >= total:
+                break
+            start_token = self._align(offsets, max(end_token - self.overlap_tokens, start_token + 1), start_token + 1)
+        return spans
+
+    @staticmethod
+    def _align(offsets: List[int], token: int, lowest: int) -> int:
+        """Move a token boundary back so it does not split a character across tokens."""
+        aligned = token
+        while aligned > lowest and offsets[aligned] == offsets[aligned - 1]:
+            aligned -= 1
+        return aligned if offsets[aligned] != offsets[aligned - 1] else token
+
+    def _snap(self, text: str, offsets: List[int], start_token: int, end_token: int) -> int:
+        """Move a chunk end back to the best separator in the second half of the chunk."""
+        window_start = offsets[start_token + (end_token - start_token) // 2]
+        window_end = offsets[end_token]
+        for separator in SEPARATORS:
+            position = text.rfind(separator, window_start, window_end)
+            if position >= 0:
+                # End after the punctuation but before the whitespace, which
+                # tokenizers usually attach to the start of the next token
+                boundary = position + len(separator.rstrip())
+                snapped = bisect_left(offsets, boundary, start_token + 1, end_token)
+                if snapped > start_token:
+                    return snapped
+        return end_token
@@ -0,0 +1,395 @@
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+class Span:
+    """One timed stage of a request, with its parent, attributes and events."""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "attributes", "events", "error",
+                 "start_ns", "end_ns", "_perf_start")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        # (event name, nanoseconds after the span started)
+        self.events: List[Tuple[str, int]] = []
+        self.error: Optional[str] = None
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self._perf_start = time.perf_counter_ns()
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def event(self, name: str) -> None:
+        """Mark a point in time within the span, such as the first streamed token."""
+        self.events.append((name, time.perf_counter_ns() - self._perf_start))
+
+    def finish(self) -> None:
+        self.end_ns = self.start_ns + (time.perf_counter_ns() - self._perf_start)
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns if self.end_ns is not None else self.start_ns + (time.perf_counter_ns() - self._perf_start)
+        return (end_ns - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        """The span in OpenTelemetry's JSON field names."""
+        return {
+            "traceId": self.trace.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id,
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": self.end_ns,
+            "durationMs": round(self.duration_ms, 3),
+            "attributes": {"request_id": self.trace.request_id, **self.attributes},
+            "events": [
+                {"name": name, "timeUnixNano": self.start_ns + offset_ns} for name, offset_ns in self.events
+            ],
+            "status": {"code": "ERROR", "message": self.error} if self.error else {"code": "OK"}
+        }
+
+class Trace:
+    """Spans of one request or job, exported together once its root span ends."""
+
+    __slots__ = ("trace_id", "request_id", "spans", "dropped")
+
+    def __init__(self, request_id: Optional[str]):
+        self.trace_id = os.urandom(16).hex()
+        self.request_id = request_id or self.trace_id
+        # Finished spans; children finish (and are appended) before their parents
+        self.spans: List[Span] = []
+        self.dropped = 0
+
+class _NoopSpan:
+    """Returned when tracing is off, so callers never have to check."""
+
+    def set(self, **attributes: Any) -> None:
+        pass
+
+    def event(self, name: str) -> None:
+        pass
+
+NOOP_SPAN = _NoopSpan()
+
+# Span the current task (and tasks or threads it starts) is working in
+_current_span: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+def current_request_id() -> Optional[str]:
+    """Request id of the trace the current task belongs to, if any."""
+    span = _current_span.get()
+    return span.trace.request_id if span is not None else None
+
+class ConsoleExporter:
+    """Logs each trace as an indented tree of spans."""
+
+    def export(self, trace: Trace) -> None:
+        children: Dict[Optional[str], List[Span]] = {}
+        for span in sorted(trace.spans, key=lambda span: span.start_ns):
+            children.setdefault(span.parent_id, []).append(span)
+        lines = [f"Trace {trace.request_id}:"]
+
+        def add(parent_id: Optional[str], depth: int) -> None:
+            for span in children.get(parent_id, []):
+                events = "".join(f", {name} at {offset_ns / 1e6:.0f} ms" for name, offset_ns in span.events)
+                error = f" ERROR {span.error}" if span.error else ""
+                lines.append(f"{'  ' * depth}{span.name} {span.duration_ms:.1f} ms{events}{error}")
+                add(span.span_id, depth + 1)
+
+        add(None, 1)
+        logger.info("\n".join(lines))
+
+    def shutdown(self) -> None:
+        pass
+
+class FileExporter:
+    """Appends spans as JSON lines, one span per line, in OpenTelemetry's field names."""
+
+    def __init__(self, path: Path):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, trace: Trace) -> None:
+        for span in trace.spans:
+            self._file.write(json.dumps(span.to_dict(), default=str) + "\n")
+        self._file.flush()
+
+    def shutdown(self) -> None:
+        self._file.close()
+
+class OpenTelemetryExporter:
+    """Replays finished traces into the OpenTelemetry SDK, which sends them over OTLP.
+
+    The endpoint and headers come from the standard OTEL_EXPORTER_OTLP_*
+    variables. Needs opentelemetry-sdk and opentelemetry-exporter-otlp.
+    """
+
+    def __init__(self):
+        from opentelemetry import trace as otel_trace
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+        from opentelemetry.trace import Status, StatusCode
+
+        resource = Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "pdf-chatbot-api")})
+        self._provider = TracerProvider(resource=resource)
+        self._provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+        self._tracer = self._provider.get_tracer(__name__)
+        self._set_span_in_context = otel_trace.set_span_in_context
+        self._error_status = lambda message: Status(StatusCode.ERROR, message)
+
+    def export(self, trace: Trace) -> None:
+        started: Dict[str, Any] = {}
+        # Parents first: they start before their children and were appended after them
+        for span in sorted(reversed(trace.spans), key=lambda span: span.start_ns):
+            parent = started.get(span.parent_id)
+            otel_span = self._tracer.start_span(
+                span.name,
+                context=self._set_span_in_context(parent) if parent is not None else None,
+                start_time=span.start_ns,
+                attributes={"request_id": trace.request_id, **span.attributes}
+            )
+            for name, offset_ns in span.events:
+                otel_span.add_event(name, timestamp=span.start_ns + offset_ns)
+            if span.error:
+                otel_span.set_status(self._error_status(span.error))
+            started[span.span_id] = otel_span
+        for span in trace.spans:
+            started[span.span_id].end(end_time=span.end_ns)
+
+    def shutdown(self) -> None:
+        self._provider.shutdown()
+
+class Tracer:
+    """Request-scoped latency tracing.
+
+    ``trace`` opens the root span of a request or ingestion job and
+    ``span`` times a stage within it; the current span is carried in a
+    context variable, so stages running in other tasks or worker threads
+    nest under the right parent. Every span feeds per-stage latency
+    statistics. Finished traces are kept in memory for the admin API and,
+    when an exporter is configured, written out by a background thread so
+    the event loop never waits on it. Spans outside a trace are only
+    counted in the statistics.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("TRACING", "true").lower() == "true"
+        # none | console | file | otlp
+        self.exporter_name = os.getenv("TRACE_EXPORTER", "none")
+        self.trace_file = Path(os.getenv("TRACE_FILE", "logs/traces.jsonl"))
+        # Share of traces exported, and the duration below which traces are not exported
+        self.sample_rate = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+        self.min_export_ms = float(os.getenv("TRACE_MIN_MS", "0"))
+        self.max_spans = int(os.getenv("TRACE_MAX_SPANS", "256"))
+
+        self.recent: Deque[Trace] = deque(maxlen=int(os.getenv("TRACE_RECENT", "50")))
+        # span name -> {"count", "errors", "total_ms", "max_ms", "recent" durations}
+        self._stages: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        self._exporter = None
+        self._queue: "queue.SimpleQueue[Optional[Trace]]" = queue.SimpleQueue()
+        self._worker: Optional[threading.Thread] = None
+
+        # Counters
+        self.traces = 0
+        self.exported = 0
+        self.export_errors = 0
+
+    @contextmanager
+    def trace(self, name: str, request_id: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+        """Root span of a request; nests like ``span`` when a trace is already open."""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        parent = _current_span.get()
+        trace = parent.trace if parent is not None else Trace(request_id)
+        span = None
+        try:
+            with self._open(trace, name, parent, attributes) as span:
+                yield span
+        finally:
+            if parent is None and span is not None:
+                self._finish(trace, span)
+
+    @contextmanager
+    def span(self, name: str, **attributes: Any) -> Iterator[Span]:
+        """Time a stage of the current request."""
+        if not self.enabled:
+            yield NOOP_SPAN
+            return
+        parent = _current_span.get()
+        if parent is None:
+            # Not part of a traced request: statistics only
+            span = Span(Trace(None), name, None, attributes)
+            try:
+                yield span
+            except Exception as e:
+                span.error = f"{type(e).__name__}: {str(e)}"
+                raise
+            finally:
+                span.finish()
+                self._record(span)
+            return
+        with self._open(parent.trace, name, parent, attributes) as span:
+            yield span
+
+    @contextmanager
+    def _open(self, trace: Trace, name: str, parent: Optional[Span], attributes: Dict[str, Any]) -> Iterator[Span]:
+        span = Span(trace, name, parent.span_id if parent is not None else None, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {str(e)}"
+            raise
+        finally:
+            span.finish()
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Closed from another context, e.g. a stream finalized after the client left
+                _current_span.set(parent)
+            # The root span, which finishes last, is always kept
+            if len(trace.spans) < self.max_spans or parent is None:
+                trace.spans.append(span)
+            else:
+                trace.dropped += 1
+            self._record(span)
+
+    def _record(self, span: Span) -> None:
+        duration_ms = span.duration_ms
+        with self._lock:
+            self._add_timing(span.name, duration_ms, span.error is not None)
+            for name, offset_ns in span.events:
+                self._add_timing(f"{span.name}:{name}", offset_ns / 1e6, False)
+
+    def _add_timing(self, name: str, duration_ms: float, error: bool) -> None:
+        stage = self._stages.get(name)
+        if stage is None:
+            stage = self._stages[name] = {
+                "count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "recent": deque(maxlen=1000)
+            }
+        stage["count"] += 1
+        stage["errors"] += int(error)
+        stage["total_ms"] += duration_ms
+        stage["max_ms"] = max(stage["max_ms"], duration_ms)
+        stage["recent"].append(duration_ms)
+
+    def _finish(self, trace: Trace, root: Span) -> None:
+        with self._lock:
+            self.traces += 1
+            self.recent.append(trace)
+        if self.exporter_name == "none" or root.duration_ms < self.min_export_ms:
+            return
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        if self._worker is None:
+            with self._lock:
+                if self._worker is None:
+                    self._worker = threading.Thread(target=self._export_loop, name="trace-exporter", daemon=True)
+                    self._worker.start()
+        self._queue.put(trace)
+
+    def _create_exporter(self):
+        if self.exporter_name == "otlp":
+            try:
+                return OpenTelemetryExporter()
+            except ImportError as e:
+                logger.warning(f"OpenTelemetry is not installed ({str(e)}), writing traces to {self.trace_file}")
+                return FileExporter(self.trace_file)
+        if self.exporter_name == "file":
+            return FileExporter(self.trace_file)
+        return ConsoleExporter()
+
+    def _export_loop(self) -> None:
+        self._exporter = self._create_exporter()
+        while (trace := self._queue.get()) is not None:
+            try:
+                self._exporter.export(trace)
+                self.exported += 1
+            except Exception as e:
+                self.export_errors += 1
+                logger.error(f"Failed to export trace {trace.request_id}: {str(e)}")
+        self._exporter.shutdown()
+
+    def shutdown(self, timeout: float = 5.0) -> None:
+        """Export the traces still queued and close the exporter."""
+        if self._worker is not None:
+            self._queue.put(None)
+            self._worker.join(timeout)
+
+    def get_trace(self, request_id: str) -> Optional[Dict[str, Any]]:
+        """Spans of a recent trace, in start order."""
+        with self._lock:
+            trace = next((trace for trace in reversed(self.recent) if trace.request_id == request_id), None)
+        if trace is None:
+            return None
+        return {
+            "request_id": trace.request_id,
+            "trace_id": trace.trace_id,
+            "dropped_spans": trace.dropped,
+            "spans": [span.to_dict() for span in sorted(trace.spans, key=lambda span: span.start_ns)]
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {name: dict(stage, recent=sorted(stage["recent"])) for name, stage in self._stages.items()}
+            recent = list(self.recent)
+        return {
+            "enabled": self.enabled,
+            "exporter": self.exporter_name,
+            "sample_rate": self.sample_rate,
+            "traces": self.traces,
+            "exported": self.exported,
+            "export_errors": self.export_errors,
+            "stages": {
+                name: {
+                    "count": stage["count"],
+                    "errors": stage["errors"],
+                    "avg_ms": round(stage["total_ms"] / stage["count"], 2),
+                    "p50_ms": round(self._percentile(stage["recent"], 0.5), 2),
+                    "p95_ms": round(self._percentile(stage["recent"], 0.95), 2),
+                    "max_ms": round(stage["max_ms"], 2)
+                }
+                for name, stage in sorted(stages.items())
+            },
+            "recent": [
+                {
+                    "request_id": trace.request_id,
+                    "name": trace.spans[-1].name if trace.spans else None,
+                    "duration_ms": round(trace.spans[-1].duration_ms, 1) if trace.spans else None,
+                    "spans": len(trace.spans)
+                }
+                for trace in reversed(recent)
+            ]
+        }
+
+    @staticmethod
+    def _percentile(durations: List[float], fraction: float) -> float:
+        """Percentile of sorted durations (over the most recent ones)."""
+        if not durations:
+            return 0.0
+        return durations[min(len(durations) - 1, int(len(durations) * fraction))]
+
+# Create a singleton instance
+tracer = Tracer()
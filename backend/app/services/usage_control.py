@@ -0,0 +1,311 @@
+from typing import Deque, Dict, List, Any, Iterator, Optional
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, date, timedelta
+from pathlib import Path
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+import tiktoken
+
+from app.services.tracing import current_request_id
+from app.utils.lazy import Lazy
+
+# Set up basic logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+TOKEN_FIELDS = ("prompt_tokens", "completion_tokens", "embedding_tokens", "translation_tokens")
+
+class UsageRecord:
+    """Tokens and cost of one chat request or ingestion job."""
+
+    __slots__ = ("request_id", "kind", "documents", "started_at", "cached", "cost", *TOKEN_FIELDS)
+
+    def __init__(self, kind: str, documents: List[str]):
+        # Same id as the request's trace, so usage and timings can be matched up
+        self.request_id = current_request_id() or uuid.uuid4().hex
+        self.kind = kind  # chat | ingest
+        self.documents = documents
+        self.started_at = time.time()
+        self.cached = False
+        self.cost = 0.0
+        for field in TOKEN_FIELDS:
+            setattr(self, field, 0)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "request_id": self.request_id,
+            "kind": self.kind,
+            "documents": self.documents,
+            "started_at": datetime.fromtimestamp(self.started_at).isoformat(),
+            "cached": self.cached,
+            **{field: getattr(self, field) for field in TOKEN_FIELDS},
+            "cost_usd": round(self.cost, 6)
+        }
+
+def _empty_totals() -> Dict[str, Any]:
+    return {"requests": 0, **{field: 0 for field in TOKEN_FIELDS}, "cost_usd": 0.0}
+
+# Request or job the current task is working for
+_current_record: ContextVar[Optional[UsageRecord]] = ContextVar("usage_record", default=None)
+
+class UsageControl:
+    """Token usage, cost and budget for all OpenAI calls.
+
+    Chat, translation and embedding calls report their tokens here. Usage
+    is aggregated per day, per document and per request (the request or
+    ingestion job running in the current task, see ``track``). Chat
+    requests reserve their worst-case cost before they are sent, so
+    concurrent requests cannot overrun the daily or monthly budget. Daily
+    totals are also added up in SQLite and reloaded at startup, so the
+    budget survives restarts.
+    """
+
+    def __init__(self, db_path: Optional[Path] = None):
+        # Load configuration from environment
+        self.max_daily_cost = float(os.getenv("MAX_DAILY_COST", "1.0"))
+        self.max_monthly_cost = float(os.getenv("MAX_MONTHLY_COST", "20.0"))
+        # Completion token cap per chat request, also the completion size budgeted before sending
+        self.max_tokens_per_request = int(os.getenv("MAX_TOKENS_PER_REQUEST", "2000"))
+        self.max_recent_requests = int(os.getenv("USAGE_RECENT_REQUESTS", "200"))
+        # Documents with usage totals kept; the least recently used are dropped beyond this
+        self.max_documents = int(os.getenv("USAGE_MAX_DOCUMENTS", "1000"))
+
+        # GPT-3.5 Turbo and text-embedding-3-large pricing (per 1K tokens)
+        self.input_price_per_1k = float(os.getenv("CHAT_INPUT_PRICE_PER_1K", "0.0005"))
+        self.output_price_per_1k = float(os.getenv("CHAT_OUTPUT_PRICE_PER_1K", "0.0015"))
+        self.embedding_price_per_1k = float(os.getenv("EMBEDDING_PRICE_PER_1K", "0.00013"))
+
+        # Aggregates
+        self.totals = _empty_totals()
+        self.days: Dict[str, Dict[str, Any]] = {}
+        self.documents: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.recent_requests: Deque[UsageRecord] = deque(maxlen=self.max_recent_requests)
+        self.reserved_cost = 0.0
+        self.rejected_requests = 0
+        # Reentrant: the budget checks read the daily and monthly cost under it
+        self._lock = threading.RLock()
+
+        db_path = db_path or Path(os.getenv("USAGE_DB", "app/cache/usage.db"))
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(db_path), check_same_thread=False, timeout=5, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join(f"{field} INTEGER NOT NULL DEFAULT 0" for field in ("requests", *TOKEN_FIELDS))
+        self._conn.execute(f"""
+            CREATE TABLE IF NOT EXISTS usage_days (
+                day TEXT PRIMARY KEY,
+                {columns},
+                cost_usd REAL NOT NULL DEFAULT 0
+            )
+        """)
+        self._load_days()
+
+        # Initialize tokenizer
+        self.tokenizer = tiktoken.get_encoding("cl100k_base")
+
+    def count_tokens(self, text: str) -> int:
+        """Count tokens in text using tiktoken."""
+        return len(self.tokenizer.encode_ordinary(text))
+
+    def calculate_cost(self, input_tokens: int, output_tokens: int, embedding_tokens: int = 0) -> float:
+        """Calculate cost in USD for token usage."""
+        input_cost = (input_tokens / 1000) * self.input_price_per_1k
+        output_cost = (output_tokens / 1000) * self.output_price_per_1k
+        embedding_cost = (embedding_tokens / 1000) * self.embedding_price_per_1k
+        return input_cost + output_cost + embedding_cost
+
+    @contextmanager
+    def track(self, kind: str, documents: List[str]) -> Iterator[UsageRecord]:
+        """Attribute usage reported by this task (and tasks it starts) to a new request record."""
+        record = UsageRecord(kind, documents)
+        token = _current_record.set(record)
+        try:
+            yield record
+        finally:
+            _current_record.reset(token)
+            with self._lock:
+                self.recent_requests.append(record)
+                if kind == "chat":
+                    today = self._today()
+                    self._bucket(self.days, today)["requests"] += 1
+                    self._save_day(today, {"requests": 1})
+                    self.totals["requests"] += 1
+                    for document in documents:
+                        self._bucket(self.documents, document)["requests"] += 1
+
+    @staticmethod
+    def current() -> Optional[UsageRecord]:
+        return _current_record.get()
+
+    def log_usage(self, prompt_tokens: int = 0, completion_tokens: int = 0, embedding_tokens: int = 0, reserved_cost: float = 0.0):
+        """Record chat completion and embedding tokens, releasing the cost reserved for the request."""
+        with self._lock:
+            self.reserved_cost = max(0.0, self.reserved_cost - reserved_cost)
+        if prompt_tokens or completion_tokens:
+            self._add(
+                self.calculate_cost(prompt_tokens, completion_tokens),
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens
+            )
+        if embedding_tokens:
+            self.log_embedding(embedding_tokens)
+
+    def log_embedding(self, tokens: int) -> None:
+        self._add(self.calculate_cost(0, 0, tokens), embedding_tokens=tokens)
+
+    def log_translation(self, prompt_tokens: int, completion_tokens: int) -> None:
+        """Translation calls use the chat model and are billed like chat tokens."""
+        self._add(
+            self.calculate_cost(prompt_tokens, completion_tokens),
+            translation_tokens=prompt_tokens + completion_tokens
+        )
+
+    def _add(self, cost: float, **tokens: int) -> None:
+        record = _current_record.get()
+        with self._lock:
+            today = self._today()
+            for bucket in (self.totals, self._bucket(self.days, today)):
+                self._accumulate(bucket, tokens, cost)
+            self._save_day(today, {**tokens, "cost_usd": cost})
+            if record is not None:
+                # A request about several documents is split evenly between them
+                for document in record.documents:
+                    self._accumulate(self._bucket(self.documents, document), tokens, cost, 1 / len(record.documents))
+                for field, count in tokens.items():
+                    setattr(record, field, getattr(record, field) + count)
+                record.cost += cost
+
+        logger.info(
+            f"Token usage: {tokens}, cost ${cost:.6f}, today ${self.daily_cost():.4f} "
+            f"of ${self.max_daily_cost:.2f}"
+        )
+
+    @staticmethod
+    def _accumulate(bucket: Dict[str, Any], tokens: Dict[str, int], cost: float, share: float = 1.0) -> None:
+        for field, count in tokens.items():
+            bucket[field] += count * share if share != 1.0 else count
+        bucket["cost_usd"] += cost * share
+
+    @staticmethod
+    def _today() -> str:
+        return date.today().isoformat()
+
+    def _bucket(self, buckets: Dict[str, Dict[str, Any]], key: str) -> Dict[str, Any]:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = _empty_totals()
+            if buckets is self.days:
+                # Keep two months of daily totals for the monthly budget and reporting
+                cutoff = self._days_cutoff()
+                for day in [day for day in buckets if day < cutoff]:
+                    del buckets[day]
+                self._execute("DELETE FROM usage_days WHERE day < ?", (cutoff,))
+            elif buckets is self.documents:
+                while len(buckets) > self.max_documents:
+                    buckets.popitem(last=False)
+        elif buckets is self.documents:
+            buckets.move_to_end(key)
+        return bucket
+
+    @staticmethod
+    def _days_cutoff() -> str:
+        return (date.today() - timedelta(days=62)).isoformat()
+
+    def _load_days(self) -> None:
+        fields = ("requests", *TOKEN_FIELDS, "cost_usd")
+        rows = self._conn.execute(
+            f"SELECT day, {', '.join(fields)} FROM usage_days WHERE day >= ?", (self._days_cutoff(),)
+        ).fetchall()
+        for day, *values in rows:
+            self.days[day] = dict(zip(fields, values))
+        if rows:
+            logger.info(f"Loaded usage of {len(rows)} days, this month ${self.monthly_cost():.4f}")
+
+    def _save_day(self, day: str, delta: Dict[str, Any]) -> None:
+        """Add usage to the stored totals of a day. Caller holds the lock."""
+        columns = ", ".join(delta)
+        updates = ", ".join(f"{column} = {column} + excluded.{column}" for column in delta)
+        self._execute(
+            f"INSERT INTO usage_days (day, {columns}) VALUES (?{', ?' * len(delta)}) "
+            f"ON CONFLICT(day) DO UPDATE SET {updates}",
+            (day, *delta.values())
+        )
+
+    def _execute(self, sql: str, parameters: tuple) -> None:
+        try:
+            self._conn.execute(sql, parameters)
+        except sqlite3.Error as e:
+            # Accounting in memory carries on; only the copy that survives restarts is behind
+            logger.warning(f"Failed to store usage: {str(e)}")
+
+    def forget_document(self, document: str) -> None:
+        """Drop the usage totals of a deleted document."""
+        with self._lock:
+            self.documents.pop(document, None)
+
+    def daily_cost(self) -> float:
+        with self._lock:
+            return self.days.get(self._today(), {}).get("cost_usd", 0.0)
+
+    def monthly_cost(self) -> float:
+        month = self._today()[:7]
+        with self._lock:
+            return sum(bucket["cost_usd"] for day, bucket in self.days.items() if day.startswith(month))
+
+    def estimate_chat_cost(self, prompt_tokens: int) -> float:
+        """Worst-case cost of a chat request: its prompt plus a full-length completion."""
+        return self.calculate_cost(prompt_tokens, self.max_tokens_per_request)
+
+    def within_budget(self, estimated_cost: float = 0.0) -> bool:
+        """Whether spending ``estimated_cost`` more keeps today and this month within budget."""
+        committed = self.reserved_cost + estimated_cost
+        return (
+            self.daily_cost() + committed <= self.max_daily_cost
+            and self.monthly_cost() + committed <= self.max_monthly_cost
+        )
+
+    def check_cost_limit(self, estimated_cost: float) -> bool:
+        """Reserve ``estimated_cost`` if it fits in the budget; release it with log_usage."""
+        with self._lock:
+            if not self.within_budget(estimated_cost):
+                self.rejected_requests += 1
+                logger.warning(
+                    f"Cost limit reached: today ${self.daily_cost():.4f}, reserved ${self.reserved_cost:.4f}, "
+                    f"request up to ${estimated_cost:.4f}"
+                )
+                return False
+            self.reserved_cost += estimated_cost
+            return True
+
+    def stats(self, days: int = 31, documents: int = 50, requests: int = 50) -> Dict[str, Any]:
+        with self._lock:
+            recent_days = sorted(self.days.items(), reverse=True)[:days]
+            top_documents = sorted(self.documents.items(), key=lambda item: item[1]["cost_usd"], reverse=True)[:documents]
+            recent_requests = [record.to_dict() for record in list(self.recent_requests)[-requests:]]
+        return {
+            "budget": {
+                "max_daily_cost": self.max_daily_cost,
+                "max_monthly_cost": self.max_monthly_cost,
+                "daily_cost": round(self.daily_cost(), 6),
+                "monthly_cost": round(self.monthly_cost(), 6),
+                "reserved_cost": round(self.reserved_cost, 6),
+                "rejected_requests": self.rejected_requests
+            },
+            "totals": self._rounded(self.totals),
+            "days": {day: self._rounded(bucket) for day, bucket in recent_days},
+            "documents": {document: self._rounded(bucket) for document, bucket in top_documents},
+            "requests": recent_requests
+        }
+
+    @staticmethod
+    def _rounded(bucket: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: round(value, 6) if isinstance(value, float) else value for key, value in bucket.items()}
+
+# Create a singleton instance on first use, see app.utils.lazy
+usage_control: UsageControl = Lazy(UsageControl, "usage_control")
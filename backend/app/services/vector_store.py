@@ -1,17 +1,19 @@
-from typing import List, Dict, Any, Tuple
-import chromadb
-from chromadb.config import Settings
-from chromadb.utils import embedding_functions
+from typing import List, Dict, Any, Tuple, Callable, Optional
 import os
 from pathlib import Path
 import re
-import openai
-from openai import AsyncOpenAI
+import hashlib
 import asyncio
 from tenacity import retry, stop_after_attempt, wait_exponential
 import tiktoken
 import logging
 import traceback
+from app.services.embedding_cache import embedding_cache, query_embedding_cache, EmbeddingCache
+import time
+from app.services.embedding_scheduler import embedding_scheduler
+from app.services.lexical_index import lexical_index, tokenize
+from app.services.tracing import tracer
+from app.utils.lazy import Lazy
 
 # Set up basic logging
 logging.basicConfig(level=logging.INFO)
@@ -19,26 +21,203 @@ logger = logging.getLogger(__name__)
 
 class VectorStore:
     def __init__(self, persist_dir: Path = Path("app/chroma_db")):
+        # Imported here rather than at module level: chromadb alone takes seconds to import
+        import chromadb
+        from chromadb.config import Settings
+        from chromadb.utils import embedding_functions
+        from openai import AsyncOpenAI
+        from app.services.chroma_embedding import CachedEmbeddingFunction
+
         self.persist_dir = persist_dir
         self.persist_dir.mkdir(exist_ok=True)
-        self.client = chromadb.Client(Settings(
-            persist_directory=str(persist_dir),
-            anonymized_telemetry=False
-        ))
+        if os.getenv("VECTOR_STORE_PERSISTENT", "true").lower() == "true":
+            # Keeps vectors on disk so the index survives restarts
+            self.client = chromadb.PersistentClient(
+                path=str(persist_dir),
+                settings=Settings(anonymized_telemetry=False)
+            )
+        else:
+            self.client = chromadb.Client(Settings(anonymized_telemetry=False))
         # Use OpenAI embeddings - multilingual model
         self.openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-        self.embedding_function = embedding_functions.OpenAIEmbeddingFunction(
-            api_key=os.getenv("OPENAI_API_KEY"),
-            model_name="text-embedding-3-large",  # 1536 dimensions
-            organization_id=os.getenv("OPENAI_ORG_ID")  # Optional
+        self.embedding_model = "text-embedding-3-large"
+        # Identical chunk and query texts are served from the shared embedding cache
+        self.embedding_function = CachedEmbeddingFunction(
+            embedding_functions.OpenAIEmbeddingFunction(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                model_name=self.embedding_model,  # 3072 dimensions
+                organization_id=os.getenv("OPENAI_ORG_ID")  # Optional
+            ),
+            model_name=self.embedding_model,
+            cache=embedding_cache
         )
         # Initialize tokenizer for counting tokens
         self.tokenizer = tiktoken.get_encoding("cl100k_base")
 
+        # "unified": one collection for all documents, filtered by metadata
+        # "per_file": one collection per file and language (legacy layout)
+        self.index_mode = os.getenv("VECTOR_INDEX_MODE", "unified")
+        self.unified_collection_name = "documents"
+        self._unified_collection = None
+
+        # "hybrid": vector and BM25 keyword search fused by reciprocal rank
+        # "dense": vector search only
+        self.retrieval_mode = os.getenv("RETRIEVAL_MODE", "hybrid")
+        self.rrf_k = int(os.getenv("RRF_K", "60"))
+        # Short queries with an identifier (clause or part number, ...) that a chunk
+        # fully matches are answered from the keyword index without embedding the query
+        self.lexical_shortcut_max_terms = int(os.getenv("LEXICAL_SHORTCUT_MAX_TERMS", "4"))
+        self.lexical_shortcuts = 0
+
     def count_tokens(self, text: str) -> int:
         """Count tokens in text using tiktoken."""
         return len(self.tokenizer.encode(text))
 
+    async def embed_documents(
+        self,
+        texts: List[str],
+        token_counts: Optional[List[int]] = None,
+        progress_callback: Optional[Callable[[float], None]] = None
+    ) -> List[List[float]]:
+        """Embed texts through the embedding cache, sending only misses to the API."""
+        embeddings = await asyncio.to_thread(embedding_cache.get_many, self.embedding_model, texts)
+
+        # Embed each distinct missing text once
+        missing: Dict[str, int] = {}
+        for i, (text, embedding) in enumerate(zip(texts, embeddings)):
+            if embedding is None:
+                missing.setdefault(EmbeddingCache.text_hash(text), i)
+        logger.info(f"Embedding cache: {len(texts) - len(missing)} of {len(texts)} texts cached")
+
+        if missing:
+            missing_texts = [texts[i] for i in missing.values()]
+            missing_counts = [token_counts[i] for i in missing.values()] if token_counts else None
+            vectors = await embedding_scheduler.embed(missing_texts, missing_counts, progress_callback)
+            await asyncio.to_thread(embedding_cache.put_many, self.embedding_model, missing_texts, vectors)
+            computed = dict(zip(missing.keys(), vectors))
+            embeddings = [
+                embedding if embedding is not None else computed[EmbeddingCache.text_hash(text)]
+                for text, embedding in zip(texts, embeddings)
+            ]
+        elif progress_callback:
+            progress_callback(1.0)
+
+        return embeddings
+
+    async def embed_query(self, query: str) -> List[float]:
+        """Embed a search query once, served from the query LRU cache when possible."""
+        with tracer.span("embed_query") as span:
+            embedding = query_embedding_cache.get(self.embedding_model, query)
+            span.set(cached=embedding is not None)
+            if embedding is not None:
+                return embedding
+
+            start = time.perf_counter()
+            embedding = (await self.embed_documents([query]))[0]
+            embed_ms = (time.perf_counter() - start) * 1000
+        query_embedding_cache.put(self.embedding_model, query, embedding, embed_ms)
+        logger.info(f"Query embedded in {embed_ms:.0f} ms")
+        return embedding
+
+    @staticmethod
+    def document_id(filename: str) -> str:
+        """Stable id for a document, used as metadata filter and chunk id prefix."""
+        return hashlib.sha1(filename.encode("utf-8")).hexdigest()[:16]
+
+    def _get_unified_collection(self):
+        if self._unified_collection is None:
+            self._unified_collection = self.client.get_or_create_collection(
+                name=self.unified_collection_name,
+                embedding_function=self.embedding_function
+            )
+        return self._unified_collection
+
+    def _matching_collections(self, filename: str) -> List[str]:
+        """Names of the per-file collections (all languages) that belong to a file."""
+        base_name = self._sanitize_collection_name(filename)
+        # Compare the name without its language suffix so "report" doesn't match "report_final"
+        return [
+            c.name for c in self.client.list_collections()
+            if c.name.rsplit('_', 1)[0] == base_name
+        ]
+
+    async def list_documents(self) -> set:
+        """Return the filenames that have chunks in the index."""
+        filenames = set()
+        if self.index_mode == "unified":
+            collection = self._get_unified_collection()
+            # Page through metadata to keep memory flat for large libraries
+            page_size = 10000
+            offset = 0
+            while True:
+                page = await asyncio.to_thread(
+                    collection.get,
+                    include=["metadatas"],
+                    limit=page_size,
+                    offset=offset
+                )
+                filenames.update(m.get("filename") for m in page["metadatas"] if m and m.get("filename"))
+                if len(page["ids"]) < page_size:
+                    break
+                offset += page_size
+        else:
+            for c in self.client.list_collections():
+                if c.name == self.unified_collection_name:
+                    continue
+                page = await asyncio.to_thread(c.get, include=["metadatas"], limit=1)
+                filenames.update(m.get("filename") for m in page["metadatas"] if m and m.get("filename"))
+        return filenames
+
+    async def backfill_lexical_index(self) -> int:
+        """Add documents indexed before the keyword index existed to it; returns how many were added."""
+        if self.retrieval_mode != "hybrid":
+            return 0
+        indexed = await asyncio.to_thread(lexical_index.document_ids)
+        missing = [filename for filename in await self.list_documents() if self.document_id(filename) not in indexed]
+        for filename in missing:
+            doc_id = self.document_id(filename)
+            if self.index_mode == "unified":
+                sources = [(self._get_unified_collection(), {"doc_id": doc_id})]
+            else:
+                sources = [(self.client.get_collection(name), None) for name in self._matching_collections(filename)]
+            for collection, where in sources:
+                page_size = 1000
+                offset = 0
+                while True:
+                    page = await asyncio.to_thread(
+                        collection.get,
+                        where=where,
+                        include=["documents", "metadatas"],
+                        limit=page_size,
+                        offset=offset
+                    )
+                    metadata = [dict(m or {}, doc_id=doc_id) for m in page["metadatas"]]
+                    await asyncio.to_thread(lexical_index.add, page["ids"], page["documents"], metadata)
+                    if len(page["ids"]) < page_size:
+                        break
+                    offset += page_size
+            logger.info(f"Added {filename} to the keyword index")
+        return len(missing)
+
+    async def has_any_document(self, filenames: List[str]) -> bool:
+        """Check whether at least one of the files is indexed."""
+        with tracer.span("vector_store.has_document", documents=len(filenames)):
+            checks = await asyncio.gather(*(self.has_document(filename) for filename in filenames))
+        return any(checks)
+
+    async def has_document(self, filename: str) -> bool:
+        """Check whether any chunks of a file are indexed."""
+        if self.index_mode == "unified":
+            collection = self._get_unified_collection()
+            found = await asyncio.to_thread(
+                collection.get,
+                where={"doc_id": self.document_id(filename)},
+                limit=1,
+                include=[]
+            )
+            return bool(found["ids"])
+        return bool(self._matching_collections(filename))
+
     def get_collection_name(self, base_name: str, language: str = 'en') -> str:
         """Get language-specific collection name."""
         # First sanitize the base name
@@ -47,11 +226,41 @@ class VectorStore:
         return f"{sanitized_base}_{language}"
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    async def add_texts(self, collection_name: str, texts: List[str], metadata: List[Dict[str, Any]] | None = None) -> None:
-        """Add texts to the vector store."""
+    async def add_texts(
+        self,
+        collection_name: str,
+        texts: List[str],
+        metadata: List[Dict[str, Any]] | None = None,
+        progress_callback: Optional[Callable[[str, float], None]] = None,
+        embeddings: Optional[List[List[float]]] = None,
+        replace: bool = True,
+        start_index: int = 0
+    ) -> List[List[float]]:
+        """Add texts to the vector store.
+
+        Embedding and indexing are blocking calls, so each batch runs in a
+        worker thread. ``progress_callback(stage, fraction)`` is called with
+        the "embed" and "index" stages as batches complete.
+
+        Precomputed ``embeddings`` (aligned with ``texts``) skip the embedding
+        step. Returns the embeddings aligned with ``texts``; texts that were
+        skipped as empty get an empty list.
+
+        With ``replace`` the file's existing chunks are removed first. Documents
+        indexed in several windows pass ``replace=False`` after the first one,
+        with ``start_index`` set to the number of chunks already sent.
+        """
+        def report(stage: str, fraction: float) -> None:
+            if progress_callback:
+                progress_callback(stage, fraction)
+
         try:
-            # Count total tokens for embeddings
-            total_tokens = sum(self.count_tokens(text) for text in texts)
+            # Token counts pack embedding batches; the chunker already computed them
+            token_counts = [
+                (metadata[i].get("token_count") if metadata else None) or self.count_tokens(text)
+                for i, text in enumerate(texts)
+            ]
+            total_tokens = sum(token_counts)
             
             # Log embedding token usage
             logger.info(f"Adding {len(texts)} texts to collection {collection_name} ({total_tokens} tokens)")
@@ -60,21 +269,28 @@ class VectorStore:
             language = metadata[0].get('language', 'en') if metadata and metadata[0] else 'en'
             logger.info(f"Using language: {language} for collection")
             
-            # Get language-specific collection name
-            collection_name = self.get_collection_name(collection_name, language)
+            filename = collection_name
+            doc_id = self.document_id(filename)
+            if replace:
+                # Re-uploading a file replaces its previous chunks
+                await self.delete_collection(filename)
+            if self.index_mode == "unified":
+                collection = self._get_unified_collection()
+                collection_name = self.unified_collection_name
+            else:
+                # Get language-specific collection name
+                collection_name = self.get_collection_name(collection_name, language)
+                collection = self.client.get_or_create_collection(
+                    name=collection_name,
+                    embedding_function=self.embedding_function
+                )
             logger.info(f"Using collection: {collection_name} for language: {language}")
             
-            # Get or create collection
-            collection = self.client.get_or_create_collection(
-                name=collection_name,
-                embedding_function=self.embedding_function
-            )
-            
             # Filter out empty texts but with a very low threshold
             valid_texts = [(i, text) for i, text in enumerate(texts) if text and len(text.strip()) > 10]
             if not valid_texts:
                 logger.warning("No valid texts to add")
-                return
+                return [[] for _ in texts]
             
             logger.info(f"Found {len(valid_texts)} valid chunks out of {len(texts)} total chunks")
             
@@ -91,119 +307,263 @@ class VectorStore:
                 metadata = [{"index": i, "language": language} for i in indices]
             else:
                 metadata = [dict(m, language=language) for m in [metadata[i] for i in indices]]
+            metadata = [dict(m, filename=filename, doc_id=doc_id) for m in metadata]
             
-            # Add documents in batches to avoid rate limits
+            total = len(filtered_texts)
+            if embeddings is not None:
+                logger.info(f"Using {total} precomputed embeddings for collection {collection_name}")
+                filtered_embeddings = [embeddings[i] for i in indices]
+            else:
+                # The scheduler paces requests to the API quota
+                report("embed", 0.0)
+                with tracer.span("embed_documents", texts=total):
+                    filtered_embeddings = await self.embed_documents(
+                        list(filtered_texts),
+                        token_counts=[token_counts[i] for i in indices],
+                        progress_callback=lambda fraction: report("embed", fraction)
+                    )
+
+            # Index the embeddings in batches to keep each Chroma write small
+            ids = [f"{doc_id}_{start_index + j}" for j in indices]
             batch_size = 100
-            for i in range(0, len(filtered_texts), batch_size):
-                batch_texts = filtered_texts[i:i + batch_size]
-                batch_metadata = metadata[i:i + batch_size]
-                batch_ids = [f"doc_{j}" for j in range(i, i + len(batch_texts))]
-                
-                # Add batch to collection
-                collection.add(
-                    documents=list(batch_texts),
-                    metadatas=batch_metadata,
-                    ids=batch_ids
-                )
-                
-                logger.info(f"Added batch {i//batch_size + 1} to collection {collection_name}")
-                
-                # Sleep briefly between batches
-                if i + batch_size < len(filtered_texts):
-                    await asyncio.sleep(1)
+            with tracer.span("chroma.add", collection=collection_name, chunks=total):
+                for i in range(0, total, batch_size):
+                    report("index", i / total)
+                    await asyncio.to_thread(
+                        collection.add,
+                        documents=list(filtered_texts[i:i + batch_size]),
+                        embeddings=filtered_embeddings[i:i + batch_size],
+                        metadatas=metadata[i:i + batch_size],
+                        ids=ids[i:i + batch_size]
+                    )
+                    logger.info(f"Added batch {i//batch_size + 1} to collection {collection_name}")
+            # Keyword index over the same chunks, under the same ids
+            with tracer.span("lexical.add", chunks=total):
+                await asyncio.to_thread(lexical_index.add, ids, list(filtered_texts), metadata)
+            report("index", 1.0)
+
+            aligned_embeddings: List[List[float]] = [[] for _ in texts]
+            for i, embedding in zip(indices, filtered_embeddings):
+                aligned_embeddings[i] = list(embedding)
+            return aligned_embeddings
             
         except Exception as e:
             logger.error(f"Error adding texts to vector store: {str(e)}")
             raise
 
     @retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=1, min=4, max=10))
-    async def similarity_search(self, collection_name: str, query: str, k: int = 5, language: str = None) -> List[Dict[str, Any]]:
-        """Search for similar texts in the vector store."""
+    async def similarity_search(
+        self,
+        collection_name: str,
+        query: str,
+        k: int = 5,
+        language: str = None,
+        page_range: Optional[Tuple[int, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Search for similar texts in the vector store.
+
+        ``page_range`` is an inclusive (first, last) page range; only chunks
+        overlapping it are searched.
+        """
+        return await self.similarity_search_documents([collection_name], query, k, language, page_range)
+
+    async def similarity_search_documents(
+        self,
+        filenames: List[str],
+        query: str,
+        k: int = 5,
+        language: str = None,
+        page_range: Optional[Tuple[int, int]] = None
+    ) -> List[Dict[str, Any]]:
+        """Search several documents at once and return the global top k.
+
+        In unified mode this is a single filtered ANN query. In per-file mode
+        the collections are queried concurrently and merged. Every result
+        gets a "similarity" in (0, 1] derived from its distance so scores
+        from different documents can be compared and thresholded.
+
+        In hybrid mode the vector results are fused with BM25 keyword
+        results by reciprocal rank; "similarity" is then the fused score
+        scaled to (0, 1].
+        """
+        with tracer.span("vector_store.search", documents=len(filenames), k=k, mode=self.retrieval_mode) as span:
+            results = await self._search_documents(filenames, query, k, language, page_range)
+            span.set(results=len(results))
+        return results
+
+    async def _search_documents(
+        self,
+        filenames: List[str],
+        query: str,
+        k: int,
+        language: Optional[str],
+        page_range: Optional[Tuple[int, int]]
+    ) -> List[Dict[str, Any]]:
+        """Implementation of similarity_search_documents."""
         try:
-            # Count query tokens for embeddings
-            query_tokens = self.count_tokens(query)
-            
             # Log search
-            logger.info(f"Searching collection {collection_name} for: {query[:50]}...")
-            
-            # Get base collection name without language suffix
-            base_name = self._sanitize_collection_name(collection_name)
-            logger.info(f"Base collection name: {base_name}")
-            
-            # List all collections
-            all_collections = self.client.list_collections()
-            logger.info(f"Available collections: {[c.name for c in all_collections]}")
-            
-            # If language is specified, search only that collection
-            if language:
-                collection_names = [self.get_collection_name(collection_name, language)]
-                logger.info(f"Searching language-specific collection: {collection_names}")
+            logger.info(f"Searching {len(filenames)} documents for: {query[:50]}...")
+
+            hybrid = self.retrieval_mode == "hybrid"
+            lexical_results: List[Dict[str, Any]] = []
+            if hybrid:
+                # Fetch deeper than k from both sides so fusion has candidates to promote
+                fetch_k = 2 * k
+                with tracer.span("lexical.search") as lexical_span:
+                    lexical_results = await asyncio.to_thread(
+                        lexical_index.search,
+                        query,
+                        [self.document_id(filename) for filename in filenames],
+                        fetch_k,
+                        language,
+                        page_range
+                    )
+                    lexical_span.set(results=len(lexical_results))
+                if self._answers_lexically(query, lexical_results):
+                    self.lexical_shortcuts += 1
+                    logger.info("Keyword query fully matched, skipping vector search")
+                    return self._fuse([lexical_results], k)
             else:
-                # Try to get all language variants of the collection
-                collection_names = [
-                    c.name for c in all_collections
-                    if c.name.startswith(base_name)
+                fetch_k = k
+
+            if self.index_mode == "unified":
+                collections = [self._get_unified_collection()]
+                doc_ids = [self.document_id(filename) for filename in filenames]
+                filters: List[Dict[str, Any]] = [
+                    {"doc_id": doc_ids[0]} if len(doc_ids) == 1 else {"doc_id": {"$in": doc_ids}}
                 ]
-                logger.info(f"Searching all language variants: {collection_names}")
-            
-            if not collection_names:
-                logger.error(f"No matching collections found for {base_name}")
-                return []
-            
+                if language:
+                    filters.append({"language": language})
+            else:
+                # If language is specified, search only that collection
+                if language:
+                    collection_names = [self.get_collection_name(filename, language) for filename in filenames]
+                else:
+                    collection_names = [name for filename in filenames for name in self._matching_collections(filename)]
+                logger.info(f"Searching collections: {collection_names}")
+                if not collection_names:
+                    logger.error(f"No matching collections found for {filenames}")
+                    return []
+                collections = [
+                    self.client.get_collection(name=name, embedding_function=self.embedding_function)
+                    for name in collection_names
+                ]
+                filters = []
+
+            if page_range:
+                # Chunks may span pages, so match any chunk overlapping the range
+                first_page, last_page = page_range
+                filters.extend([{"page_end": {"$gte": first_page}}, {"page_start": {"$lte": last_page}}])
+                logger.info(f"Restricting search to pages {first_page}-{last_page}")
+            where = None if not filters else filters[0] if len(filters) == 1 else {"$and": filters}
+
+            # Embed the query once and reuse the vector for every collection
+            query_embedding = await self.embed_query(query)
+
+            # Fan out across collections concurrently
+            searches = await asyncio.gather(
+                *(self._query_collection(collection, query_embedding, fetch_k, where) for collection in collections),
+                return_exceptions=True
+            )
             all_results = []
-            for coll_name in collection_names:
-                try:
-                    # Get collection
-                    collection = self.client.get_collection(
-                        name=coll_name,
-                        embedding_function=self.embedding_function
-                    )
-                    logger.info(f"Retrieved collection: {coll_name}")
-                    
-                    # Query the collection
-                    results = collection.query(
-                        query_texts=[query],
-                        n_results=k
-                    )
-                    
-                    # Format results
-                    if results and 'documents' in results and results['documents']:
-                        documents = results['documents'][0]
-                        metadatas = results['metadatas'][0] if results['metadatas'] else [{}] * len(documents)
-                        distances = results['distances'][0] if results['distances'] else [0.0] * len(documents)
-                        
-                        logger.info(f"Found {len(documents)} results in collection {coll_name}")
-                        
-                        for doc, meta, dist in zip(documents, metadatas, distances):
-                            if doc and len(doc.strip()) > 0:  # Only include non-empty results
-                                all_results.append({
-                                    "text": doc,
-                                    "metadata": meta,
-                                    "score": float(dist)
-                                })
-                                # Log a sample of each result
-                                sample = doc[:100] + "..." if len(doc) > 100 else doc
-                                logger.info(f"Result sample (score {dist}): {sample}")
-                    else:
-                        logger.warning(f"No results found in collection {coll_name}")
-                        
-                except Exception as e:
-                    logger.error(f"Error searching collection {coll_name}: {str(e)}")
+            for collection, found in zip(collections, searches):
+                if isinstance(found, Exception):
+                    logger.error(f"Error searching collection {collection.name}: {str(found)}")
                     continue
-            
+                all_results.extend(found)
+
             # Sort all results by score
             all_results.sort(key=lambda x: x["score"])
-            
-            # Return top k results
-            results = all_results[:k]
-            logger.info(f"Returning {len(results)} total results across {len(collection_names)} collections")
+
+            if hybrid:
+                with tracer.span("fuse"):
+                    results = self._fuse([all_results[:fetch_k], lexical_results], k)
+            else:
+                # Return top k results
+                results = all_results[:k]
+            logger.info(f"Returning {len(results)} total results across {len(collections)} collections")
             return results
-            
+
         except Exception as e:
             logger.error(f"Error searching vector store: {str(e)}")
             logger.error(f"Full traceback: {traceback.format_exc()}")
             return []
 
+    def _answers_lexically(self, query: str, lexical_results: List[Dict[str, Any]]) -> bool:
+        """Whether a short keyword query with an identifier is fully matched by the best keyword hit."""
+        if not lexical_results or lexical_results[0]["coverage"] < 1.0:
+            return False
+        terms = tokenize(query)
+        return len(terms) <= self.lexical_shortcut_max_terms and any(any(c.isdigit() for c in term) for term in terms)
+
+    def _fuse(self, rankings: List[List[Dict[str, Any]]], k: int) -> List[Dict[str, Any]]:
+        """Reciprocal-rank fusion of ranked result lists, top k first.
+
+        Each result's "similarity" becomes its fused score divided by the best
+        possible one (first in every list) and "score" its complement, so
+        downstream sorting and merging keep working.
+        """
+        fused: Dict[str, Dict[str, Any]] = {}
+        for ranking in rankings:
+            for rank, result in enumerate(ranking):
+                key = result.get("id") or result["text"]
+                entry = fused.get(key)
+                if entry is None:
+                    entry = fused[key] = dict(result, rrf_score=0.0)
+                    if "similarity" in result:
+                        entry["dense_similarity"] = result["similarity"]
+                else:
+                    entry.update((field, value) for field, value in result.items() if field not in entry)
+                entry["rrf_score"] += 1.0 / (self.rrf_k + rank + 1)
+
+        best_score = len(rankings) / (self.rrf_k + 1)
+        results = sorted(fused.values(), key=lambda r: r["rrf_score"], reverse=True)[:k]
+        for result in results:
+            result["similarity"] = result["rrf_score"] / best_score
+            result["score"] = 1.0 - result["similarity"]
+        return results
+
+    async def _query_collection(
+        self,
+        collection,
+        query_embedding: List[float],
+        k: int,
+        where: Optional[Dict[str, Any]] = None
+    ) -> List[Dict[str, Any]]:
+        """Run one ANN query and format the results."""
+        with tracer.span("chroma.query", collection=collection.name, k=k):
+            results = await asyncio.to_thread(
+                collection.query,
+                query_embeddings=[query_embedding],
+                n_results=k,
+                where=where
+            )
+
+        formatted = []
+        if results and 'documents' in results and results['documents']:
+            documents = results['documents'][0]
+            metadatas = results['metadatas'][0] if results['metadatas'] else [{}] * len(documents)
+            distances = results['distances'][0] if results['distances'] else [0.0] * len(documents)
+            ids = results['ids'][0] if results.get('ids') else [None] * len(documents)
+
+            logger.info(f"Found {len(documents)} results in collection {collection.name}")
+
+            for chunk_id, doc, meta, dist in zip(ids, documents, metadatas, distances):
+                if doc and len(doc.strip()) > 0:  # Only include non-empty results
+                    formatted.append({
+                        "id": chunk_id,
+                        "text": doc,
+                        "metadata": meta,
+                        "score": float(dist),
+                        "similarity": 1.0 / (1.0 + float(dist))
+                    })
+                    # Log a sample of each result
+                    sample = doc[:100] + "..." if len(doc) > 100 else doc
+                    logger.info(f"Result sample (score {dist}): {sample}")
+        else:
+            logger.warning(f"No results found in collection {collection.name}")
+        return formatted
+
     def _sanitize_collection_name(self, name: str) -> str:
         """Sanitize collection name to meet ChromaDB requirements."""
         # Remove file extension and path
@@ -232,16 +592,17 @@ class VectorStore:
         return name.lower()  # Ensure consistent case
 
     async def delete_collection(self, collection_name: str) -> None:
-        """Delete a collection from the vector store."""
+        """Delete all indexed chunks of a file from the vector store."""
         try:
-            # Get all language variants of the collection
-            collection_names = [
-                name for name in self.client.list_collections()
-                if name.startswith(self._sanitize_collection_name(collection_name))
-            ]
-            
+            await asyncio.to_thread(lexical_index.delete_document, self.document_id(collection_name))
+            if self.index_mode == "unified":
+                collection = self._get_unified_collection()
+                await asyncio.to_thread(collection.delete, where={"doc_id": self.document_id(collection_name)})
+                logger.info(f"Chunks deleted for: {collection_name}")
+                return
+
             # Delete all language variants
-            for name in collection_names:
+            for name in self._matching_collections(collection_name):
                 self.client.delete_collection(name)
                 logger.info(f"Collection deleted: {name}")
             
@@ -288,5 +649,5 @@ class VectorStore:
             logger.error(f"Error in similarity search: {str(e)}")
             raise
 
-# Create a singleton instance
-vector_store = VectorStore() 
\ No newline at end of file
+# Create a singleton instance on first use, see app.utils.lazy
+vector_store: VectorStore = Lazy(VectorStore, "vector_store")
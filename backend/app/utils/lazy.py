@@ -0,0 +1,71 @@
+from typing import Any, Callable, Dict, Generic, List, Optional, TypeVar
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Every lazy singleton by name, in the order they were declared
+_registry: Dict[str, "Lazy"] = {}
+
+class Lazy(Generic[T]):
+    """Stands in for a module-level singleton that is created on first use.
+
+    Attribute access is forwarded to the instance, creating it (and
+    importing whatever its constructor needs) the first time. Services
+    whose constructors load heavy libraries or open clients are declared
+    this way so importing the app stays fast; the startup hook creates them
+    ahead of the first request (see ``warm_up``).
+    """
+
+    def __init__(self, factory: Callable[[], T], name: str):
+        # Own attributes are prefixed so they never shadow the instance's
+        object.__setattr__(self, "_lazy_factory", factory)
+        object.__setattr__(self, "_lazy_name", name)
+        object.__setattr__(self, "_lazy_instance", None)
+        object.__setattr__(self, "_lazy_lock", threading.RLock())
+        object.__setattr__(self, "_lazy_init_s", None)
+        _registry[name] = self
+
+    def _lazy_get(self) -> T:
+        instance = self._lazy_instance
+        if instance is None:
+            with self._lazy_lock:
+                instance = self._lazy_instance
+                if instance is None:
+                    start = time.perf_counter()
+                    instance = self._lazy_factory()
+                    elapsed = time.perf_counter() - start
+                    object.__setattr__(self, "_lazy_instance", instance)
+                    object.__setattr__(self, "_lazy_init_s", elapsed)
+                    logger.info(f"Created {self._lazy_name} in {elapsed * 1000:.0f} ms")
+        return instance
+
+    @property
+    def lazy_created(self) -> bool:
+        return self._lazy_instance is not None
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._lazy_get(), name)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        setattr(self._lazy_get(), name, value)
+
+    def __repr__(self) -> str:
+        state = "created" if self.lazy_created else "not created"
+        return f"<Lazy {self._lazy_name} ({state})>"
+
+def warm_up(names: Optional[List[str]] = None) -> None:
+    """Create the given lazy singletons (all by default), in declaration order."""
+    for name, singleton in list(_registry.items()):
+        if names is None or name in names:
+            singleton._lazy_get()
+
+def singleton_stats() -> Dict[str, Any]:
+    """Creation time of each lazy singleton, None for those not created yet."""
+    return {
+        name: round(singleton._lazy_init_s * 1000, 1) if singleton._lazy_init_s is not None else None
+        for name, singleton in _registry.items()
+    }
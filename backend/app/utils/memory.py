@@ -0,0 +1,11 @@
+import sys
+
+def peak_rss_mb() -> float | None:
+    """Peak resident set size of this process in MB, or None where unsupported (Windows)."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS reports bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
@@ -0,0 +1,129 @@
+from typing import Any, Dict, List, Optional, Tuple
+from importlib.machinery import ExtensionFileLoader, SourceFileLoader, SourcelessFileLoader
+import logging
+import os
+import sys
+import threading
+import time
+
+from app.utils.lazy import singleton_stats
+
+logger = logging.getLogger(__name__)
+
+# Loaders created per module, so their exec_module can be timed without affecting others
+TIMED_LOADERS = (SourceFileLoader, SourcelessFileLoader, ExtensionFileLoader)
+
+class ImportTimer:
+    """Meta path finder that times how long each module takes to execute.
+
+    It finds nothing itself: it asks the other finders for the module's
+    spec and wraps the loader's ``exec_module``. Each module gets its
+    cumulative time (including the modules it imports) and its self time;
+    self times add up to the total without counting anything twice.
+    """
+
+    def __init__(self):
+        # module -> (cumulative seconds, self seconds)
+        self.modules: Dict[str, Tuple[float, float]] = {}
+        self._local = threading.local()
+
+    def find_spec(self, fullname: str, path=None, target=None):
+        if getattr(self._local, "finding", False):
+            return None
+        self._local.finding = True
+        try:
+            for finder in sys.meta_path:
+                find_spec = getattr(finder, "find_spec", None)
+                if finder is self or find_spec is None:
+                    continue
+                spec = find_spec(fullname, path, target)
+                if spec is not None:
+                    break
+            else:
+                return None
+        finally:
+            self._local.finding = False
+
+        loader = spec.loader
+        if isinstance(loader, TIMED_LOADERS) and "exec_module" not in vars(loader):
+            loader.exec_module = self._timed(fullname, loader.exec_module)
+        return spec
+
+    def _timed(self, fullname: str, exec_module):
+        def exec_module_timed(module) -> None:
+            stack: List[float] = self._local.__dict__.setdefault("stack", [])
+            # Time spent in nested imports, subtracted to get the self time
+            stack.append(0.0)
+            start = time.perf_counter()
+            try:
+                exec_module(module)
+            finally:
+                elapsed = time.perf_counter() - start
+                nested = stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+                self.modules[fullname] = (elapsed, elapsed - nested)
+        return exec_module_timed
+
+class StartupProfile:
+    """How long the app took to become ready, and where that time went.
+
+    Covers module imports (per top-level package and the slowest modules),
+    lazy singleton creation and the startup phases marked along the way.
+    Lazily imported libraries show up once something first uses them.
+    """
+
+    def __init__(self):
+        self.enabled = os.getenv("STARTUP_PROFILE_IMPORTS", "true").lower() == "true"
+        self.timer = ImportTimer()
+        self.started_at = time.perf_counter()
+        # phase -> seconds since the profile started
+        self.phases: Dict[str, float] = {}
+
+    def install(self) -> None:
+        """Start timing imports; modules imported before this are not covered."""
+        self.started_at = time.perf_counter()
+        if self.enabled and self.timer not in sys.meta_path:
+            sys.meta_path.insert(0, self.timer)
+
+    def mark(self, phase: str) -> float:
+        """Record that a startup phase finished now, returning the seconds since start."""
+        elapsed = time.perf_counter() - self.started_at
+        self.phases[phase] = elapsed
+        return elapsed
+
+    def report(self, top: int = 15) -> Dict[str, Any]:
+        modules = dict(self.timer.modules)
+        packages: Dict[str, float] = {}
+        for name, (_, own) in modules.items():
+            package = name.split(".")[0]
+            packages[package] = packages.get(package, 0.0) + own
+        slowest = sorted(modules.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        return {
+            "import_profiling": self.enabled,
+            "phases_ms": {phase: round(seconds * 1000, 1) for phase, seconds in self.phases.items()},
+            "imports_ms": round(sum(own for _, own in modules.values()) * 1000, 1),
+            "modules_imported": len(modules),
+            "packages_ms": {
+                package: round(seconds * 1000, 1)
+                for package, seconds in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+            },
+            "slowest_modules_ms": {name: round(cumulative * 1000, 1) for name, (cumulative, _) in slowest},
+            "singletons_ms": singleton_stats()
+        }
+
+    def log_report(self, top: int = 10) -> None:
+        report = self.report(top)
+        phases = ", ".join(f"{phase} {ms:.0f} ms" for phase, ms in report["phases_ms"].items())
+        logger.info(f"Startup: {phases}")
+        if not self.enabled:
+            return
+        logger.info(f"Imported {report['modules_imported']} modules in {report['imports_ms']:.0f} ms")
+        for package, ms in report["packages_ms"].items():
+            logger.info(f"  {package:<24}{ms:>8.1f} ms")
+        created = {name: ms for name, ms in report["singletons_ms"].items() if ms is not None}
+        if created:
+            logger.info("Singletons: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in created.items()))
+
+# Create a singleton instance
+startup_profile = StartupProfile()
@@ -0,0 +1,56 @@
+"""Memory per session and CPU per turn of the conversation history.
+
+Run from the backend directory:
+
+    python -m benchmarks.conversation_bench --sessions 2000 --turns 20
+"""
+import argparse
+import time
+import tracemalloc
+
+from app.models.conversation import Conversation
+
+USER_TEXT = "Kan du sammanfatta vad dokumentet säger om leveransvillkoren och betalningsplanen?"
+ASSISTANT_TEXT = (
+    "Dokumentet beskriver att leverans sker inom 30 dagar efter beställning och att betalning "
+    "delas upp i tre delbetalningar. Den första betalas vid avtalets undertecknande. "
+) * 3
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=20)
+    parser.add_argument("--history-tokens", type=int, default=1000)
+    args = parser.parse_args()
+
+    # Warm up the tokenizer and language detector so they are not measured
+    Conversation().add_message("user", USER_TEXT)
+
+    tracemalloc.start()
+    baseline = tracemalloc.take_snapshot()
+    conversations = []
+    turn_seconds = 0.0
+    for i in range(args.sessions):
+        conversation = Conversation()
+        for turn in range(args.turns):
+            start = time.perf_counter()
+            # Unique text per session so caches do not hide the per-turn cost
+            conversation.add_message("user", f"{USER_TEXT} ({i}.{turn})")
+            conversation.recent(args.history_tokens)
+            conversation.add_message("assistant", f"{ASSISTANT_TEXT} ({i}.{turn})")
+            turn_seconds += time.perf_counter() - start
+        conversations.append(conversation)
+    snapshot = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+
+    allocated = sum(stat.size_diff for stat in snapshot.compare_to(baseline, "filename"))
+    turns = args.sessions * args.turns
+    messages = sum(len(conversation.messages) for conversation in conversations)
+    print(f"sessions:              {args.sessions}")
+    print(f"messages kept:         {messages} ({messages / args.sessions:.1f} per session)")
+    print(f"memory per session:    {allocated / args.sessions / 1024:.1f} KiB (tracemalloc)")
+    print(f"estimated per session: {sum(c.size_bytes() for c in conversations) / args.sessions / 1024:.1f} KiB (size_bytes)")
+    print(f"cpu per turn:          {turn_seconds / turns * 1e6:.0f} us (2 messages + history selection)")
+
+if __name__ == "__main__":
+    main()
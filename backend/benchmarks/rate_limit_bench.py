@@ -0,0 +1,105 @@
+"""Throughput per client under contention: token buckets versus one global fixed window.
+
+One greedy client floods the service while several regular clients send at
+a steady rate. Requests pass a per-client limiter, then the upstream limiter
+shared by everyone, like chat requests do. Run from the backend directory:
+
+    python -m benchmarks.rate_limit_bench --seconds 5 --backend memory
+"""
+import argparse
+import asyncio
+import statistics
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List
+
+from app.services.rate_limiter import MemoryBucketStore, SQLiteBucketStore, TokenBucketLimiter
+
+class FixedWindowCounter:
+    """The previous limiter: one counter for everybody, reset every window."""
+
+    def __init__(self, per_window: int, window_s: float):
+        self.per_window = per_window
+        self.window_s = window_s
+        self.count = 0
+        self.window_start = time.monotonic()
+
+    async def acquire(self, key: str = "global", cost: float = 1, max_wait: float = None) -> bool:
+        now = time.monotonic()
+        if now - self.window_start >= self.window_s:
+            self.count = 0
+            self.window_start = now
+        if self.count >= self.per_window:
+            return False
+        self.count += 1
+        return True
+
+async def run_client(name: str, rate: float, seconds: float, admit, results: Dict[str, Dict[str, List[float]]]) -> None:
+    """Send ``rate`` requests per second (open loop) for ``seconds``."""
+    tasks = []
+    start = time.monotonic()
+    for i in range(int(rate * seconds)):
+        await asyncio.sleep(max(0.0, start + i / rate - time.monotonic()))
+        tasks.append(asyncio.ensure_future(admit(name, results)))
+    await asyncio.gather(*tasks)
+
+def report(title: str, results: Dict[str, Dict[str, List[float]]], seconds: float) -> None:
+    print(f"\n{title}")
+    print(f"{'client':<10}{'sent':>7}{'granted':>9}{'rejected':>10}{'granted/s':>11}{'p50 wait ms':>13}{'p95 wait ms':>13}")
+    shares = []
+    for name, result in results.items():
+        waits = sorted(result["waits"])
+        granted = len(waits)
+        sent = granted + len(result["rejected"])
+        p50 = statistics.median(waits) * 1000 if waits else 0.0
+        p95 = waits[int(len(waits) * 0.95) - 1] * 1000 if waits else 0.0
+        print(f"{name:<10}{sent:>7}{granted:>9}{sent - granted:>10}{granted / seconds:>11.1f}{p50:>13.0f}{p95:>13.0f}")
+        if name != "greedy":
+            shares.append(granted / sent if sent else 0.0)
+    # Jain's fairness index over the regular clients' success rates, 1.0 is perfectly fair
+    fairness = sum(shares) ** 2 / (len(shares) * sum(s * s for s in shares)) if any(shares) else 0.0
+    print(f"regular clients served: {statistics.mean(shares):.0%}, fairness index {fairness:.3f}")
+
+async def simulate(per_client, upstream, args) -> Dict[str, Dict[str, List[float]]]:
+    results: Dict[str, Dict[str, List[float]]] = {}
+
+    async def admit(name: str, results) -> None:
+        result = results.setdefault(name, {"waits": [], "rejected": []})
+        start = time.monotonic()
+        if (per_client is None or await per_client.acquire(name)) and await upstream.acquire():
+            result["waits"].append(time.monotonic() - start)
+        else:
+            result["rejected"].append(time.monotonic() - start)
+
+    clients = [run_client("greedy", args.greedy_rate, args.seconds, admit, results)]
+    clients += [
+        run_client(f"client{i}", args.client_rate, args.seconds, admit, results)
+        for i in range(args.clients)
+    ]
+    await asyncio.gather(*clients)
+    return results
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--clients", type=int, default=5)
+    parser.add_argument("--client-rate", type=float, default=8, help="requests/s per regular client")
+    parser.add_argument("--greedy-rate", type=float, default=50, help="requests/s of the greedy client")
+    parser.add_argument("--per-client", type=float, default=10, help="requests/s allowed per client")
+    parser.add_argument("--upstream", type=float, default=60, help="requests/s allowed upstream")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    args = parser.parse_args()
+
+    old = FixedWindowCounter(per_window=int(args.upstream), window_s=1.0)
+    report("Global fixed window (previous)", await simulate(None, old, args), args.seconds)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteBucketStore(Path(tmp) / "rate_limits.db") if args.backend == "sqlite" else MemoryBucketStore()
+        # One second worth of burst
+        per_client = TokenBucketLimiter("clients", store, per_minute=args.per_client * 60, burst=args.per_client, max_wait=0.5)
+        upstream = TokenBucketLimiter("upstream", store, per_minute=args.upstream * 60, burst=args.upstream, max_wait=2)
+        report(f"Token buckets per client + upstream ({args.backend})", await simulate(per_client, upstream, args), args.seconds)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,96 @@
+import pytest
+
+from app.services.context_packer import ContextPacker, TOKENS_FOR_REPLY, TOKENS_PER_MESSAGE
+
+DOCUMENT = "aaaa bbbb cccc dddd eeee ffff gggg hhhh iiii jjjj"
+
+class WhitespaceTokenizer:
+    def encode_ordinary(self, text):
+        return text.split()
+
+def chunk(start, end, similarity=0.5, doc_id="doc"):
+    return {
+        "text": DOCUMENT[start:end],
+        "metadata": {"doc_id": doc_id, "char_start": start, "char_end": end},
+        "similarity": similarity
+    }
+
+@pytest.fixture
+def packer():
+    return ContextPacker(WhitespaceTokenizer(), max_tokens=100, max_history_tokens=20)
+
+def trim(packer, candidate, *packed):
+    return packer._without_overlap(candidate, {"doc": list(packed)}, set())
+
+def assert_offsets_match(result):
+    metadata = result["metadata"]
+    assert DOCUMENT[metadata["char_start"]:metadata["char_end"]] == result["text"]
+
+def test_chunk_inside_a_packed_span_is_dropped(packer):
+    assert trim(packer, chunk(5, 19), (0, 24)) is None
+
+def test_chunk_without_overlap_is_unchanged(packer):
+    candidate = chunk(25, 39)
+    assert trim(packer, candidate, (0, 24)) is candidate
+    assert trim(packer, chunk(0, 24, doc_id="other"), (0, 24))["text"] == DOCUMENT[0:24]
+
+@pytest.mark.parametrize("packed, expected", [
+    ((10, 49), "aaaa bbbb"),        # Overlap at the end: keep the head
+    ((0, 15), "dddd eeee ffff gggg hhhh iiii jjjj"),  # Overlap at the start: keep the tail
+    ((5, 15), "dddd eeee ffff gggg hhhh iiii jjjj"),  # Packed span inside, larger side after it
+    ((30, 40), "aaaa bbbb cccc dddd eeee ffff"),      # Packed span inside, larger side before it
+])
+def test_overlap_is_trimmed_at_word_boundaries(packer, packed, expected):
+    result = trim(packer, chunk(0, 49), packed)
+    assert result["text"] == expected
+    assert_offsets_match(result)
+    assert "token_count" not in result["metadata"]
+
+def test_trimmed_offsets_follow_the_stripped_text(packer):
+    # The cut before the packed span leaves a trailing space that is stripped
+    result = trim(packer, chunk(0, 29), (12, 29))
+    assert result["text"] == "aaaa bbbb"
+    assert (result["metadata"]["char_start"], result["metadata"]["char_end"]) == (0, 9)
+
+def test_chunks_without_offsets_only_skip_exact_repeats(packer):
+    candidate = {"text": " some text ", "metadata": {}}
+    assert packer._without_overlap(candidate, {}, {"some text"}) is None
+    assert packer._without_overlap(candidate, {}, {"other text"}) is candidate
+
+def test_pack_keeps_newest_history_within_its_cap(packer):
+    history = [{"role": "user", "content": " ".join(["word"] * 8)} for _ in range(3)]
+    history.append({"role": "user", "content": "question"})
+
+    result = packer.pack([{"role": "system", "content": "be brief"}], history, [], "Context:")
+
+    # Each earlier message costs 8 + 3 tokens, so only the newest fits in 20
+    assert result["history_messages"] == 1
+    assert result["messages"][-1]["content"] == "question"
+    expected = TOKENS_FOR_REPLY + (TOKENS_PER_MESSAGE + 2) + (TOKENS_PER_MESSAGE + 1) + (TOKENS_PER_MESSAGE + 8)
+    assert result["prompt_tokens"] == expected
+
+def test_pack_orders_chunks_by_relevance_and_trims_overlap(packer):
+    chunks = [
+        chunk(0, 24, similarity=0.2),
+        chunk(15, 39, similarity=0.9),
+        dict(chunk(40, 49, similarity=0.1), rerank_score=1.0),
+    ]
+    result = packer.pack([], [{"role": "user", "content": "q"}], chunks, "Context:\n")
+
+    assert result["chunks"] == 3
+    context = result["messages"][0]["content"]
+    assert context == "Context:\n" + "\n\n".join([
+        DOCUMENT[40:49],      # Reranked first
+        DOCUMENT[15:39],      # Then by similarity
+        "aaaa bbbb cccc",     # Trimmed to what the second chunk did not cover
+    ])
+
+def test_pack_stays_within_the_token_budget():
+    packer = ContextPacker(WhitespaceTokenizer(), max_tokens=30, max_history_tokens=10)
+    chunks = [chunk(0, 49, similarity=0.9, doc_id=f"doc{i}") for i in range(5)]
+
+    result = packer.pack([], [{"role": "user", "content": "q"}], chunks, "Context:")
+
+    assert result["prompt_tokens"] <= 30
+    assert result["chunks"] == 1
+    assert result["dropped_chunks"] == 4
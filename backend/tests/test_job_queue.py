@@ -0,0 +1,174 @@
+import asyncio
+from contextlib import contextmanager
+
+import pytest
+
+import app.services.job_queue as job_queue_module
+from app.services.job_queue import JobQueue, QueueFullError
+
+class FakeVectorStore:
+    def __init__(self):
+        self.writes = []
+
+    async def add_texts(self, collection_name, texts, metadata, replace=True, start_index=0, **kwargs):
+        self.writes.append((collection_name, list(texts), replace))
+        await asyncio.sleep(0)
+        return [[1.0, 0.0]] * len(texts)
+
+class FakePdfProcessor:
+    """Indexes three windows per file; a held file stops before its second window until released."""
+
+    def __init__(self):
+        self.runs = {}
+        self.held = {}
+
+    def hold(self, filename):
+        self.held[filename] = asyncio.Event()
+        return self.held[filename]
+
+    async def process_pdf_streaming(self, filename, on_window, progress_callback=None):
+        run = self.runs[filename] = self.runs.get(filename, 0) + 1
+        for i in range(3):
+            if i == 1 and filename in self.held:
+                await self.held[filename].wait()
+            await on_window({
+                "chunks": [f"{filename}:{run}:{i}"],
+                "chunk_metadata": [{}],
+                "pages": [(i + 1, "text")],
+                "pages_done": i + 1,
+                "total_pages": 3
+            })
+        return {"metadata": {}, "summary": ""}
+
+class FakeUsageControl:
+    @contextmanager
+    def track(self, kind, documents):
+        yield None
+
+@pytest.fixture
+def fakes(monkeypatch):
+    vector_store, pdf_processor = FakeVectorStore(), FakePdfProcessor()
+    monkeypatch.setattr(job_queue_module, "vector_store", vector_store)
+    monkeypatch.setattr(job_queue_module, "pdf_processor", pdf_processor)
+    monkeypatch.setattr(job_queue_module, "usage_control", FakeUsageControl())
+    return vector_store, pdf_processor
+
+async def until(condition, steps=1000):
+    for _ in range(steps):
+        if condition():
+            return
+        await asyncio.sleep(0)
+    raise AssertionError("condition not reached")
+
+def test_job_completes_and_indexes_every_window(fakes):
+    vector_store, _ = fakes
+
+    async def scenario():
+        queue = JobQueue()
+        job = queue.submit("a.pdf")
+        await until(lambda: job.is_finished)
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == "completed"
+    assert job.progress == 100.0
+    assert [texts for _, texts, _ in vector_store.writes] == [["a.pdf:1:0"], ["a.pdf:1:1"], ["a.pdf:1:2"]]
+    assert [replace for _, _, replace in vector_store.writes] == [True, False, False]
+
+def test_reupload_supersedes_running_job(fakes):
+    vector_store, pdf_processor = fakes
+
+    async def scenario():
+        queue = JobQueue()
+        release = pdf_processor.hold("a.pdf")
+        first = queue.submit("a.pdf")
+        await until(lambda: len(vector_store.writes) == 1)
+        second = queue.submit("a.pdf")
+        release.set()
+        await until(lambda: second.is_finished)
+        return queue, first, second
+
+    queue, first, second = asyncio.run(scenario())
+    assert first.status == "cancelled"
+    assert second.status == "completed"
+    # The first job stopped before its next write; the second replaced everything it wrote
+    texts = [texts[0] for _, texts, _ in vector_store.writes]
+    assert texts == ["a.pdf:1:0", "a.pdf:2:0", "a.pdf:2:1", "a.pdf:2:2"]
+    assert vector_store.writes[1][2] is True
+    assert queue._active == {}
+
+def test_cancel_stops_running_job(fakes):
+    vector_store, pdf_processor = fakes
+
+    async def scenario():
+        queue = JobQueue()
+        release = pdf_processor.hold("a.pdf")
+        job = queue.submit("a.pdf")
+        await until(lambda: len(vector_store.writes) == 1)
+        cancelling = asyncio.create_task(queue.cancel("a.pdf"))
+        await asyncio.sleep(0)
+        release.set()
+        await cancelling
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == "cancelled"
+    assert len(vector_store.writes) == 1
+
+def test_cancel_does_not_wait_for_a_worker_slot(fakes):
+    vector_store, pdf_processor = fakes
+
+    async def scenario():
+        queue = JobQueue()
+        queue.max_concurrent_jobs = 1
+        release = pdf_processor.hold("busy.pdf")
+        busy = queue.submit("busy.pdf")
+        await until(lambda: busy.status == "running")
+        queued = queue.submit("a.pdf")
+        await asyncio.sleep(0)
+        # Would hang if it waited for busy.pdf to give up its slot
+        await asyncio.wait_for(queue.cancel("a.pdf"), timeout=1)
+        busy_status = busy.status
+        release.set()
+        await until(lambda: busy.is_finished)
+        return busy_status, queued
+
+    busy_status, queued = asyncio.run(scenario())
+    assert queued.status == "cancelled"
+    assert queued.started_at is None
+    assert busy_status == "running"
+    assert all(collection == "busy.pdf" for collection, _, _ in vector_store.writes)
+
+def test_job_superseded_before_it_started_keeps_the_order(fakes):
+    vector_store, pdf_processor = fakes
+
+    async def scenario():
+        queue = JobQueue()
+        release = pdf_processor.hold("a.pdf")
+        first = queue.submit("a.pdf")
+        await until(lambda: len(vector_store.writes) == 1)
+        # The second job is superseded in the same step it was submitted, before it ever ran
+        second = queue.submit("a.pdf")
+        third = queue.submit("a.pdf")
+        release.set()
+        await until(lambda: third.is_finished)
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert (first.status, second.status, third.status) == ("cancelled", "cancelled", "completed")
+    # The third job only started once the first had stopped writing
+    texts = [texts[0] for _, texts, _ in vector_store.writes]
+    assert texts == ["a.pdf:1:0", "a.pdf:2:0", "a.pdf:2:1", "a.pdf:2:2"]
+
+def test_submit_rejects_when_queue_is_full(fakes):
+    async def scenario():
+        queue = JobQueue()
+        queue.max_queued_jobs = 1
+        queue.submit("a.pdf")
+        with pytest.raises(QueueFullError):
+            queue.submit("b.pdf")
+        # Startup reconciliation may go over the limit
+        queue.submit("c.pdf", enforce_limit=False)
+        await until(lambda: all(job.is_finished for job in queue.jobs.values()))
+
+    asyncio.run(scenario())
@@ -0,0 +1,102 @@
+import asyncio
+import math
+
+import pytest
+
+import app.services.rate_limiter as rate_limiter
+from app.services.rate_limiter import MemoryBucketStore, SQLiteBucketStore, TokenBucketLimiter, _take
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limiter.time, "monotonic", clock)
+    monkeypatch.setattr(rate_limiter.time, "time", clock)
+    return clock
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBucketStore()
+    return SQLiteBucketStore(tmp_path / "rate_limits.db")
+
+def test_take_refills_up_to_capacity():
+    assert _take(tokens=5, elapsed=0, cost=2, capacity=10, rate=1, max_wait=0) == (3, 0.0)
+    assert _take(tokens=5, elapsed=100, cost=2, capacity=10, rate=1, max_wait=0) == (8, 0.0)
+
+def test_take_goes_into_debt_only_within_max_wait():
+    assert _take(tokens=1, elapsed=0, cost=3, capacity=10, rate=1, max_wait=5) == (-2, 2.0)
+    # Refused: nothing is taken
+    assert _take(tokens=1, elapsed=0, cost=3, capacity=10, rate=1, max_wait=1) == (1, None)
+
+def test_burst_then_refill(clock, store):
+    take = lambda: store.take("client", 1, capacity=3, rate=1.0, max_wait=0)
+
+    assert [take() for _ in range(4)] == [0.0, 0.0, 0.0, None]
+    clock.now += 1.0
+    assert [take(), take()] == [0.0, None]
+    clock.now += 10.0
+    assert [take() for _ in range(4)] == [0.0, 0.0, 0.0, None]
+
+def test_waiting_callers_are_served_in_arrival_order(clock, store):
+    waits = [store.take("client", 1, capacity=1, rate=2.0, max_wait=2) for _ in range(5)]
+
+    assert waits == [0.0, 0.5, 1.0, 1.5, 2.0]
+    assert store.take("client", 1, capacity=1, rate=2.0, max_wait=2) is None
+
+def test_buckets_are_kept_per_key(clock, store):
+    assert store.take("a", 1, capacity=1, rate=1.0, max_wait=0) == 0.0
+    assert store.take("a", 1, capacity=1, rate=1.0, max_wait=0) is None
+    assert store.take("b", 1, capacity=1, rate=1.0, max_wait=0) == 0.0
+
+def test_memory_store_prunes_full_buckets(clock):
+    store = MemoryBucketStore(max_buckets=2)
+    for key in ("a", "b", "c"):
+        store.take(key, 1, capacity=1, rate=1.0, max_wait=0)
+    clock.now += 5.0
+    store.take("d", 1, capacity=1, rate=1.0, max_wait=0)
+
+    assert set(store._buckets) == {"d"}
+
+def test_limiter_waits_then_refuses():
+    # 600 per minute: one token every 0.1 s
+    limiter = TokenBucketLimiter("test", MemoryBucketStore(), per_minute=600, burst=1, max_wait=0.15)
+
+    async def scenario():
+        return await asyncio.gather(*(limiter.acquire("client") for _ in range(3)))
+
+    # The second waits 0.1 s for the next token, the third would wait 0.2 s
+    assert asyncio.run(scenario()) == [True, True, False]
+    stats = limiter.stats()
+    assert (stats["granted"], stats["delayed"], stats["rejected"]) == (2, 1, 1)
+    assert stats["avg_wait_s"] == pytest.approx(0.1, abs=0.02)
+
+def test_limiter_caps_cost_at_the_bucket_size():
+    limiter = TokenBucketLimiter("tokens", MemoryBucketStore(), per_minute=100, max_wait=0)
+
+    async def scenario():
+        return await limiter.acquire(cost=1_000_000)
+
+    # Larger than the whole bucket, but allowed once it is full
+    assert asyncio.run(scenario()) is True
+
+def test_limiter_without_max_wait_always_waits(monkeypatch):
+    waits = []
+
+    async def sleep(seconds):
+        waits.append(seconds)
+
+    monkeypatch.setattr(rate_limiter.asyncio, "sleep", sleep)
+    limiter = TokenBucketLimiter("embeddings", MemoryBucketStore(), per_minute=60, burst=1, max_wait=math.inf)
+
+    async def scenario():
+        return [await limiter.acquire() for _ in range(3)]
+
+    assert asyncio.run(scenario()) == [True, True, True]
+    assert waits == pytest.approx([1.0, 2.0], abs=0.01)
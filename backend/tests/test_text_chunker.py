@@ -0,0 +1,96 @@
+import re
+
+import pytest
+
+from app.services.text_chunker import TokenChunker
+
+class WordTokenizer:
+    """One token per word with its leading whitespace, like cl100k_base attaches spaces.
+
+    With ``split_accents``, accented letters are encoded as two tokens that
+    start at the same character, like a character split across byte tokens.
+    """
+
+    def __init__(self, split_accents: bool = False):
+        self.split_accents = split_accents
+        self.pieces = []
+
+    def _token(self, piece: str) -> int:
+        self.pieces.append(piece)
+        return len(self.pieces) - 1
+
+    def encode_ordinary(self, text):
+        tokens = []
+        for match in re.finditer(r"\s*\S+|\s+", text):
+            piece = match.group()
+            if self.split_accents and "é" in piece:
+                head, _, tail = piece.partition("é")
+                if head:
+                    tokens.append(self._token(head))
+                tokens.extend([self._token(""), self._token("é")])
+                if tail:
+                    tokens.append(self._token(tail))
+            else:
+                tokens.append(self._token(piece))
+        return tokens
+
+    def decode_with_offsets(self, tokens):
+        text, offsets = "", []
+        for token in tokens:
+            offsets.append(len(text))
+            text += self.pieces[token]
+        return text, offsets
+
+def sentences(count: int) -> str:
+    return " ".join(f"Sentence {i} has five words." for i in range(count))
+
+def test_spans_match_the_text_and_stay_within_the_budget():
+    text = sentences(40)
+    spans = TokenChunker(WordTokenizer(), chunk_tokens=20, overlap_tokens=5).split(text)
+
+    assert spans[0][0] == 0
+    assert spans[-1][1] == len(text)
+    for start, end, token_count in spans:
+        chunk = text[start:end]
+        assert chunk == chunk.strip() and chunk
+        assert 0 < token_count <= 20
+        assert token_count == len(WordTokenizer().encode_ordinary(chunk))
+
+def test_consecutive_chunks_overlap_and_move_forward():
+    text = sentences(40)
+    spans = TokenChunker(WordTokenizer(), chunk_tokens=20, overlap_tokens=5).split(text)
+
+    assert len(spans) > 1
+    for (start, end, _), (next_start, next_end, _) in zip(spans, spans[1:]):
+        assert start < next_start < end < next_end
+
+def test_chunks_end_at_sentence_boundaries():
+    text = sentences(40)
+    spans = TokenChunker(WordTokenizer(), chunk_tokens=12, overlap_tokens=2).split(text)
+
+    assert all(text[start:end].endswith(".") for start, end, _ in spans)
+
+def test_paragraph_break_is_preferred_over_sentence_end():
+    text = "First paragraph is short.\n\nSecond paragraph. It has two sentences and then some more words"
+    spans = TokenChunker(WordTokenizer(), chunk_tokens=8, overlap_tokens=1).split(text)
+
+    assert text[spans[0][0]:spans[0][1]] == "First paragraph is short."
+
+def test_chunk_boundaries_never_split_a_character():
+    text = " ".join(["café"] * 30)
+    tokenizer = WordTokenizer(split_accents=True)
+    spans = TokenChunker(tokenizer, chunk_tokens=7, overlap_tokens=1).split(text)
+
+    assert spans[-1][1] == len(text)
+    for start, end, token_count in spans:
+        # A chunk starting or ending between the two tokens of "é" would count one token less
+        assert token_count == len(tokenizer.encode_ordinary(text[start:end]))
+        assert 0 < token_count <= 7
+
+def test_empty_text_has_no_chunks():
+    assert TokenChunker(WordTokenizer()).split("") == []
+    assert TokenChunker(WordTokenizer()).split("   \n ") == []
+
+def test_overlap_must_be_smaller_than_chunk():
+    with pytest.raises(ValueError):
+        TokenChunker(WordTokenizer(), chunk_tokens=10, overlap_tokens=10)
@@ -0,0 +1,49 @@
+import pytest
+
+from app.services.vector_store import VectorStore
+
+@pytest.fixture
+def store():
+    # _fuse only needs rrf_k; skip the constructor, which opens Chroma and OpenAI clients
+    store = VectorStore.__new__(VectorStore)
+    store.rrf_k = 60
+    return store
+
+def dense(*ids):
+    return [{"id": id, "text": f"text {id}", "similarity": 0.9 - i * 0.1} for i, id in enumerate(ids)]
+
+def lexical(*ids):
+    return [{"id": id, "text": f"text {id}", "bm25": 10.0 - i, "coverage": 1.0} for i, id in enumerate(ids)]
+
+def test_results_in_both_rankings_come_first(store):
+    results = store._fuse([dense("a", "b", "c"), lexical("c", "d", "b")], k=4)
+
+    assert [r["id"] for r in results] == ["c", "b", "a", "d"]
+    assert results[0]["rrf_score"] == pytest.approx(1 / 63 + 1 / 61)
+
+def test_first_in_every_ranking_has_similarity_one(store):
+    results = store._fuse([dense("a", "b"), lexical("a", "b")], k=2)
+
+    assert results[0]["similarity"] == pytest.approx(1.0)
+    assert results[0]["score"] == pytest.approx(0.0)
+    assert 0 < results[1]["similarity"] < 1
+    assert results[1]["score"] == pytest.approx(1 - results[1]["similarity"])
+
+def test_fields_from_both_rankings_are_kept(store):
+    result = store._fuse([dense("a"), lexical("a")], k=1)[0]
+
+    # The dense similarity is kept apart from the fused one, lexical fields are merged in
+    assert result["dense_similarity"] == pytest.approx(0.9)
+    assert result["bm25"] == 10.0 and result["coverage"] == 1.0
+
+def test_results_without_ids_are_matched_by_text(store):
+    rankings = [[{"text": "same"}, {"text": "dense only"}], [{"text": "same"}]]
+    results = store._fuse(rankings, k=5)
+
+    assert [r["text"] for r in results] == ["same", "dense only"]
+
+def test_only_top_k_are_returned(store):
+    results = store._fuse([dense("a", "b", "c", "d"), lexical("e", "f")], k=3)
+
+    assert len(results) == 3
+    assert [r["id"] for r in results] == ["a", "e", "b"]
@@ -4,6 +4,32 @@ import React, { useCallback, useState } from 'react';
 import { useDropzone } from 'react-dropzone';
 import { FiUploadCloud } from 'react-icons/fi';
 
+interface JobStatus {
+  job_id: string;
+  status: 'queued' | 'running' | 'completed' | 'failed' | 'cancelled';
+  stage: string;
+  progress: number;
+  error: string | null;
+  result: { summary?: string } | null;
+}
+
+const JOB_POLL_INTERVAL = 1000 // 1 second
+
+async function waitForJob(jobId: string, onProgress: (job: JobStatus) => void): Promise<JobStatus> {
+  while (true) {
+    const response = await fetch(`http://localhost:8000/api/jobs/${jobId}`);
+    if (!response.ok) {
+      throw new Error('Failed to get processing status');
+    }
+    const job: JobStatus = await response.json();
+    onProgress(job);
+    if (job.status === 'completed' || job.status === 'failed' || job.status === 'cancelled') {
+      return job;
+    }
+    await new Promise(resolve => setTimeout(resolve, JOB_POLL_INTERVAL));
+  }
+}
+
 interface FileUploadProps {
   onFileProcessed: (filename: string) => void;
   onSummaryReceived: (summary: string) => void;
@@ -19,6 +45,7 @@ export default function FileUpload({
 }: FileUploadProps) {
   const [error, setError] = useState<string | null>(null);
   const [uploading, setUploading] = useState(false);
+  const [processingStatus, setProcessingStatus] = useState<string | null>(null);
 
   const onDrop = useCallback(async (acceptedFiles: File[]) => {
     const file = acceptedFiles[0];
@@ -44,12 +71,25 @@ export default function FileUpload({
 
       const data = await response.json();
 
+      // Processing happens in the background, wait for the job to finish
+      const job = await waitForJob(data.job_id, (job) => {
+        setProcessingStatus(`Processing (${job.stage}, ${Math.round(job.progress)}%)...`);
+      });
+
+      if (job.status === 'failed') {
+        throw new Error(job.error || 'Processing failed');
+      }
+      if (job.status === 'cancelled') {
+        // The file was deleted or uploaded again while this upload was being processed
+        throw new Error('Processing was cancelled: the file was deleted or superseded by a newer upload');
+      }
+
       // Handle successful upload
       onFileProcessed(file.name);
 
       // If we have a summary, send it to the chat
-      if (data.summary) {
-        onSummaryReceived(data.summary);
+      if (job.result?.summary) {
+        onSummaryReceived(job.result.summary);
       }
 
       // Automatically select the uploaded file
@@ -62,6 +102,7 @@ export default function FileUpload({
       setError(err instanceof Error ? err.message : 'Upload failed');
     } finally {
       setUploading(false);
+      setProcessingStatus(null);
     }
   }, [onFileProcessed, onSummaryReceived, onUploadComplete, onChatFileSelect]);
 
@@ -92,7 +133,8 @@ export default function FileUpload({
           <FiUploadCloud className="h-6 w-6 text-gray-400 dark:text-gray-500" />
           <div className="text-left">
             <p className="text-sm text-gray-600 dark:text-gray-300">
-              {uploading ? 'Uploading...' :
+              {processingStatus ? processingStatus :
+                uploading ? 'Uploading...' :
                 isDragActive ? 'Drop the PDF here...' :
                   'Drop PDF here or click to upload'}
             </p>
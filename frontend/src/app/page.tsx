@@ -40,6 +40,16 @@ export default function Home() {
   const [splitPosition, setSplitPosition] = useState(50)
   const [isDragging, setIsDragging] = useState(false)
   const [chatFile, setChatFile] = useState<string | null>(null)
+  const sessionIdRef = useRef<string | null>(null)
+
+  // Conversation history is kept per session on the server
+  const getSessionId = () => {
+    if (!sessionIdRef.current) {
+      sessionIdRef.current = localStorage.getItem('chatSessionId') || uuidv4()
+      localStorage.setItem('chatSessionId', sessionIdRef.current)
+    }
+    return sessionIdRef.current
+  }
 
   useEffect(() => {
     // Add welcome messages sequence when component mounts
@@ -231,6 +241,7 @@ export default function Home() {
         body: JSON.stringify({
           message: inputMessage,
           filename: chatFile,
+          session_id: getSessionId(),
           shouldAllowGeneralChat: true,
           language: messageLanguage,
           context: {